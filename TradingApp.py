@@ -2,10 +2,6 @@ import streamlit as st
 import datetime
 import secrets
 from urllib.parse import urlencode
-import requests
-
-from google.oauth2 import id_token
-from google.auth.transport import requests as google_requests
 
 # Import your position management that references Firestore:
 from position_management import (
@@ -13,16 +9,15 @@ from position_management import (
     schedule_open_trade,
     close_trade,
     update_unrealized_pnl,
-    auto_open_scheduled_trades,
-    find_trade_by_id
+    auto_open_scheduled_trades
 )
-# Import your LLM critique function
-from llm_critique import get_critique_and_decision
-# For historical price or latest price
-from market_data import get_latest_price, get_historical_close_on_or_before
+# Heavy modules (llm_critique/openai, market_data/yfinance/pandas, google-auth, requests)
+# are imported inside the functions that need them, so the login page starts fast.
 
-# Import the new Firestore-based auth state logic:
+# OAuth state: HMAC-signed by default, or stored in the backend (OAUTH_STATE_MODE)
 from auth_state_db import store_oauth_state, verify_and_consume_oauth_state
+# Per-rerun timing of external calls + metrics export
+from tracing import span, start_rerun, rerun_summary, start_metrics_server, write_metrics_file
 
 ###########################################
 # [CHANGEME #1]: Environment Variables / Config
@@ -36,14 +31,44 @@ CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET", "")
 APP_DOMAIN = os.getenv("APP_DOMAIN", "")
 # Comma-separated list of allowed emails => turn into a set
 ALLOWED_EMAILS = set(os.getenv("ALLOWED_EMAILS", "").split(","))
+# Show the per-rerun timing panel (also available per session with ?dev=1)
+DEV_PANEL = os.getenv("DEV_PANEL", "").lower() in ("1", "true", "yes")
+CLOSED_PAGE_SIZES = (10, 25, 50, 100)
+BULK_CLOSE_SOURCES = ["Use Today's Close", "Close on Close Date", "User Entered"]
+# TradeFrame column => table header
+OPEN_POSITION_COLUMNS = {
+    "trade_id": "Trade ID",
+    "ticker": "Ticker",
+    "position_type": "Type",
+    "num_shares": "Shares",
+    "entry_date": "Entry Date",
+    "entry_price": "Entry Price",
+    # Missing values stay blank rather than showing a fake zero PnL
+    "unrealized_pnl_usd": "Unreal. PnL (USD)",
+    "unrealized_return_pct": "Unreal. Return (%)",
+    "mark_status": "Mark",
+    "mark_as_of": "Mark Date",
+}
+CLOSED_POSITION_COLUMNS = {
+    "trade_id": "Trade ID",
+    "ticker": "Ticker",
+    "position_type": "Type",
+    "num_shares": "Shares",
+    "entry_date": "Entry Date",
+    "entry_price": "Entry Price",
+    "close_date": "Close Date",
+    "close_price": "Close Price",
+    "pnl_usd": "PnL (USD)",
+    "return_pct": "Return (%)",
+}
 
 ################################################
-# Build Google OAuth URL (using Firestore state)
+# Build Google OAuth URL (with a signed or stored state)
 ################################################
 def build_google_oauth_url():
     scope = "openid email profile"
     redirect_uri = f"{APP_DOMAIN}?page=callback"
-    # Instead of st.session_state, we store state in Firestore:
+    # Instead of st.session_state, the state is signed (no database I/O) or stored:
     state = store_oauth_state()
 
     base_url = "https://accounts.google.com/o/oauth2/v2/auth"
@@ -52,7 +77,7 @@ def build_google_oauth_url():
         "redirect_uri": redirect_uri,
         "response_type": "code",
         "scope": scope,
-        "state": state,  # The Firestore doc ID
+        "state": state,  # Checked and consumed on callback
         "prompt": "consent",
         "access_type": "offline"
     }
@@ -63,6 +88,7 @@ def build_google_oauth_url():
 # Exchange Code & Verify ID Token
 ################################################
 def exchange_code_for_tokens(code):
+    from clients import get_http_session
     token_url = "https://oauth2.googleapis.com/token"
     redirect_uri = f"{APP_DOMAIN}?page=callback"
 
@@ -73,16 +99,22 @@ def exchange_code_for_tokens(code):
         "grant_type": "authorization_code",
         "redirect_uri": redirect_uri
     }
-    resp = requests.post(token_url, data=data)
+    with span("google_oauth", "token_exchange"):
+        # Pooled keep-alive session with default timeouts (clients.py)
+        resp = get_http_session().post(token_url, data=data)
     resp.raise_for_status()
     return resp.json()
 
 def verify_id_token_str(id_token_str):
-    idinfo = id_token.verify_oauth2_token(
-        id_token_str,
-        google_requests.Request(),
-        CLIENT_ID
-    )
+    from google.oauth2 import id_token
+    from clients import get_google_auth_request
+    with span("google_oauth", "verify_id_token"):
+        # Google's certs are cached per their max-age, so this is usually local-only
+        idinfo = id_token.verify_oauth2_token(
+            id_token_str,
+            get_google_auth_request(),
+            CLIENT_ID
+        )
     return idinfo
 
 
@@ -163,8 +195,19 @@ def show_login_screen():
 # Main Entry Point
 ################################################
 def main():
-    # Check if this is a callback
+    start_rerun()
+    start_metrics_server()
     query_params = st.experimental_get_query_params()
+    try:
+        _route(query_params)
+    finally:
+        write_metrics_file()
+    if DEV_PANEL or query_params.get("dev", [None])[0] == "1":
+        _render_dev_panel()
+
+
+def _route(query_params):
+    # Check if this is a callback
     page = query_params.get("page", [None])[0]
     if page == "callback":
         handle_google_callback(query_params)
@@ -185,26 +228,34 @@ def main():
     run_product_app()
 
 
+def _render_dev_panel():
+    summary = rerun_summary()
+    total_ms = sum(row["total_ms"] for row in summary)
+    with st.expander(f"Dev: external calls this rerun ({total_ms:.0f} ms)"):
+        if not summary:
+            st.write("No external calls.")
+            return
+        import pandas as pd
+        df = pd.DataFrame(summary)
+        df["total_ms"] = df["total_ms"].round(1)
+        df["max_ms"] = df["max_ms"].round(1)
+        st.dataframe(df, hide_index=True)
+
+
 ################################################
 # The Product Logic (Preserving All Features)
 ################################################
 def run_product_app():
-    # 1) Auto-open any scheduled trades
-    auto_open_scheduled_trades()
-
+    # 1) Scheduled trades are opened by the background worker (worker.py)
     st.title("Trading LLM Product - Full Firestore Integration")
+    _render_summary_header()
 
     # 2) LLM critique
-    user_idea = st.text_area("Enter your trade idea (type any idea you want):")
-    if st.button("Get Decision & Critique"):
-        from llm_critique import get_critique_and_decision
-        result = get_critique_and_decision(user_idea)
-        critique_text = result["critique"]
-        st.write("**Analyses and Decision**")
-        st.write(critique_text)
-
-        st.session_state["critique_text"] = critique_text
-        st.session_state["show_open_trade_form"] = True
+    critique_mode = st.radio("Critique mode", ["Single idea", "Watchlist batch"], horizontal=True)
+    if critique_mode == "Watchlist batch":
+        _render_batch_critique()
+    else:
+        _render_single_critique()
 
     # 3) If user wants to open a trade
     if st.session_state.get("show_open_trade_form", False):
@@ -270,11 +321,14 @@ def run_product_app():
 
     st.write("---")
 
-    # 4) Update PnL for all open positions each rerun
-    update_unrealized_pnl()
+    # 4) PnL for open positions is precomputed by the background worker (worker.py).
+    #    "Refresh now" recomputes only the signed-in user's trades.
+    st.subheader("User's Open Positions")
+    if st.button("Refresh now"):
+        auto_open_scheduled_trades(user_id=st.session_state["user_id"])
+        update_unrealized_pnl(user_id=st.session_state["user_id"])
 
     # 5) Display user open positions
-    st.subheader("User's Open Positions")
     _render_open_positions()
 
     st.write("---")
@@ -285,33 +339,81 @@ def run_product_app():
     st.subheader("User's Closed Positions")
     _render_closed_positions()
 
+    st.write("---")
+
+    # 7) Portfolio-level numbers over all opened trades
+    st.subheader("Portfolio Analytics")
+    _render_portfolio_analytics()
+
+
+def _render_summary_header():
+    # One summary document read, however long the trade history is
+    from position_management import get_cached_summary
+    summary = get_cached_summary(st.session_state["user_id"])
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Realized PnL (USD)", f"{summary['realized_pnl_usd']:,.2f}")
+    win_rate = summary["win_rate_pct"]
+    col2.metric("Win Rate", "-" if win_rate is None else f"{win_rate:.1f}%")
+    col3.metric("Open / Scheduled", f"{summary['open_count']} / {summary['scheduled_count']}")
+    col4.metric("Open Exposure (USD)", f"{summary['open_gross_cost_usd']:,.2f}")
+
+
+def _render_single_critique():
+    user_idea = st.text_area("Enter your trade idea (type any idea you want):")
+    force_refresh = st.checkbox("Force refresh (ignore cached critique)")
+    if st.button("Get Decision & Critique"):
+        from llm_critique import stream_critique_and_decision
+        st.write("**Analyses and Decision**")
+        # Render tokens as they arrive; the decision is parsed once the text is complete
+        critique_stream = stream_critique_and_decision(user_idea, force_refresh=force_refresh)
+        st.write_stream(critique_stream)
+        critique_text = critique_stream.result["critique"]
+
+        st.session_state["critique_text"] = critique_text
+        st.session_state["show_open_trade_form"] = True
+
+
+def _render_batch_critique():
+    ideas_text = st.text_area("Enter one trade idea per line:")
+    max_concurrency = st.number_input("Parallel requests", min_value=1, max_value=20, value=5)
+    force_refresh = st.checkbox("Force refresh (ignore cached critiques)")
+    if not st.button("Critique All"):
+        return
+
+    ideas = [line.strip() for line in ideas_text.splitlines() if line.strip()]
+    if not ideas:
+        st.warning("Enter at least one idea.")
+        return
+
+    import pandas as pd
+    from llm_critique import critique_many
+    rows = [{"Idea": idea, "Decision": "pending...", "Critique": ""} for idea in ideas]
+    table = st.empty()
+    table.dataframe(pd.DataFrame(rows))
+
+    def _on_result(index, result):
+        # Fill the table in as each answer completes
+        rows[index]["Decision"] = result["decision"]
+        rows[index]["Critique"] = result["critique"]
+        table.dataframe(pd.DataFrame(rows))
+
+    critique_many(ideas, max_concurrency=int(max_concurrency),
+                  force_refresh=force_refresh, on_result=_on_result)
+
 
 def _render_open_positions():
-    from position_management import get_user_open_positions
-    open_positions = get_user_open_positions(st.session_state["user_id"])
+    from position_management import get_cached_open_positions
+    open_positions = get_cached_open_positions(st.session_state["user_id"])
     if not open_positions:
         st.write("No open positions.")
         return
 
-    import pandas as pd
-    data_for_df = []
-    for pos in open_positions:
-        data_for_df.append({
-            "Trade ID": pos["trade_id"],
-            "Ticker": pos["ticker"],
-            "Type": pos["positionType"],
-            "Shares": pos["numShares"],
-            "Entry Date": pos["entryDate"],
-            "Entry Price": pos["entryPrice"],
-            "Unreal. PnL (USD)": pos.get("unrealized_pnl_usd", 0),
-            "Unreal. Return (%)": pos.get("unrealized_return_pct", 0),
-        })
-    df = pd.DataFrame(data_for_df)
-    df.index += 1
-    df.index.name = "Index"
-    st.dataframe(df)
+    # Built column-wise, so thousands of positions render without a per-row loop
+    from trade_frame import TradeFrame
+    frame = TradeFrame.from_docs(open_positions)
+    st.dataframe(frame.to_pandas(OPEN_POSITION_COLUMNS))
 
-    trade_id_to_close = st.selectbox("Select a Trade to Close", ["None"] + [p["trade_id"] for p in open_positions])
+    trade_id_to_close = st.selectbox("Select a Trade to Close", ["None"] + frame.trade_id.tolist())
     if trade_id_to_close != "None":
         close_option = st.selectbox("Close Price Source", ["User Entered", "Use Today's Close"])
         user_close_price = st.number_input("Manual Close Price", min_value=0.0, value=100.0)
@@ -319,13 +421,13 @@ def _render_open_positions():
         if st.button("Close Position"):
             from position_management import close_trade
             from market_data import get_latest_price
-            selected_pos = find_trade_by_id(trade_id_to_close, open_positions)
-            if not selected_pos:
+            selected = frame.index_of(trade_id_to_close)
+            if selected is None:
                 st.error("Trade not found in the open positions list.")
                 return
 
             if close_option == "Use Today's Close":
-                actual_close_price = get_latest_price(selected_pos["ticker"])
+                actual_close_price = get_latest_price(frame.ticker[selected])
             else:
                 actual_close_price = user_close_price
 
@@ -337,34 +439,165 @@ def _render_open_positions():
             st.success(f"Position {trade_id_to_close} closed at {actual_close_price}!")
             st.rerun()
 
+    _render_bulk_close(frame)
+
+
+def _render_bulk_close(frame):
+    # Outcome of the last bulk close, kept across the rerun that refreshes the tables
+    result = st.session_state.pop("bulk_close_result", None)
+    if result:
+        closed_count, errors = result
+        if closed_count:
+            st.success(f"Closed {closed_count} position(s).")
+        for trade_id, reason in errors.items():
+            st.warning(f"{trade_id} not closed: {reason}")
+
+    with st.expander("Close several positions"):
+        labels = {
+            trade_id: f"{ticker} {position_type} x{shares:g} ({trade_id})"
+            for trade_id, ticker, position_type, shares in zip(
+                frame.trade_id.tolist(), frame.ticker.tolist(), frame.position_type.tolist(), frame.num_shares.tolist()
+            )
+        }
+        selected = st.multiselect("Positions to close", list(labels), format_func=labels.get,
+                                  key="bulk_close_selected")
+        tickers = sorted(set(frame.ticker.tolist()))
+        all_for_ticker = st.selectbox("Also close every position in", ["None"] + tickers,
+                                      key="bulk_close_ticker")
+        trade_ids = list(selected)
+        if all_for_ticker != "None":
+            trade_ids += [t for t in frame.filter(frame.ticker == all_for_ticker).trade_id.tolist()
+                          if t not in selected]
+
+        source = st.selectbox("Close Price Source", BULK_CLOSE_SOURCES, key="bulk_close_source")
+        close_date = st.date_input("Close Date", datetime.date.today(), key="bulk_close_date")
+        if source == "User Entered":
+            # One price per ticker, shared by all of its selected positions
+            chosen = set(trade_ids)
+            chosen_tickers = sorted({t for i, t in zip(frame.trade_id.tolist(), frame.ticker.tolist()) if i in chosen})
+            price_source = {
+                t: st.number_input(f"{t} Close Price", min_value=0.0, value=100.0, key=f"bulk_close_price_{t}")
+                for t in chosen_tickers
+            }
+        else:
+            from position_management import PRICE_SOURCE_LATEST, PRICE_SOURCE_AS_OF
+            price_source = PRICE_SOURCE_LATEST if source == "Use Today's Close" else PRICE_SOURCE_AS_OF
+
+        if st.button(f"Close {len(trade_ids)} Position(s)", disabled=not trade_ids, key="bulk_close_button"):
+            from position_management import close_trades
+            closed, errors = close_trades(trade_ids, price_source, str(close_date))
+            st.session_state["bulk_close_result"] = (len(closed), errors)
+            for key in ("bulk_close_selected", "bulk_close_ticker"):
+                st.session_state.pop(key, None)
+            st.rerun()
+
 
 def _render_closed_positions():
-    from position_management import get_user_closed_positions
-    closed_positions = get_user_closed_positions(st.session_state["user_id"])
+    from position_management import get_cached_closed_page, get_cached_closed_totals
+    user_id = st.session_state["user_id"]
+
+    col_from, col_to, col_ticker, col_size = st.columns(4)
+    start = col_from.date_input("Closed from", value=None, key="closed_from")
+    end = col_to.date_input("Closed to", value=None, key="closed_to")
+    ticker = col_ticker.text_input("Ticker", key="closed_ticker").strip().upper()
+    page_size = col_size.selectbox("Per page", CLOSED_PAGE_SIZES, index=1, key="closed_page_size")
+    start_date = start.isoformat() if start else None
+    end_date = end.isoformat() if end else None
+
+    # Cursors of the pages visited so far; a filter change starts over at page 1
+    filters = (start_date, end_date, ticker, page_size)
+    if st.session_state.get("closed_filters") != filters:
+        st.session_state["closed_filters"] = filters
+        st.session_state["closed_cursors"] = [None]
+    cursors = st.session_state["closed_cursors"]
+
+    closed_positions, next_cursor = get_cached_closed_page(
+        user_id, page_size, cursors[-1], start_date=start_date, end_date=end_date, ticker=ticker or None
+    )
     if not closed_positions:
         st.write("No closed positions.")
         return
 
-    import pandas as pd
-    data_for_df = []
-    for pos in closed_positions:
-        data_for_df.append({
-            "Trade ID": pos["trade_id"],
-            "Ticker": pos["ticker"],
-            "Type": pos["positionType"],
-            "Shares": pos["numShares"],
-            "Entry Date": pos["entryDate"],
-            "Entry Price": pos["entryPrice"],
-            "Close Date": pos["closeDate"],
-            "Close Price": pos["closePrice"],
-            "PnL (USD)": pos.get("pnl_usd", 0),
-            "Return (%)": pos.get("return_pct", 0),
-        })
-    df = pd.DataFrame(data_for_df)
-    df.index += 1
-    df.index.name = "Index"
+    # Totals over every matching trade, not just this page
+    totals = get_cached_closed_totals(user_id, start_date=start_date, end_date=end_date, ticker=ticker or None)
+    col_count, col_pnl, col_return = st.columns(3)
+    col_count.metric("Closed trades", totals["count"])
+    col_pnl.metric("Total PnL (USD)", f"{totals['pnl_usd']:,.2f}")
+    col_return.metric("Avg return", "-" if totals["avg_return_pct"] is None else f"{totals['avg_return_pct']:.2f}%")
+
+    from trade_frame import TradeFrame
+    df = TradeFrame.from_docs(closed_positions).to_pandas(CLOSED_POSITION_COLUMNS)
+    df.index += (len(cursors) - 1) * page_size
     st.dataframe(df)
 
+    col_prev, col_page, col_next = st.columns([1, 2, 1])
+    if col_prev.button("Previous", disabled=len(cursors) == 1, key="closed_prev"):
+        cursors.pop()
+        st.rerun()
+    col_page.caption(f"Page {len(cursors)}")
+    if col_next.button("Next", disabled=next_cursor is None, key="closed_next"):
+        cursors.append(next_cursor)
+        st.rerun()
+
+
+def _compute_portfolio_analytics(user_id):
+    from position_management import get_cached_open_positions, get_all_closed_positions, get_positions_version
+    from portfolio_analytics import compute_portfolio, portfolio_start_date
+    from market_data import get_close_matrix
+    version = get_positions_version(user_id)
+    result = {"user_id": user_id, "version": version, "report": None, "errors": {}, "message": None}
+    trades = get_cached_open_positions(user_id) + get_all_closed_positions(user_id)
+    start_date = portfolio_start_date(trades)
+    if start_date is None:
+        result["message"] = "No trades to analyze yet."
+        return result
+
+    closes, result["errors"] = get_close_matrix({t["ticker"] for t in trades}, start_date)
+    if closes.empty:
+        result["message"] = "No price history available for these trades yet."
+        return result
+    result["report"] = compute_portfolio(trades, closes)
+    return result
+
+
+def _render_portfolio_analytics():
+    # Reads the whole trade history and its prices, so it only runs on request;
+    # the last result is kept for the session
+    from position_management import get_positions_version
+    user_id = st.session_state["user_id"]
+    result = st.session_state.get("portfolio_analytics")
+    if result is not None and result["user_id"] != user_id:
+        result = None
+    label = "Compute analytics" if result is None else "Recompute analytics"
+    if st.button(label, key="portfolio_analytics_button"):
+        with st.spinner("Computing portfolio analytics..."):
+            result = _compute_portfolio_analytics(user_id)
+        st.session_state["portfolio_analytics"] = result
+    if result is None:
+        st.caption("Equity curve, drawdown, volatility and exposure over your whole trade history.")
+        return
+    if result["version"] != get_positions_version(user_id):
+        st.caption("Positions changed since these numbers were computed.")
+    if result["report"] is None:
+        st.write(result["message"])
+        return
+    if result["errors"]:
+        st.caption("Missing price history: " + ", ".join(sorted(result["errors"])))
+    report = result["report"]
+
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Total PnL (USD)", f"{report.total_pnl:,.2f}")
+    col2.metric("Max Drawdown (%)", f"{report.max_drawdown_pct:.2f}")
+    col3.metric("Volatility (%, ann.)", f"{report.volatility_pct:.2f}")
+    col4.metric("Sharpe", f"{report.sharpe:.2f}")
+    st.caption(f"Returns are measured on {report.capital:,.0f} USD, the peak capital deployed.")
+
+    st.line_chart(report.equity)
+    st.line_chart({"Realized": report.realized_pnl, "Unrealized": report.unrealized_pnl})
+    if not report.exposure_by_ticker.empty:
+        st.write("Exposure by ticker (USD, last close)")
+        st.dataframe(report.exposure_by_ticker.round(2).rename(columns={"net": "Net", "gross": "Gross"}))
+
 
 if __name__ == "__main__":
     main()
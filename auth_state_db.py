@@ -1,51 +1,178 @@
-import secrets
-from google.cloud import firestore
+"""
+OAuth `state` values: issued when the login link is built, checked once on callback.
+
+Two modes, picked by OAUTH_STATE_MODE:
+  - "signed" (default): the state is `<issued_at>.<nonce>.<HMAC-SHA256>` signed with
+    OAUTH_STATE_SECRET (or a key derived from GOOGLE_CLIENT_SECRET), so issuing and
+    verifying it needs no database I/O.  Used nonces are remembered in-process until
+    they expire, so a state can't be replayed to this instance.
+  - "stored": a random state is written through the storage backend and deleted
+    when used.  Abandoned states are removed by purge_expired_oauth_states() (the
+    worker calls it every cycle) and, on Firestore, by a TTL policy on expiresAt.
+"""
+import datetime
+import hashlib
+import hmac
 import os
-from dotenv import load_dotenv
+import secrets
+import threading
+import time
+from typing import Dict
 
-load_dotenv()
-project_id = os.getenv("PROJECT_ID")
+# Stored through the configured storage backend (Firestore by default)
+from storage import get_backend
 
-db = firestore.Client(
-    project = project_id,
-    database = project_id
-)
+OAUTH_STATE_TTL_SECONDS = int(os.getenv("OAUTH_STATE_TTL_SECONDS", "600"))
+# Tolerated clock difference between the instance that issued a state and the one checking it
+CLOCK_SKEW_SECONDS = 60
 
-def store_oauth_state() -> str:
+def _state_mode() -> str:
+    # Read on use: TradingApp loads .env after importing this module
+    mode = os.getenv("OAUTH_STATE_MODE", "signed").lower()
+    if mode not in ("signed", "stored"):
+        raise ValueError(f"Unknown OAUTH_STATE_MODE: {mode}")
+    return mode
+
+
+#######################################################
+# Signed states
+#######################################################
+_secret = None
+_secret_lock = threading.Lock()
+
+def _signing_key() -> bytes:
+    global _secret
+    with _secret_lock:
+        if _secret is None:
+            configured = os.getenv("OAUTH_STATE_SECRET")
+            client_secret = os.getenv("GOOGLE_CLIENT_SECRET")
+            if configured:
+                _secret = configured.encode()
+            elif client_secret:
+                # Same on every instance, without reusing the client secret itself as the key
+                _secret = hmac.new(client_secret.encode(), b"lmtrading-oauth-state", hashlib.sha256).digest()
+            else:
+                print("[DEBUG auth_state_db] No OAUTH_STATE_SECRET or GOOGLE_CLIENT_SECRET; "
+                      "using a per-process key (states only verify on this instance)")
+                _secret = secrets.token_bytes(32)
+        return _secret
+
+def _sign(payload: str) -> str:
+    return hmac.new(_signing_key(), payload.encode(), hashlib.sha256).hexdigest()
+
+
+class _UsedNonces:
     """
-    Generate a random state, store it in Firestore with an optional expiration, and return the state.
+    Nonces of states already consumed, each kept until its state would have expired anyway.
     """
+    def __init__(self):
+        self._expires: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add(self, nonce: str, expires_at: float) -> bool:
+        """
+        Records nonce; False if it was already recorded (a replay).
+        """
+        now = time.time()
+        with self._lock:
+            for old in [n for n, exp in self._expires.items() if exp <= now]:
+                del self._expires[old]
+            if nonce in self._expires:
+                return False
+            self._expires[nonce] = expires_at
+            return True
+
+_used_nonces = _UsedNonces()
+
+def _issue_signed_state() -> str:
+    payload = f"{int(time.time())}.{secrets.token_urlsafe(16)}"
+    return f"{payload}.{_sign(payload)}"
+
+def _consume_signed_state(state: str) -> bool:
+    try:
+        issued_str, nonce, signature = state.split(".")
+        issued_at = int(issued_str)
+    except ValueError:
+        print("[DEBUG verify_and_consume_oauth_state] Malformed state => returning False")
+        return False
+    # Compared as bytes: the state comes from the callback URL and may hold any character
+    if not hmac.compare_digest(signature.encode(), _sign(f"{issued_str}.{nonce}").encode()):
+        print("[DEBUG verify_and_consume_oauth_state] Bad signature => returning False")
+        return False
+    now = time.time()
+    if issued_at > now + CLOCK_SKEW_SECONDS or now - issued_at > OAUTH_STATE_TTL_SECONDS:
+        print("[DEBUG verify_and_consume_oauth_state] State expired => returning False")
+        return False
+    if not _used_nonces.add(nonce, issued_at + OAUTH_STATE_TTL_SECONDS + CLOCK_SKEW_SECONDS):
+        print("[DEBUG verify_and_consume_oauth_state] State already used => returning False")
+        return False
+    return True
+
+
+#######################################################
+# Stored states
+#######################################################
+def _utcnow() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+def _issue_stored_state() -> str:
     state = secrets.token_hex(16)  # e.g. 32 hex chars
     print(f"[DEBUG store_oauth_state] Creating doc for state={state}")
-    doc_ref = db.collection("oauth_states").document(state)
     doc_data = {
-        "createdAt": firestore.SERVER_TIMESTAMP,
-        "expiresIn": 600  # store 10 minutes if you want a sense of expiration
+        "expiresIn": OAUTH_STATE_TTL_SECONDS,
+        # A timestamp, so a Firestore TTL policy on expiresAt can delete abandoned states
+        "expiresAt": _utcnow() + datetime.timedelta(seconds=OAUTH_STATE_TTL_SECONDS),
     }
-
-    doc_ref.set(doc_data)
+    get_backend().put_oauth_state(state, doc_data)
     return state
 
-def verify_and_consume_oauth_state(state: str) -> bool:
-    """
-    Check Firestore for a doc with ID = state. If it exists (and not expired),
-    delete it (so it can't be reused) and return True. Otherwise return False.
-    """
+def _consume_stored_state(state: str) -> bool:
     print(f"[DEBUG verify_and_consume_oauth_state] Checking doc: {state}")
-    doc_ref = db.collection("oauth_states").document(state)
-    snap = doc_ref.get()
-    if not snap.exists:
+    # Deleting on read consumes it, so it can't be reused
+    state_doc = get_backend().pop_oauth_state(state)
+    if state_doc is None:
         print("[DEBUG verify_and_consume_oauth_state] Doc not found => returning False")
         return False
 
-    # If you wanted to check actual expiration, you’d do so here:
-    # data = snap.to_dict()
-    # created_at = data.get("createdAt")
-    # expires_in = data.get("expiresIn", 600)
-    # ...some logic to compare timestamps...
+    expires_at = state_doc.get("expiresAt")
+    if isinstance(expires_at, str):
+        # SQLite keeps documents as JSON
+        expires_at = datetime.datetime.fromisoformat(expires_at)
+    # States stored before expiresAt existed are accepted (and purged by the worker)
+    if expires_at is not None and expires_at < _utcnow():
+        print("[DEBUG verify_and_consume_oauth_state] Doc expired => returning False")
+        return False
 
-    # For a simple approach, if doc exists => it's valid
-    # now consume it:
-    print("[DEBUG verify_and_consume_oauth_state] Doc found, deleting now...")
-    doc_ref.delete()
+    print("[DEBUG verify_and_consume_oauth_state] Doc found and consumed")
     return True
+
+
+#######################################################
+# Public API
+#######################################################
+def store_oauth_state() -> str:
+    """
+    Issue a new state for the login link (signed, or stored in the backend).
+    """
+    if _state_mode() == "signed":
+        return _issue_signed_state()
+    return _issue_stored_state()
+
+def verify_and_consume_oauth_state(state: str) -> bool:
+    """
+    True if state was issued by us, hasn't expired and hasn't been used before;
+    it can't be used again afterwards. Accepts states of either mode, so
+    switching OAUTH_STATE_MODE doesn't break logins already in flight.
+    """
+    if not state:
+        return False
+    if state.count(".") == 2:
+        return _consume_signed_state(state)
+    return _consume_stored_state(state)
+
+def purge_expired_oauth_states() -> int:
+    """
+    Deletes stored states older than OAUTH_STATE_TTL_SECONDS. Returns the number deleted.
+    """
+    cutoff = _utcnow() - datetime.timedelta(seconds=OAUTH_STATE_TTL_SECONDS)
+    return get_backend().purge_oauth_states(cutoff)
@@ -0,0 +1,212 @@
+"""
+Backtests of trade ideas over cached daily bars: does following the model pay?
+
+Every idea (a trade-shaped dict) is entered at the close of its entry day and
+held for `holding_days` sessions (or until its actual close when holding_days is
+None).  Three groups are evaluated together in one vectorized pass:
+  - "model_followed": ideas the model said to follow (opened_by_model)
+  - "user_only":      ideas the user took against the model
+  - "all":            every idea
+Parameter sweeps (holding periods x position sizing) run in a process pool; each
+worker receives the price matrix once, not once per parameter set.
+
+Usage (from the repo root, over the trades in the configured storage backend):
+    python -m backtest
+    python -m backtest --holding-days 5 10 20 60 --sizing shares notional --workers 4
+"""
+import argparse
+import datetime
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+
+from portfolio_analytics import TRADING_DAYS_PER_YEAR, running_total
+
+GROUPS = ("model_followed", "user_only", "all")
+SIZING_MODES = ("shares", "notional")
+
+
+class IdeaArrays(NamedTuple):
+    ticker: np.ndarray        # column in the price matrix
+    sign: np.ndarray          # +1 long, -1 short
+    shares: np.ndarray        # numShares as recorded
+    entry_idx: np.ndarray     # first session on or after the entry date
+    close_idx: np.ndarray     # first session on or after closeDate; last session if still open
+    groups: np.ndarray        # (len(GROUPS), n) membership masks
+
+
+def prepare_ideas(ideas: Iterable[Dict], closes: pd.DataFrame) -> IdeaArrays:
+    """
+    Converts idea dicts (ticker, positionType, numShares, entryDate, optional
+    closeDate, opened_by_model, opened_by_user) to arrays aligned with `closes`.
+    Ideas on unknown tickers or after the last session are dropped.
+    """
+    days = closes.index.values.astype("datetime64[D]")
+    n_days = len(days)
+    rows = [i for i in ideas if i.get("entryDate") and i.get("ticker") in closes.columns]
+    n = len(rows)
+
+    entry_idx = np.searchsorted(days, np.array([i["entryDate"] for i in rows], dtype="datetime64[D]"))
+    close_day = np.array([i.get("closeDate") or "NaT" for i in rows], dtype="datetime64[D]")
+    close_idx = np.where(np.isnat(close_day), n_days - 1,
+                         np.minimum(np.searchsorted(days, close_day), n_days - 1))
+    by_model = np.fromiter((bool(i.get("opened_by_model")) for i in rows), bool, n)
+    by_user = np.fromiter((bool(i.get("opened_by_user", True)) for i in rows), bool, n)
+
+    keep = entry_idx < n_days
+    groups = np.vstack([by_model, by_user & ~by_model, np.ones(n, dtype=bool)])
+    return IdeaArrays(
+        ticker=closes.columns.get_indexer([i["ticker"] for i in rows])[keep],
+        sign=np.fromiter((-1.0 if i.get("positionType") == "short" else 1.0 for i in rows), float, n)[keep],
+        shares=np.fromiter((float(i.get("numShares") or 1) for i in rows), float, n)[keep],
+        entry_idx=entry_idx[keep],
+        close_idx=np.maximum(close_idx, entry_idx)[keep],
+        groups=groups[:, keep],
+    )
+
+
+def simulate(
+    ideas: IdeaArrays,
+    prices: np.ndarray,
+    holding_days: Optional[int] = None,
+    sizing: str = "shares",
+    notional: float = 10_000.0
+) -> Dict[str, Dict[str, float]]:
+    """
+    Runs every group over a (days x tickers) price matrix with no missing values.
+    sizing="shares" uses each idea's numShares; "notional" buys `notional` USD worth.
+    Returns {group: stats}.
+    """
+    if sizing not in SIZING_MODES:
+        raise ValueError(f"Unknown sizing: {sizing}")
+    n_days, n_tickers = prices.shape
+    n_groups = len(GROUPS)
+
+    if holding_days is None:
+        exit_idx = ideas.close_idx
+    else:
+        exit_idx = np.minimum(ideas.entry_idx + holding_days, n_days - 1)
+    entry_px = prices[ideas.entry_idx, ideas.ticker]
+    exit_px = prices[exit_idx, ideas.ticker]
+    shares = ideas.shares if sizing == "shares" else notional / entry_px
+    pnl = ideas.sign * shares * (exit_px - entry_px)
+    ret_pct = ideas.sign * (exit_px / entry_px - 1) * 100
+
+    # One running-position pass for all groups: group g, ticker k lives in column g * K + k
+    member_group, member = np.nonzero(ideas.groups)
+    position = running_total(
+        n_days, n_groups * n_tickers,
+        ideas.entry_idx[member], exit_idx[member],
+        member_group * n_tickers + ideas.ticker[member],
+        (ideas.sign * shares)[member]
+    ).reshape(n_days, n_groups, n_tickers)
+    # Held from entry close to exit close: day d earns position[d-1] x (p[d] - p[d-1])
+    price_moves = np.diff(prices, axis=0)
+    daily_pnl = np.einsum("dgk,dk->gd", position[:-1], price_moves)
+    curve = np.cumsum(daily_pnl, axis=1)
+    drawdown = curve - np.maximum.accumulate(np.maximum(curve, 0), axis=1)
+
+    results = {}
+    for g, name in enumerate(GROUPS):
+        mask = ideas.groups[g]
+        count = int(mask.sum())
+        std = daily_pnl[g].std(ddof=1) if n_days > 2 else 0.0
+        results[name] = {
+            "ideas": count,
+            "total_pnl": float(pnl[mask].sum()),
+            "mean_return_pct": float(ret_pct[mask].mean()) if count else 0.0,
+            "hit_rate_pct": float((pnl[mask] > 0).mean() * 100) if count else 0.0,
+            "max_drawdown_usd": float(drawdown[g].min()) if n_days > 1 else 0.0,
+            "sharpe": float(daily_pnl[g].mean() / std * np.sqrt(TRADING_DAYS_PER_YEAR)) if std > 0 else 0.0,
+        }
+    return results
+
+
+#######################################################
+# Parameter sweeps
+#######################################################
+_worker_data = None
+
+def _init_worker(ideas: IdeaArrays, prices: np.ndarray):
+    global _worker_data
+    _worker_data = (ideas, prices)
+
+def _run_params(params: Dict) -> Dict:
+    ideas, prices = _worker_data
+    return {"params": params, "results": simulate(ideas, prices, **params)}
+
+def sweep(
+    ideas: IdeaArrays,
+    prices: np.ndarray,
+    holding_days: Iterable[Optional[int]] = (5, 10, 20, 60),
+    sizing: Iterable[str] = SIZING_MODES,
+    notional: float = 10_000.0,
+    max_workers: Optional[int] = None
+) -> List[Dict]:
+    """
+    simulate() for every (holding_days, sizing) combination, in parallel.
+    Returns [{"params": {...}, "results": {group: stats}}] in grid order.
+    """
+    grid = [{"holding_days": h, "sizing": s, "notional": notional}
+            for h, s in itertools.product(holding_days, sizing)]
+    max_workers = max_workers or min(len(grid), os.cpu_count() or 1)
+    if max_workers <= 1:
+        return [{"params": p, "results": simulate(ideas, prices, **p)} for p in grid]
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                             initargs=(ideas, prices)) as pool:
+        return list(pool.map(_run_params, grid))
+
+
+def load_price_matrix(ideas: Iterable[Dict]) -> pd.DataFrame:
+    """
+    Gap-filled closes from the bar store for the ideas' tickers, from the first entry on.
+    """
+    from market_data import get_close_matrix
+    ideas = list(ideas)
+    start_date = min(datetime.date.fromisoformat(i["entryDate"]) for i in ideas)
+    closes, errors = get_close_matrix({i["ticker"] for i in ideas}, start_date)
+    for ticker, reason in errors.items():
+        print(f"[backtest] skipping {ticker}: {reason}")
+    return closes.ffill().bfill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backtest model-followed vs user-only trades")
+    parser.add_argument("--holding-days", type=int, nargs="+", default=[5, 10, 20, 60])
+    parser.add_argument("--actual-exits", action="store_true",
+                        help="also run with each trade's real close date (or today if open)")
+    parser.add_argument("--sizing", nargs="+", choices=SIZING_MODES, default=list(SIZING_MODES))
+    parser.add_argument("--notional", type=float, default=10_000.0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--user-id", help="only this user's trades")
+    args = parser.parse_args()
+
+    from storage import get_backend
+    trades = [t for t in get_backend().query_trades(user_id=args.user_id)
+              if t.get("status") in ("open", "closed") and t.get("entryDate")]
+    if not trades:
+        print("[backtest] no opened trades to replay")
+        return
+
+    closes = load_price_matrix(trades)
+    ideas = prepare_ideas(trades, closes)
+    holding = list(args.holding_days) + ([None] if args.actual_exits else [])
+    runs = sweep(ideas, closes.to_numpy(dtype="float64"), holding, args.sizing, args.notional, args.workers)
+
+    print(f"[backtest] {len(ideas.entry_idx)} trades over {len(closes)} sessions")
+    for run in runs:
+        p = run["params"]
+        print(f"holding={p['holding_days'] or 'actual'} sizing={p['sizing']}")
+        for name in GROUPS:
+            r = run["results"][name]
+            print(f"    {name:<15} ideas={r['ideas']:<6} pnl={r['total_pnl']:>12,.2f} "
+                  f"mean={r['mean_return_pct']:>7.2f}% hit={r['hit_rate_pct']:>5.1f}% "
+                  f"maxDD={r['max_drawdown_usd']:>12,.2f} sharpe={r['sharpe']:>5.2f}")
+
+
+if __name__ == "__main__":
+    main()
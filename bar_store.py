@@ -0,0 +1,195 @@
+"""
+On-disk store of daily OHLCV bars, one directory per ticker.
+
+Each ticker directory holds one NumPy file per column (date, open, high, low,
+close, volume) that is memory-mapped on read, plus a small meta.json recording
+which date range has already been fetched.  Lookups are served from disk; only
+the part of a requested range that is not covered yet is fetched and merged in.
+"""
+import datetime
+import json
+import os
+import re
+import threading
+from typing import Callable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BAR_STORE_DIR = os.path.join(BASE_DIR, "data", "bars")
+
+BAR_COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+
+
+def _ticker_dirname(ticker: str) -> str:
+    # Tickers like "BRK-B", "^GSPC" or "7203.T" are fine; anything path-like is not
+    return re.sub(r"[^A-Za-z0-9.\-^=]", "_", ticker.upper())
+
+
+class BarStore:
+    """
+    fetch_fn(ticker, start_date, end_date) must return a DataFrame of daily bars
+    for the inclusive date range, indexed by date, with the BAR_COLUMNS columns.
+    """
+    def __init__(self, root: str, fetch_fn: Callable[[str, datetime.date, datetime.date], pd.DataFrame]):
+        self.root = root
+        self.fetch_fn = fetch_fn
+        # One lock per ticker, so a slow download only holds up readers of that ticker
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    def _ticker_lock(self, ticker: str) -> threading.Lock:
+        with self._locks_lock:
+            return self._locks.setdefault(_ticker_dirname(ticker), threading.Lock())
+
+    #######################################################
+    # Reading
+    #######################################################
+    def get_bars(
+        self,
+        ticker: str,
+        start_date: datetime.date,
+        end_date: datetime.date,
+        settled_through: datetime.date
+    ) -> pd.DataFrame:
+        """
+        Returns the daily bars for start_date..end_date (inclusive), indexed by a
+        naive DatetimeIndex.  Missing parts of the range are fetched first; bars
+        after settled_through are returned but never persisted, since that close
+        may still change.
+        """
+        with self._ticker_lock(ticker):
+            bars, covered = self._load(ticker)
+            unsettled = None
+
+            for fetch_start, fetch_end in self._missing_ranges(covered, start_date, end_date):
+                try:
+                    fetched = self._normalize(self.fetch_fn(ticker, fetch_start, fetch_end))
+                except Exception as e:
+                    # Serve whatever is stored locally; the gap is retried next time
+                    print(f"[DEBUG bar_store] fetch {ticker} {fetch_start}..{fetch_end} failed: {e}")
+                    continue
+                settled_end = min(fetch_end, settled_through)
+                if fetched.empty and not self._no_sessions(fetch_start, settled_end):
+                    # yfinance hides errors by default, so an empty range with a weekday
+                    # in it may be a failed request; leave it uncovered and retry.
+                    # Weekend-only ranges are covered, so they aren't fetched on every read.
+                    continue
+
+                settled_mask = fetched.index <= pd.Timestamp(settled_end)
+                if fetch_end > settled_through:
+                    unsettled = fetched.loc[~settled_mask]
+                if fetch_start <= settled_end:
+                    bars = self._merge(bars, fetched.loc[settled_mask])
+                    covered = (
+                        min(covered[0], fetch_start) if covered else fetch_start,
+                        max(covered[1], settled_end) if covered else settled_end
+                    )
+                    self._save(ticker, bars, covered)
+
+        if unsettled is not None and not unsettled.empty:
+            bars = self._merge(bars, unsettled)
+        return bars.loc[pd.Timestamp(start_date):pd.Timestamp(end_date)]
+
+    def covered_range(self, ticker: str) -> Optional[Tuple[datetime.date, datetime.date]]:
+        meta = self._read_meta(ticker)
+        if not meta:
+            return None
+        return (datetime.date.fromisoformat(meta["covered_from"]),
+                datetime.date.fromisoformat(meta["covered_to"]))
+
+    @staticmethod
+    def _no_sessions(start_date: datetime.date, end_date: datetime.date) -> bool:
+        # Exchange holidays count as sessions here, like elsewhere in the app
+        return start_date > end_date or np.busday_count(start_date, end_date + datetime.timedelta(days=1)) == 0
+
+    @staticmethod
+    def _missing_ranges(covered, start_date, end_date):
+        if not covered:
+            return [(start_date, end_date)]
+        ranges = []
+        # Gaps are always fetched up to the covered edge so coverage stays contiguous
+        if start_date < covered[0]:
+            ranges.append((start_date, covered[0] - datetime.timedelta(days=1)))
+        if end_date > covered[1]:
+            ranges.append((covered[1] + datetime.timedelta(days=1), end_date))
+        return ranges
+
+    def _load(self, ticker: str):
+        covered = self.covered_range(ticker)
+        if not covered:
+            return self._empty(), None
+
+        tdir = os.path.join(self.root, _ticker_dirname(ticker))
+        dates = np.load(os.path.join(tdir, "date.npy"), mmap_mode="r")
+        columns = {
+            col: np.load(os.path.join(tdir, f"{col.lower()}.npy"), mmap_mode="r")
+            for col in BAR_COLUMNS
+        }
+        if any(len(v) != len(dates) for v in columns.values()):
+            # Torn write from another process => treat as empty and refetch
+            return self._empty(), None
+        return pd.DataFrame(columns, index=pd.DatetimeIndex(dates.astype("datetime64[ns]"))), covered
+
+    def _read_meta(self, ticker: str):
+        meta_path = os.path.join(self.root, _ticker_dirname(ticker), "meta.json")
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, "r") as f:
+            return json.load(f)
+
+    #######################################################
+    # Writing
+    #######################################################
+    def _save(self, ticker: str, bars: pd.DataFrame, covered):
+        tdir = os.path.join(self.root, _ticker_dirname(ticker))
+        os.makedirs(tdir, exist_ok=True)
+
+        arrays = {"date": bars.index.values.astype("datetime64[D]")}
+        for col in BAR_COLUMNS:
+            arrays[col.lower()] = bars[col].to_numpy(dtype="float64")
+
+        # Write everything to temp files first, then swap them in; meta.json goes last
+        # so a reader never sees coverage for data that isn't there yet.
+        for name, arr in arrays.items():
+            tmp_path = os.path.join(tdir, f"{name}.npy.tmp")
+            with open(tmp_path, "wb") as f:
+                np.save(f, arr)
+            os.replace(tmp_path, os.path.join(tdir, f"{name}.npy"))
+
+        tmp_meta = os.path.join(tdir, "meta.json.tmp")
+        with open(tmp_meta, "w") as f:
+            json.dump({"covered_from": covered[0].isoformat(), "covered_to": covered[1].isoformat()}, f)
+        os.replace(tmp_meta, os.path.join(tdir, "meta.json"))
+
+    @staticmethod
+    def _empty() -> pd.DataFrame:
+        return pd.DataFrame({col: pd.Series(dtype="float64") for col in BAR_COLUMNS},
+                            index=pd.DatetimeIndex([], dtype="datetime64[ns]"))
+
+    @classmethod
+    def _normalize(cls, df: Optional[pd.DataFrame]) -> pd.DataFrame:
+        """
+        Reduces a yfinance-style frame to BAR_COLUMNS on a naive, day-resolution index.
+        """
+        if df is None or df.empty:
+            return cls._empty()
+        index = pd.DatetimeIndex(df.index)
+        if index.tz is not None:
+            index = index.tz_localize(None)
+        out = pd.DataFrame(
+            {col: df[col].to_numpy(dtype="float64") if col in df else np.nan for col in BAR_COLUMNS},
+            index=index.normalize().astype("datetime64[ns]")
+        )
+        out = out.dropna(subset=["Close"])
+        return out[~out.index.duplicated(keep="last")].sort_index()
+
+    @staticmethod
+    def _merge(existing: pd.DataFrame, new: pd.DataFrame) -> pd.DataFrame:
+        if existing.empty:
+            return new
+        if new.empty:
+            return existing
+        merged = pd.concat([existing, new])
+        return merged[~merged.index.duplicated(keep="last")].sort_index()
@@ -0,0 +1,64 @@
+"""
+Timing of backtest.simulate / backtest.sweep on synthetic ideas and prices.
+
+Usage (from the repo root):
+    python -m benchmarks.backtest_bench
+    python -m benchmarks.backtest_bench --ideas 1000 --years 5 --tickers 200 --workers 4
+"""
+import argparse
+import datetime
+import time
+
+import numpy as np
+import pandas as pd
+
+from backtest import prepare_ideas, simulate, sweep
+
+
+def synthetic_data(n_ideas: int, years: int, n_tickers: int, seed: int = 7):
+    rng = np.random.default_rng(seed)
+    days = pd.bdate_range(end=datetime.date.today(), periods=years * 252)
+    tickers = [f"T{i:04d}" for i in range(n_tickers)]
+    # Geometric random walks
+    log_returns = rng.normal(0.0003, 0.02, size=(len(days), n_tickers))
+    closes = pd.DataFrame(100 * np.exp(np.cumsum(log_returns, axis=0)), index=days, columns=tickers)
+
+    entry_days = days[rng.integers(0, len(days) - 1, n_ideas)]
+    ideas = [{
+        "ticker": tickers[rng.integers(n_tickers)],
+        "positionType": "short" if rng.random() < 0.3 else "long",
+        "numShares": int(rng.integers(1, 500)),
+        "entryDate": entry_day.date().isoformat(),
+        "opened_by_user": True,
+        "opened_by_model": bool(rng.random() < 0.5),
+    } for entry_day in entry_days]
+    return ideas, closes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backtest engine benchmark")
+    parser.add_argument("--ideas", type=int, default=1000)
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--tickers", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    ideas, closes = synthetic_data(args.ideas, args.years, args.tickers)
+    prices = closes.to_numpy(dtype="float64")
+
+    started = time.perf_counter()
+    arrays = prepare_ideas(ideas, closes)
+    prepared = time.perf_counter()
+    simulate(arrays, prices, holding_days=20)
+    simulated = time.perf_counter()
+    runs = sweep(arrays, prices, holding_days=(1, 5, 10, 20, 60, 120), max_workers=args.workers)
+    swept = time.perf_counter()
+
+    print(f"[backtest-bench] {args.ideas} ideas x {len(closes)} sessions x {args.tickers} tickers")
+    print(f"    prepare_ideas  {prepared - started:>8.4f}s")
+    print(f"    simulate       {simulated - prepared:>8.4f}s")
+    print(f"    sweep ({len(runs)} runs) {swept - simulated:>8.4f}s")
+
+
+if __name__ == "__main__":
+    main()
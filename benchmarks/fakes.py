@@ -0,0 +1,595 @@
+"""
+Deterministic local stand-ins for Firestore, yfinance and Google's ID-token certs.
+
+The fakes can add a fixed latency per round trip and count every call, so the
+benchmarks measure how many network round trips a code path would make, not
+just how long it takes locally.
+"""
+import datetime
+import itertools
+import json
+import threading
+import time
+import zlib
+from collections import Counter, defaultdict
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+from google.cloud import firestore
+from google.cloud.firestore_v1.watch import ChangeType
+
+
+#######################################################
+# Fake Firestore
+#######################################################
+class FakeFirestoreClient:
+    """
+    Implements the subset of google.cloud.firestore.Client used by
+    storage.firestore_backend.FirestoreBackend.
+    """
+    def __init__(self, latency_seconds: float = 0.0):
+        self.latency_seconds = latency_seconds
+        self.stats = Counter()
+        self._collections: Dict[str, Dict[str, Dict]] = defaultdict(dict)
+        self._ids = itertools.count(1)
+        self._lock = threading.RLock()
+        self._watches = []
+
+    def _round_trip(self, kind: str, docs_read: int = 0, docs_written: int = 0):
+        with self._lock:
+            self.stats["round_trips"] += 1
+            self.stats[kind] += 1
+            self.stats["docs_read"] += docs_read
+            self.stats["docs_written"] += docs_written
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+
+    def reset_stats(self):
+        self.stats = Counter()
+
+    def seed(self, collection: str, doc_id: str, data: Dict):
+        """
+        Inserts a document without counting a round trip.
+        """
+        self._collections[collection][doc_id] = dict(data)
+
+    def new_id(self) -> str:
+        return f"doc{next(self._ids):08d}"
+
+    def collection(self, name: str) -> "FakeCollection":
+        return FakeCollection(self, name)
+
+    def batch(self) -> "FakeWriteBatch":
+        return FakeWriteBatch(self)
+
+    def transaction(self, **kwargs) -> "FakeTransaction":
+        return FakeTransaction(self)
+
+    # Raw document operations shared by refs, batches and transactions
+    def _read(self, collection: str, doc_id: str) -> Optional[Dict]:
+        with self._lock:
+            data = self._collections[collection].get(doc_id)
+            return dict(data) if data is not None else None
+
+    def _write(self, op: str, collection: str, doc_id: str, data: Optional[Dict] = None):
+        with self._lock:
+            docs = self._collections[collection]
+            if op == "delete":
+                docs.pop(doc_id, None)
+            elif op == "set":
+                docs[doc_id] = _resolve(None, data)
+            elif op == "merge":
+                docs[doc_id] = _resolve(docs.get(doc_id), data)
+            elif op == "update":
+                if doc_id not in docs:
+                    raise ValueError(f"No document to update: {collection}/{doc_id}")
+                docs[doc_id] = _resolve(docs[doc_id], data)
+            watches = list(self._watches)
+        for watch in watches:
+            watch._notify(collection, doc_id)
+
+
+def _resolve(existing: Optional[Dict], fields: Dict) -> Dict:
+    """
+    Applies fields (with dotted paths and Firestore sentinels) on top of existing.
+    """
+    out = dict(existing or {})
+    for key, value in fields.items():
+        target = out
+        parts = key.split(".")
+        for part in parts[:-1]:
+            target[part] = dict(target.get(part) or {})
+            target = target[part]
+        leaf = parts[-1]
+        if value is firestore.SERVER_TIMESTAMP:
+            value = datetime.datetime.now(datetime.timezone.utc)
+        elif isinstance(value, firestore.Increment):
+            value = (target.get(leaf) or 0) + value.value
+        target[leaf] = value
+    return out
+
+
+class FakeSnapshot:
+    def __init__(self, reference: "FakeDocumentReference", data: Optional[Dict]):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self) -> Optional[Dict]:
+        return dict(self._data) if self._data is not None else None
+
+    def get(self, field: str):
+        return self._data.get(field) if self._data else None
+
+
+class FakeDocumentReference:
+    def __init__(self, client: FakeFirestoreClient, collection: str, doc_id: str):
+        self._client = client
+        self._collection = collection
+        self.id = doc_id
+
+    @property
+    def path(self) -> str:
+        return f"{self._collection}/{self.id}"
+
+    def get(self, transaction=None) -> FakeSnapshot:
+        data = self._client._read(self._collection, self.id)
+        self._client._round_trip("doc_gets", docs_read=1)
+        return FakeSnapshot(self, data)
+
+    def set(self, data: Dict, merge: bool = False):
+        self._client._round_trip("doc_writes", docs_written=1)
+        self._client._write("merge" if merge else "set", self._collection, self.id, data)
+
+    def update(self, fields: Dict):
+        self._client._round_trip("doc_writes", docs_written=1)
+        self._client._write("update", self._collection, self.id, fields)
+
+    def delete(self):
+        self._client._round_trip("doc_writes", docs_written=1)
+        self._client._write("delete", self._collection, self.id)
+
+    def collection(self, name: str) -> "FakeCollection":
+        return FakeCollection(self._client, f"{self._collection}/{self.id}/{name}")
+
+
+_OPS = {
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    "<": lambda a, b: a is not None and a < b,
+    "<=": lambda a, b: a is not None and a <= b,
+    ">": lambda a, b: a is not None and a > b,
+    ">=": lambda a, b: a is not None and a >= b,
+    "in": lambda a, b: a in b,
+}
+
+
+class FakeQuery:
+    def __init__(self, client: FakeFirestoreClient, collection: str, filters=(), orders=(),
+                 cursor=None, limit_count=None):
+        self._client = client
+        self._collection = collection
+        self._filters = list(filters)
+        self._orders = list(orders)
+        self._cursor = cursor
+        self._limit = limit_count
+
+    def _copy(self, **changes) -> "FakeQuery":
+        state = {"filters": self._filters, "orders": self._orders,
+                 "cursor": self._cursor, "limit_count": self._limit}
+        state.update(changes)
+        return FakeQuery(self._client, self._collection, **state)
+
+    def where(self, field: str, op: str, value) -> "FakeQuery":
+        return self._copy(filters=self._filters + [(field, op, value)])
+
+    def order_by(self, field: str, direction: str = firestore.Query.ASCENDING) -> "FakeQuery":
+        return self._copy(orders=self._orders + [(field, direction)])
+
+    def start_after(self, values) -> "FakeQuery":
+        return self._copy(cursor=list(values))
+
+    def limit(self, count: int) -> "FakeQuery":
+        return self._copy(limit_count=count)
+
+    def _matches(self):
+        with self._client._lock:
+            items = list(self._client._collections[self._collection].items())
+        for doc_id, data in items:
+            if all(_OPS[op](data.get(field), value) for field, op, value in self._filters):
+                yield doc_id, data
+
+    def _results(self):
+        """
+        Matches with order_by, start_after and limit applied, like a server query.
+        """
+        results = list(self._matches())
+        if not self._orders:
+            return results[:self._limit] if self._limit is not None else results
+
+        def value(doc_id, data, field):
+            return doc_id if field == "__name__" else data.get(field)
+
+        # Like Firestore, ordering by a field drops documents that don't have it
+        results = [(i, d) for i, d in results if all(value(i, d, f) is not None for f, _ in self._orders)]
+        for field, direction in reversed(self._orders):
+            results.sort(key=lambda item: value(*item, field), reverse=direction == firestore.Query.DESCENDING)
+        if self._cursor is not None:
+            cursor = [getattr(v, "id", v) for v in self._cursor]
+
+            def after(item):
+                for (field, direction), bound in zip(self._orders, cursor):
+                    v = value(*item, field)
+                    if v != bound:
+                        return v < bound if direction == firestore.Query.DESCENDING else v > bound
+                return False
+
+            results = [item for item in results if after(item)]
+        return results[:self._limit] if self._limit is not None else results
+
+    def stream(self, transaction=None):
+        snaps = [
+            FakeSnapshot(FakeDocumentReference(self._client, self._collection, doc_id), dict(data))
+            for doc_id, data in self._results()
+        ]
+        self._client._round_trip("queries", docs_read=len(snaps))
+        return iter(snaps)
+
+    def get(self, transaction=None):
+        return list(self.stream(transaction=transaction))
+
+    def count(self, alias: Optional[str] = None) -> "FakeAggregationQuery":
+        return FakeAggregationQuery(self).count(alias)
+
+    def sum(self, field: str, alias: Optional[str] = None) -> "FakeAggregationQuery":
+        return FakeAggregationQuery(self).sum(field, alias)
+
+    def avg(self, field: str, alias: Optional[str] = None) -> "FakeAggregationQuery":
+        return FakeAggregationQuery(self).avg(field, alias)
+
+    def on_snapshot(self, callback) -> "FakeWatch":
+        return FakeWatch(self, callback)
+
+
+class FakeAggregationResult:
+    def __init__(self, alias: str, value):
+        self.alias = alias
+        self.value = value
+
+
+class FakeAggregationQuery:
+    """
+    count/sum/avg over a query. Billed like Firestore: one document read per
+    1000 index entries scanned, and no documents are sent back.
+    """
+    def __init__(self, query: FakeQuery):
+        self._query = query
+        self._aggregations = []
+
+    def _add(self, kind: str, field: Optional[str], alias: Optional[str]) -> "FakeAggregationQuery":
+        self._aggregations.append((kind, field, alias or f"field_{len(self._aggregations) + 1}"))
+        return self
+
+    def count(self, alias: Optional[str] = None) -> "FakeAggregationQuery":
+        return self._add("count", None, alias)
+
+    def sum(self, field: str, alias: Optional[str] = None) -> "FakeAggregationQuery":
+        return self._add("sum", field, alias)
+
+    def avg(self, field: str, alias: Optional[str] = None) -> "FakeAggregationQuery":
+        return self._add("avg", field, alias)
+
+    def get(self, transaction=None):
+        docs = [data for _, data in self._query._results()]
+        self._query._client._round_trip("aggregations", docs_read=max(1, -(-len(docs) // 1000)))
+        row = []
+        for kind, field, alias in self._aggregations:
+            if kind == "count":
+                row.append(FakeAggregationResult(alias, len(docs)))
+                continue
+            # Non-numeric and missing values are skipped, as on the server
+            numbers = [d[field] for d in docs
+                       if isinstance(d.get(field), (int, float)) and not isinstance(d.get(field), bool)]
+            if kind == "sum":
+                row.append(FakeAggregationResult(alias, sum(numbers)))
+            else:
+                row.append(FakeAggregationResult(alias, sum(numbers) / len(numbers) if numbers else None))
+        return [row]
+
+
+class FakeDocumentChange:
+    def __init__(self, change_type: ChangeType, document: FakeSnapshot):
+        self.type = change_type
+        self.document = document
+
+
+class FakeWatch:
+    """
+    A query listener. Unlike real Firestore, which calls back from a background
+    thread, changes are delivered synchronously from the write that caused them.
+    """
+    def __init__(self, query: FakeQuery, callback):
+        self._query = query
+        self._callback = callback
+        self._known = set()
+        self.is_active = True
+        client = query._client
+        with client._lock:
+            client._watches.append(self)
+            initial = list(query._matches())
+        client._round_trip("listens", docs_read=len(initial))
+        self._deliver([(ChangeType.ADDED, doc_id, data) for doc_id, data in initial])
+
+    def _notify(self, collection: str, doc_id: str):
+        query = self._query
+        if collection != query._collection:
+            return
+        data = query._client._read(collection, doc_id)
+        matches = data is not None and all(
+            _OPS[op](data.get(field), value) for field, op, value in query._filters
+        )
+        if matches:
+            change_type = ChangeType.MODIFIED if doc_id in self._known else ChangeType.ADDED
+        elif doc_id in self._known:
+            change_type = ChangeType.REMOVED
+        else:
+            return
+        with query._client._lock:
+            query._client.stats["listen_events"] += 1
+            query._client.stats["docs_read"] += 1
+        self._deliver([(change_type, doc_id, data)])
+
+    def _deliver(self, changes):
+        ref = lambda doc_id: FakeDocumentReference(self._query._client, self._query._collection, doc_id)
+        doc_changes = []
+        for change_type, doc_id, data in changes:
+            if change_type == ChangeType.REMOVED:
+                self._known.discard(doc_id)
+            else:
+                self._known.add(doc_id)
+            doc_changes.append(FakeDocumentChange(change_type, FakeSnapshot(ref(doc_id), data and dict(data))))
+        docs = [FakeSnapshot(ref(doc_id), self._query._client._read(self._query._collection, doc_id))
+                for doc_id in sorted(self._known)]
+        self._callback(docs, doc_changes, datetime.datetime.now(datetime.timezone.utc))
+
+    def unsubscribe(self):
+        self.is_active = False
+        with self._query._client._lock:
+            if self in self._query._client._watches:
+                self._query._client._watches.remove(self)
+
+
+class FakeCollection(FakeQuery):
+    def __init__(self, client: FakeFirestoreClient, name: str):
+        super().__init__(client, name)
+
+    def document(self, doc_id: Optional[str] = None) -> FakeDocumentReference:
+        return FakeDocumentReference(self._client, self._collection, doc_id or self._client.new_id())
+
+    def add(self, data: Dict):
+        ref = self.document()
+        self._client._round_trip("doc_writes", docs_written=1)
+        self._client._write("set", self._collection, ref.id, data)
+        return datetime.datetime.now(datetime.timezone.utc), ref
+
+
+class FakeWriteBatch:
+    def __init__(self, client: FakeFirestoreClient):
+        self._client = client
+        self._writes = []
+
+    def set(self, ref: FakeDocumentReference, data: Dict, merge: bool = False):
+        self._writes.append(("merge" if merge else "set", ref, data))
+
+    def update(self, ref: FakeDocumentReference, fields: Dict):
+        self._writes.append(("update", ref, fields))
+
+    def delete(self, ref: FakeDocumentReference):
+        self._writes.append(("delete", ref, None))
+
+    def commit(self):
+        if len(self._writes) > 500:
+            raise ValueError("Firestore batches are limited to 500 writes")
+        self._client._round_trip("commits", docs_written=len(self._writes))
+        with self._client._lock:
+            for op, ref, data in self._writes:
+                self._client._write(op, ref._collection, ref.id, data)
+        self._writes = []
+
+
+class FakeTransaction(FakeWriteBatch):
+    """
+    Enough of firestore.Transaction for @firestore.transactional to drive it.
+    Reads go straight to the store; writes are buffered until commit.
+    """
+    _max_attempts = 5
+    _read_only = False
+
+    def __init__(self, client: FakeFirestoreClient):
+        super().__init__(client)
+        self._id = None
+
+    def _clean_up(self):
+        self._writes = []
+        self._id = None
+
+    def _begin(self, retry_id=None):
+        self._id = b"fake-transaction"
+
+    def _rollback(self):
+        self._clean_up()
+
+    def _commit(self):
+        self.commit()
+        self._clean_up()
+        return []
+
+    @property
+    def in_progress(self):
+        return self._id is not None
+
+    def get(self, ref_or_query):
+        if isinstance(ref_or_query, FakeDocumentReference):
+            return iter([ref_or_query.get()])
+        return ref_or_query.stream()
+
+    def get_all(self, refs):
+        # One BatchGetDocuments call, however many documents
+        refs = list(refs)
+        snaps = [FakeSnapshot(ref, self._client._read(ref._collection, ref.id)) for ref in refs]
+        self._client._round_trip("batch_gets", docs_read=len(snaps))
+        return iter(snaps)
+
+
+#######################################################
+# Fake yfinance
+#######################################################
+def _price_path(ticker: str, days: pd.DatetimeIndex) -> np.ndarray:
+    """
+    Deterministic, smooth-ish price series per ticker, computable for any day range.
+    """
+    seed = zlib.crc32(ticker.encode("utf-8"))
+    base = 20 + seed % 480
+    ordinals = days.to_julian_date().to_numpy()
+    return np.round(base * (1 + 0.1 * np.sin(ordinals / 17.0 + seed % 97)), 2)
+
+
+class FakeTicker:
+    def __init__(self, fake_yf: "FakeYFinance", symbol: str):
+        self._yf = fake_yf
+        self.symbol = symbol
+
+    def history(self, period: Optional[str] = None, start=None, end=None, **kwargs) -> pd.DataFrame:
+        self._yf._round_trip("history")
+        return self._yf._bars(self.symbol, period=period, start=start, end=end)
+
+
+class FakeYFinance:
+    """
+    Drop-in for the `yf` module as used by market_data: yf.download and yf.Ticker(...).history.
+    `unknown_tickers` return empty frames, like delisted symbols do.
+    """
+    def __init__(self, latency_seconds: float = 0.0, today: Optional[datetime.date] = None,
+                 unknown_tickers=()):
+        self.latency_seconds = latency_seconds
+        self.today = today or datetime.date.today()
+        self.unknown_tickers = set(unknown_tickers)
+        self.stats = Counter()
+        self._lock = threading.Lock()
+
+    def _round_trip(self, kind: str):
+        with self._lock:
+            self.stats["round_trips"] += 1
+            self.stats[kind] += 1
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+
+    def reset_stats(self):
+        self.stats = Counter()
+
+    def _bars(self, symbol: str, period=None, start=None, end=None) -> pd.DataFrame:
+        if symbol in self.unknown_tickers:
+            return pd.DataFrame()
+        if period is not None:
+            days_back = int(period.rstrip("d")) if period.endswith("d") else 30
+            end_day = pd.Timestamp(self.today)
+            days = pd.bdate_range(end=end_day, periods=days_back)
+        else:
+            # yfinance end is exclusive
+            last = min(pd.Timestamp(end) - pd.Timedelta(days=1), pd.Timestamp(self.today))
+            days = pd.bdate_range(start=pd.Timestamp(start), end=last)
+        closes = _price_path(symbol, days)
+        index = days.tz_localize("America/New_York")
+        return pd.DataFrame(
+            {"Open": closes, "High": closes * 1.01, "Low": closes * 0.99, "Close": closes,
+             "Volume": np.full(len(days), 1_000_000.0)},
+            index=index
+        )
+
+    def Ticker(self, symbol: str) -> FakeTicker:
+        return FakeTicker(self, symbol)
+
+    def download(self, tickers, period=None, start=None, end=None, group_by="column", **kwargs) -> pd.DataFrame:
+        self._round_trip("download")
+        if isinstance(tickers, str):
+            tickers = tickers.split()
+        frames = {t: self._bars(t, period=period, start=start, end=end) for t in tickers}
+        frames = {t: f for t, f in frames.items() if not f.empty}
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, axis=1)
+
+
+#######################################################
+# Fake Google sign-in
+#######################################################
+class FakeResponse:
+    """
+    The google.auth.transport.Response interface: status, headers, data.
+    """
+    def __init__(self, status: int, headers: Dict[str, str], data: bytes):
+        self.status = status
+        self.headers = headers
+        self.data = data
+
+
+class FakeGoogleCerts:
+    """
+    Stand-in for Google's ID-token signer and its cert endpoint, usable as a
+    google.auth transport (e.g. wrapped in cert_cache.CachingRequest).  Tokens
+    from id_token() are really RS256-signed, so verify_oauth2_token checks them
+    end to end; every cert download is counted and can be given latency.
+    """
+    def __init__(self, latency_seconds: float = 0.0, max_age_seconds: int = 3600, key_id: str = "fake-key-1"):
+        from cryptography import x509
+        from cryptography.hazmat.primitives import hashes, serialization
+        from cryptography.hazmat.primitives.asymmetric import rsa
+        from cryptography.x509.oid import NameOID
+        from google.auth import crypt
+
+        self.latency_seconds = latency_seconds
+        self.max_age_seconds = max_age_seconds
+        self.key_id = key_id
+        self.stats = Counter()
+
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "fake-google-signer")])
+        now = datetime.datetime.now(datetime.timezone.utc)
+        cert = (
+            x509.CertificateBuilder()
+            .subject_name(name).issuer_name(name).public_key(key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now - datetime.timedelta(days=1))
+            .not_valid_after(now + datetime.timedelta(days=30))
+            .sign(key, hashes.SHA256())
+        )
+        self._certs = {key_id: cert.public_bytes(serialization.Encoding.PEM).decode()}
+        pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                serialization.NoEncryption())
+        self._signer = crypt.RSASigner.from_string(pem, key_id=key_id)
+
+    def reset_stats(self):
+        self.stats = Counter()
+
+    def __call__(self, url, method="GET", body=None, headers=None, timeout=None, **kwargs) -> FakeResponse:
+        self.stats["round_trips"] += 1
+        self.stats["cert_fetches"] += 1
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        return FakeResponse(
+            200,
+            {"Cache-Control": f"public, max-age={self.max_age_seconds}, must-revalidate, no-transform",
+             "Content-Type": "application/json; charset=UTF-8"},
+            json.dumps(self._certs).encode()
+        )
+
+    def id_token(self, email: str, audience: str, lifetime_seconds: int = 3600) -> str:
+        from google.auth import jwt
+        now = int(time.time())
+        payload = {
+            "iss": "https://accounts.google.com", "aud": audience, "sub": f"sub-{email}",
+            "email": email, "email_verified": True, "iat": now, "exp": now + lifetime_seconds,
+        }
+        return jwt.encode(self._signer, payload).decode()
@@ -0,0 +1,48 @@
+"""
+Cost of the sign-in callback's ID-token verification, with Google's cert
+endpoint replaced by benchmarks.fakes.FakeGoogleCerts.
+
+Compares a fresh transport per login (the old behaviour: certs downloaded every
+time) with the shared cert_cache.CachingRequest.
+
+Usage (from the repo root):
+    python -m benchmarks.login_bench
+    python -m benchmarks.login_bench --logins 20 --cert-latency-ms 80
+"""
+import argparse
+import time
+
+from google.oauth2 import id_token
+
+from benchmarks.fakes import FakeGoogleCerts
+from cert_cache import CachingRequest
+
+CLIENT_ID = "bench-client-id"
+
+
+def _run(fake: FakeGoogleCerts, transport_for_login, logins: int):
+    fake.reset_stats()
+    started = time.perf_counter()
+    for i in range(logins):
+        token = fake.id_token(f"user{i}@example.com", CLIENT_ID)
+        idinfo = id_token.verify_oauth2_token(token, transport_for_login(), CLIENT_ID)
+        assert idinfo["email"] == f"user{i}@example.com"
+    return time.perf_counter() - started, fake.stats["cert_fetches"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ID-token verification benchmark")
+    parser.add_argument("--logins", type=int, default=10)
+    parser.add_argument("--cert-latency-ms", type=float, default=50.0)
+    args = parser.parse_args()
+
+    fake = FakeGoogleCerts(latency_seconds=args.cert_latency_ms / 1000)
+    shared = CachingRequest(fake)
+    for label, transport_for_login in (("uncached", lambda: fake), ("cached", lambda: shared)):
+        wall, fetches = _run(fake, transport_for_login, args.logins)
+        print(f"[login-bench] {label:<9} {args.logins} logins  {wall:>8.4f}s  "
+              f"{wall / args.logins * 1000:>7.1f} ms/login  cert fetches={fetches}")
+
+
+if __name__ == "__main__":
+    main()
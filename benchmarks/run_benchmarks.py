@@ -0,0 +1,304 @@
+"""
+Data-layer benchmarks against the fake Firestore and fake yfinance.
+
+For each (users, trades, tickers) scenario this seeds a fresh fake database and
+times the hot data-layer paths, recording wall time, Firestore and yfinance
+round trips, and allocations (tracemalloc).  Results are written as JSON so two
+runs can be compared for regressions.
+
+Usage (from the repo root):
+    python -m benchmarks.run_benchmarks
+    python -m benchmarks.run_benchmarks --trades 10 1000 100000 --tickers 5 50
+    python -m benchmarks.run_benchmarks --firestore-latency-ms 20 --yf-latency-ms 150
+    python -m benchmarks.run_benchmarks --compare benchmarks/results/baseline.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import market_data
+import firestore_database
+from bar_store import BarStore
+from fetch_executor import FetchExecutor
+from storage import get_backend, set_backend
+from storage.firestore_backend import FirestoreBackend
+from benchmarks.fakes import FakeFirestoreClient, FakeYFinance
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+# Share of seeded trades per status; half the scheduled trades are due, half in the future
+STATUS_MIX = [("open", 0.6), ("scheduled", 0.2), ("closed", 0.2)]
+# Operations that must be served without calling yfinance, whatever the baseline
+NO_YFINANCE_OPERATIONS = ("auto_open_scheduled_again", "update_unrealized_pnl_warm", "close_matrix_weekend_again")
+
+
+class Environment:
+    """
+    A seeded fake database plus fake market data, wired into the app modules.
+    """
+    def __init__(self, n_users: int, n_trades: int, n_tickers: int,
+                 firestore_latency: float, yf_latency: float, yf_rate_per_second: float, seed: int = 42):
+        self.client = FakeFirestoreClient(latency_seconds=firestore_latency)
+        self.fake_yf = FakeYFinance(latency_seconds=yf_latency)
+        self.bar_dir = tempfile.mkdtemp(prefix="lmtrading-bench-bars-")
+
+        set_backend(FirestoreBackend(client=self.client))
+        market_data.yf = self.fake_yf
+        market_data.clear_price_cache()
+        market_data._last_good_quotes.clear()
+        market_data._bar_store = BarStore(self.bar_dir, market_data._fetch_daily_bars)
+        market_data._fetcher = FetchExecutor(rate_per_second=yf_rate_per_second)
+
+        rng = random.Random(seed)
+        self.user_ids = [f"user{i:05d}" for i in range(n_users)]
+        tickers = [f"T{i:04d}" for i in range(n_tickers)]
+        today = datetime.date.today()
+        self.open_trade_ids = []
+        for i in range(n_trades):
+            status = rng.choices([s for s, _ in STATUS_MIX], [w for _, w in STATUS_MIX])[0]
+            entry_day = today - datetime.timedelta(days=rng.randint(5, 400))
+            if status == "scheduled" and rng.random() < 0.5:
+                entry_day = today + datetime.timedelta(days=rng.randint(1, 30))
+            doc = {
+                "userId": rng.choice(self.user_ids),
+                "ticker": rng.choice(tickers),
+                "positionType": rng.choice(["long", "short"]),
+                "numShares": rng.randint(1, 500),
+                "entryDate": None if status == "scheduled" else entry_day.isoformat(),
+                "entryPrice": 0.0 if status == "scheduled" else round(rng.uniform(10, 500), 2),
+                "status": status,
+                "opened_by_user": True,
+                "opened_by_model": rng.random() < 0.5,
+                "pending_open": status == "scheduled",
+                "pending_open_date": entry_day.isoformat() if status == "scheduled" else None,
+                "closeDate": None,
+                "closePrice": None,
+                "pnl_usd": None,
+                "return_pct": None,
+            }
+            if status == "closed":
+                doc.update({"closeDate": today.isoformat(), "closePrice": 100.0, "pnl_usd": 0.0, "return_pct": 0.0})
+            trade_id = f"trade{i:07d}"
+            self.client.seed("trades", trade_id, doc)
+            if status == "open":
+                self.open_trade_ids.append(trade_id)
+        # The busiest user is the one a page load would be slowest for
+        counts = {}
+        for trade_id in self.open_trade_ids:
+            uid = self.client._collections["trades"][trade_id]["userId"]
+            counts[uid] = counts.get(uid, 0) + 1
+        self.heaviest_user = max(counts, key=counts.get) if counts else self.user_ids[0]
+        # Seeded trades bypass the write path, so build the summaries they would have produced
+        firestore_database.rebuild_user_summaries()
+
+    def close(self):
+        shutil.rmtree(self.bar_dir, ignore_errors=True)
+
+
+def _last_sunday() -> datetime.date:
+    # Settled already, and a day without a session
+    today = datetime.date.today()
+    return today - datetime.timedelta(days=(today.weekday() + 1) % 7 or 7)
+
+
+def _operations(env: Environment):
+    """
+    (name, callable) pairs, run in this order against the same environment.
+    """
+    close_target = env.open_trade_ids[0] if env.open_trade_ids else None
+    heaviest_tickers = {
+        t["ticker"] for t in get_backend().query_trades(user_id=env.heaviest_user)
+    }
+    year_ago = datetime.date.today() - datetime.timedelta(days=365)
+    ops = [
+        ("auto_open_scheduled_trades", firestore_database.auto_open_scheduled_trades),
+        # Nothing left due => no price lookups and no writes
+        ("auto_open_scheduled_again", firestore_database.auto_open_scheduled_trades),
+        ("update_unrealized_pnl_cold", firestore_database.update_unrealized_pnl),
+        # Second refresh: quotes cached, nothing changed => should write nothing
+        ("update_unrealized_pnl_warm", firestore_database.update_unrealized_pnl),
+        ("get_user_open_positions", lambda: firestore_database.get_user_open_positions(env.heaviest_user)),
+        ("get_user_summary", lambda: firestore_database.get_user_summary(env.heaviest_user)),
+        # Portfolio analytics prices: stored through Friday by a weekday render, then
+        # read over the weekend; only the first weekend read may ask yfinance
+        ("close_matrix_friday",
+         lambda: market_data.get_close_matrix(heaviest_tickers, year_ago, _last_sunday() - datetime.timedelta(days=2))),
+        ("close_matrix_weekend", lambda: market_data.get_close_matrix(heaviest_tickers, year_ago, _last_sunday())),
+        ("close_matrix_weekend_again",
+         lambda: market_data.get_close_matrix(heaviest_tickers, year_ago, _last_sunday())),
+    ]
+    if close_target:
+        ops.append(("close_trade_in_firestore",
+                    lambda: firestore_database.close_trade_in_firestore(
+                        close_target, 123.45, datetime.date.today().isoformat())))
+    # Liquidate the busiest user's book: one query, one price pass, transactional batches
+    ops.append(("close_trades_bulk",
+                lambda: firestore_database.close_trades_in_firestore(
+                    env.heaviest_user,
+                    [t["trade_id"] for t in firestore_database.get_user_open_positions(env.heaviest_user)],
+                    firestore_database.PRICE_SOURCE_LATEST, datetime.date.today().isoformat())))
+    return ops
+
+
+def _measure(env: Environment, fn, trace_allocations: bool):
+    env.client.reset_stats()
+    env.fake_yf.reset_stats()
+    if trace_allocations:
+        tracemalloc.start()
+    started = time.perf_counter()
+    fn()
+    wall = time.perf_counter() - started
+    result = {
+        "wall_seconds": round(wall, 6),
+        "firestore": dict(env.client.stats),
+        "yfinance": dict(env.fake_yf.stats),
+    }
+    if trace_allocations:
+        current, peak = tracemalloc.get_traced_memory()
+        result["alloc_peak_bytes"] = peak
+        result["alloc_retained_bytes"] = current
+        tracemalloc.stop()
+    return result
+
+
+def run_scenario(n_users, n_trades, n_tickers, args):
+    """
+    Times every operation on one environment, then re-runs them on a fresh one
+    under tracemalloc (which slows everything down) for allocation numbers.
+    """
+    def _run(trace_allocations):
+        env = Environment(n_users, n_trades, n_tickers,
+                          args.firestore_latency_ms / 1000.0, args.yf_latency_ms / 1000.0,
+                          args.yf_rate_per_second)
+        try:
+            return {name: _measure(env, fn, trace_allocations) for name, fn in _operations(env)}
+        finally:
+            env.close()
+
+    timings = _run(trace_allocations=False)
+    if not args.no_alloc:
+        for name, alloc in _run(trace_allocations=True).items():
+            timings[name]["alloc_peak_bytes"] = alloc["alloc_peak_bytes"]
+            timings[name]["alloc_retained_bytes"] = alloc["alloc_retained_bytes"]
+
+    scenario = {"users": n_users, "trades": n_trades, "tickers": n_tickers}
+    return [dict(scenario=scenario, operation=name, **metrics) for name, metrics in timings.items()]
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def compare(current, baseline, threshold):
+    """
+    Returns human-readable regressions: wall time above baseline * threshold, or
+    more round trips than the baseline for the same scenario and operation.
+    """
+    def _key(r):
+        s = r["scenario"]
+        return (s["users"], s["trades"], s["tickers"], r["operation"])
+
+    base = {_key(r): r for r in baseline["results"]}
+    regressions = []
+    for r in current["results"]:
+        b = base.get(_key(r))
+        if not b:
+            continue
+        label = f"{r['operation']} {r['scenario']}"
+        if r["wall_seconds"] > b["wall_seconds"] * threshold and r["wall_seconds"] - b["wall_seconds"] > 0.005:
+            regressions.append(f"{label}: wall {b['wall_seconds']:.4f}s -> {r['wall_seconds']:.4f}s")
+        for system in ("firestore", "yfinance"):
+            before = b[system].get("round_trips", 0)
+            after = r[system].get("round_trips", 0)
+            if after > before:
+                regressions.append(f"{label}: {system} round trips {before} -> {after}")
+    return regressions
+
+
+def check_invariants(current):
+    """
+    Regressions that don't need a baseline, e.g. a warm path calling yfinance.
+    """
+    problems = []
+    for r in current["results"]:
+        calls = r["yfinance"].get("round_trips", 0)
+        if r["operation"] in NO_YFINANCE_OPERATIONS and calls:
+            problems.append(f"{r['operation']} {r['scenario']}: {calls} yfinance round trips, expected 0")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LMTrading data-layer benchmarks")
+    parser.add_argument("--trades", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--tickers", type=int, nargs="+", default=[5, 50])
+    parser.add_argument("--trades-per-user", type=int, default=25)
+    parser.add_argument("--firestore-latency-ms", type=float, default=0.0)
+    parser.add_argument("--yf-latency-ms", type=float, default=0.0)
+    # The production limiter (MARKET_DATA_RATE_PER_SECOND) would dominate local timings
+    parser.add_argument("--yf-rate-per-second", type=float, default=1000.0)
+    parser.add_argument("--no-alloc", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--output", help="JSON file to write (default: benchmarks/results/bench-<timestamp>.json)")
+    parser.add_argument("--compare", help="baseline JSON to check for regressions")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="wall-time ratio over baseline that counts as a regression")
+    args = parser.parse_args()
+
+    results = []
+    for n_trades in args.trades:
+        for n_tickers in args.tickers:
+            n_users = max(1, n_trades // args.trades_per_user)
+            print(f"[bench] users={n_users} trades={n_trades} tickers={n_tickers}")
+            for row in run_scenario(n_users, n_trades, n_tickers, args):
+                fs = row["firestore"].get("round_trips", 0)
+                yf = row["yfinance"].get("round_trips", 0)
+                print(f"    {row['operation']:<30} {row['wall_seconds']:>9.4f}s  firestore={fs:<6} yfinance={yf}")
+                results.append(row)
+
+    report = {
+        "meta": {
+            "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "git_revision": _git_revision(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "firestore_latency_ms": args.firestore_latency_ms,
+            "yf_latency_ms": args.yf_latency_ms,
+            "yf_rate_per_second": args.yf_rate_per_second,
+        },
+        "results": results,
+    }
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(RESULTS_DIR, f"bench-{stamp}.json")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"[bench] results written to {output}")
+
+    regressions = check_invariants(report)
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        regressions += compare(report, baseline, args.threshold)
+    for line in regressions:
+        print(f"[bench] REGRESSION {line}")
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Cold-start benchmark for the Streamlit app.
+
+Every measurement runs in a fresh interpreter, like a new Cloud Run instance:
+  - `python -X importtime -c "import TradingApp"`: total import time and the
+    most expensive top-level modules it pulls in
+  - time from interpreter start to the first rendered page (Streamlit AppTest),
+    for the login screen and for a signed-in dashboard on the in-memory backend
+
+Usage (from the repo root):
+    python -m benchmarks.startup
+    python -m benchmarks.startup --repeat 5 --top 15
+    python -m benchmarks.startup --output benchmarks/results/startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Packages the login page should not need
+HEAVY_MODULES = ["yfinance", "pandas", "numpy", "openai", "google.cloud.firestore",
+                 "google.oauth2.id_token", "requests"]
+
+# Runs in the child process; prints one JSON line with the timings
+_PAGE_SCRIPT = r"""
+import json, sys, time
+started = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+streamlit_loaded = time.perf_counter()
+at = AppTest.from_file(sys.argv[1], default_timeout=60)
+if sys.argv[2] == "dashboard":
+    at.session_state["logged_in"] = True
+    at.session_state["user_email"] = "bench@example.com"
+    at.session_state["user_id"] = "bench-user"
+at.run()
+finished = time.perf_counter()
+print(json.dumps({
+    "streamlit_import_seconds": streamlit_loaded - started,
+    "first_page_seconds": finished - started,
+    "app_run_seconds": finished - streamlit_loaded,
+    "exceptions": [e.message for e in at.exception],
+}))
+"""
+
+
+def _child_env():
+    env = dict(os.environ)
+    env.update({
+        "PYTHONPATH": REPO_ROOT + os.pathsep + env.get("PYTHONPATH", ""),
+        # No network or credentials needed: the in-memory backend and a dummy key
+        "STORAGE_BACKEND": "memory",
+        "OPENAI_API_KEY": env.get("OPENAI_API_KEY", "bench"),
+        "ALLOWED_EMAILS": "bench@example.com",
+        "PYTHONDONTWRITEBYTECODE": "1",
+    })
+    return env
+
+
+def measure_imports(top: int):
+    """
+    Parses `-X importtime` output for `import TradingApp`. Returns the total
+    cumulative time and the slowest modules imported directly by the app's modules.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import TradingApp"],
+        cwd=REPO_ROOT, env=_child_env(), capture_output=True, text=True
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        # "import time:  <self> | <cumulative> |   <indented module name>"
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        self_us = int(self_us)
+        name = name[1:]  # the separator's space; the rest of the indent is the nesting depth
+        depth = (len(name) - len(name.lstrip(" "))) // 2
+        rows.append({"module": name.strip(), "self_us": self_us, "cumulative_us": int(cumulative_us), "depth": depth})
+
+    # importtime lists a module's imports right before the module itself
+    app_index = next((i for i, r in enumerate(rows) if r["module"] == "TradingApp"), None)
+    if app_index is None:
+        raise RuntimeError(f"import TradingApp failed:\n{proc.stderr[-2000:]}")
+    start = app_index
+    while start > 0 and rows[start - 1]["depth"] > 0:
+        start -= 1
+    app_rows = rows[start:app_index]
+    direct = sorted((r for r in app_rows if r["depth"] == 1), key=lambda r: r["cumulative_us"], reverse=True)
+    loaded = {r["module"] for r in rows}
+    return {
+        "total_seconds": rows[app_index]["cumulative_us"] / 1e6,
+        "heaviest": [{"module": r["module"], "cumulative_seconds": r["cumulative_us"] / 1e6}
+                     for r in direct[:top]],
+        "loaded_heavy_modules": [m for m in HEAVY_MODULES if m in loaded],
+    }
+
+
+def measure_page(page: str):
+    proc = subprocess.run(
+        [sys.executable, "-c", _PAGE_SCRIPT, os.path.join(REPO_ROOT, "TradingApp.py"), page],
+        cwd=REPO_ROOT, env=_child_env(), capture_output=True, text=True
+    )
+    lines = [line for line in proc.stdout.splitlines() if line.startswith("{")]
+    if proc.returncode != 0 or not lines:
+        raise RuntimeError(f"page benchmark failed:\n{proc.stderr[-2000:]}")
+    return json.loads(lines[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LMTrading cold-start benchmark")
+    parser.add_argument("--repeat", type=int, default=3, help="fresh processes per measurement")
+    parser.add_argument("--top", type=int, default=10, help="slowest imports to list")
+    parser.add_argument("--output", help="also write the results as JSON")
+    args = parser.parse_args()
+
+    imports = [measure_imports(args.top) for _ in range(args.repeat)]
+    report = {
+        "import_seconds_median": statistics.median(r["total_seconds"] for r in imports),
+        "heaviest_imports": imports[-1]["heaviest"],
+        "loaded_heavy_modules": imports[-1]["loaded_heavy_modules"],
+        "pages": {},
+    }
+    print(f"[startup] import TradingApp: {report['import_seconds_median']:.3f}s (median of {args.repeat})")
+    print(f"[startup] heavy modules loaded by the import: {', '.join(report['loaded_heavy_modules']) or 'none'}")
+    for row in report["heaviest_imports"]:
+        print(f"    {row['module']:<40} {row['cumulative_seconds']:>8.3f}s")
+
+    for page in ("login", "dashboard"):
+        runs = [measure_page(page) for _ in range(args.repeat)]
+        report["pages"][page] = {
+            "first_page_seconds_median": statistics.median(r["first_page_seconds"] for r in runs),
+            "app_run_seconds_median": statistics.median(r["app_run_seconds"] for r in runs),
+            "exceptions": runs[-1]["exceptions"],
+        }
+        result = report["pages"][page]
+        print(f"[startup] first {page} page: {result['first_page_seconds_median']:.3f}s "
+              f"(app script {result['app_run_seconds_median']:.3f}s)")
+        for message in result["exceptions"]:
+            print(f"    page raised: {message}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[startup] results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Caching wrapper for the google.auth transport used to verify Google ID tokens.
+
+google.oauth2.id_token downloads Google's public signing certs on every
+verification.  The cert endpoints send Cache-Control: max-age (hours), so
+CachingRequest keeps each successful GET response until it expires and a login
+only pays for the token exchange.  Other requests pass straight through.
+"""
+import re
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from tracing import span
+
+_MAX_AGE = re.compile(r"max-age=(\d+)")
+
+
+def cache_lifetime(headers) -> int:
+    """
+    Seconds a response may be reused per its Cache-Control header; 0 if not cacheable.
+    """
+    cache_control = {k.lower(): v for k, v in (headers or {}).items()}.get("cache-control", "")
+    if "no-store" in cache_control or "no-cache" in cache_control:
+        return 0
+    match = _MAX_AGE.search(cache_control)
+    return int(match.group(1)) if match else 0
+
+
+class CachingRequest:
+    """
+    google.auth.transport.Request-compatible callable around another one
+    (e.g. google.auth.transport.requests.Request on a pooled session).
+    """
+    def __init__(self, request, timeout=None):
+        self._request = request
+        self._timeout = timeout
+        self._cache: Dict[str, Tuple[float, object]] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, url, method="GET", body=None, headers=None, timeout=None, **kwargs):
+        timeout = timeout if timeout is not None else self._timeout
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+        if method != "GET" or body is not None:
+            return self._request(url, method=method, body=body, headers=headers, **kwargs)
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._cache.get(url)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+
+        with span("google_oauth", "fetch_certs"):
+            response = self._request(url, method="GET", headers=headers, **kwargs)
+        lifetime = cache_lifetime(response.headers)
+        if response.status == 200 and lifetime:
+            with self._lock:
+                self._cache[url] = (now + lifetime, response)
+        return response
+
+    def expires_in(self, url: str) -> Optional[float]:
+        """
+        Seconds until the cached response for url goes stale, or None if there is none.
+        """
+        with self._lock:
+            entry = self._cache.get(url)
+        return max(0.0, entry[0] - time.monotonic()) if entry else None
@@ -0,0 +1,102 @@
+"""
+Process-wide registry of API clients, created lazily on first use.
+
+Module globals outlive Streamlit reruns (a module is imported once per process),
+so every session and rerun shares the same clients and their connection pools.
+Nothing is constructed - and the client libraries are not even imported - until
+a code path actually needs the client, which keeps cold starts and the login
+page fast.
+"""
+import os
+import threading
+from typing import Callable, Dict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Outbound HTTP (OAuth token exchange, Google certs): requests has no default timeout
+HTTP_CONNECT_TIMEOUT_SECONDS = float(os.getenv("HTTP_CONNECT_TIMEOUT_SECONDS", "5"))
+HTTP_READ_TIMEOUT_SECONDS = float(os.getenv("HTTP_READ_TIMEOUT_SECONDS", "15"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "10"))
+
+_clients: Dict[str, object] = {}
+# Reentrant: a factory may ask for another client (the auth transport needs the HTTP session)
+_clients_lock = threading.RLock()
+
+
+def _get_or_create(name: str, factory: Callable[[], object]):
+    client = _clients.get(name)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(name)
+            if client is None:
+                print(f"[DEBUG clients] creating {name} client")
+                client = factory()
+                _clients[name] = client
+    return client
+
+
+def get_firestore_client():
+    def _create():
+        from google.cloud import firestore
+        project_id = os.getenv("PROJECT_ID")
+        return firestore.Client(
+            project = project_id,
+            database = project_id
+        )
+    return _get_or_create("firestore", _create)
+
+
+def get_openai_client():
+    def _create():
+        from openai import OpenAI
+        return OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+    return _get_or_create("openai", _create)
+
+
+def get_http_session():
+    """
+    Keep-alive requests.Session shared by the process, with default timeouts.
+    """
+    def _create():
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        class _TimeoutSession(requests.Session):
+            def request(self, method, url, **kwargs):
+                kwargs.setdefault("timeout", (HTTP_CONNECT_TIMEOUT_SECONDS, HTTP_READ_TIMEOUT_SECONDS))
+                return super().request(method, url, **kwargs)
+
+        session = _TimeoutSession()
+        adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+    return _get_or_create("http", _create)
+
+
+def get_google_auth_request():
+    """
+    google.auth transport for verifying ID tokens: uses the pooled session and
+    caches Google's signing certs for as long as their Cache-Control allows.
+    """
+    def _create():
+        from google.auth.transport import requests as google_requests
+        from cert_cache import CachingRequest
+        return CachingRequest(
+            google_requests.Request(session=get_http_session()),
+            timeout=(HTTP_CONNECT_TIMEOUT_SECONDS, HTTP_READ_TIMEOUT_SECONDS)
+        )
+    return _get_or_create("google_auth_request", _create)
+
+
+def set_client(name: str, client):
+    """
+    Replaces a registered client (e.g. with a fake in a benchmark); None drops it
+    so the next get_*_client() call creates a fresh one.
+    """
+    with _clients_lock:
+        if client is None:
+            _clients.pop(name, None)
+        else:
+            _clients[name] = client
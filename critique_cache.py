@@ -0,0 +1,99 @@
+"""
+Local SQLite cache for LLM critiques.
+
+Entries are keyed by a hash of the normalized trade idea, the model name and the
+prompt version, so changing either of the latter two naturally invalidates old
+answers.  Entries expire after a TTL (market context goes stale) and the table
+is trimmed to a maximum size, dropping the least recently used rows first.
+"""
+import hashlib
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CACHE_PATH = os.path.join(BASE_DIR, "data", "critique_cache.sqlite3")
+
+
+def normalize_idea(trade_idea: str) -> str:
+    """
+    Case- and whitespace-insensitive form of an idea, so trivially different
+    submissions of the same text share a cache entry.
+    """
+    return " ".join(trade_idea.split()).casefold()
+
+def make_cache_key(trade_idea: str, model: str, prompt_version: str) -> str:
+    raw = "\x1f".join([normalize_idea(trade_idea), model, prompt_version])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class CritiqueCache:
+    def __init__(self, path: str, ttl_seconds: int, max_entries: int):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS critiques (
+                    key TEXT PRIMARY KEY,
+                    critique TEXT NOT NULL,
+                    decision TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_critiques_last_access ON critiques (last_access)")
+
+    @contextmanager
+    def _connect(self):
+        # One short-lived connection per call keeps this safe across Streamlit threads
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            with conn:  # commits on success, rolls back on error
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key: str) -> Optional[Dict]:
+        """
+        Returns {"critique", "decision"} for a live entry, else None.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT critique, decision, created_at FROM critiques WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            critique, decision, created_at = row
+            if now - created_at > self.ttl_seconds:
+                conn.execute("DELETE FROM critiques WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE critiques SET last_access = ? WHERE key = ?", (now, key))
+        return {"critique": critique, "decision": decision}
+
+    def set(self, key: str, result: Dict):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO critiques (key, critique, decision, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, result["critique"], result["decision"], now, now)
+            )
+            # Expired rows first, then least recently used beyond the size bound
+            conn.execute("DELETE FROM critiques WHERE created_at < ?", (now - self.ttl_seconds,))
+            conn.execute(
+                "DELETE FROM critiques WHERE key IN ("
+                "  SELECT key FROM critiques ORDER BY last_access DESC LIMIT -1 OFFSET ?"
+                ")",
+                (self.max_entries,)
+            )
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM critiques")
@@ -0,0 +1,157 @@
+"""
+Bounded, rate-limited executor for outbound market-data requests.
+
+- At most `max_in_flight` requests run at once (thread pool).
+- A token bucket caps the request rate across all threads.
+- Failed requests are retried with jittered exponential backoff.
+- A per-key circuit breaker stops hammering a symbol that keeps failing.
+"""
+import contextvars
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Hashable, Tuple, Type
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling out when a key's circuit breaker is open."""
+
+
+class TokenBucket:
+    """
+    Allows `rate` acquisitions per second on average, with bursts up to `capacity`.
+    """
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    Opens a key's circuit after `threshold` consecutive failures. While open, calls
+    are refused for `cooldown_seconds`; after that one trial call is let through
+    (half-open) and its outcome closes or re-opens the circuit.
+    """
+    def __init__(self, threshold: int, cooldown_seconds: float):
+        self.threshold = threshold
+        self.cooldown_seconds = cooldown_seconds
+        self._failures: Dict[Hashable, int] = {}
+        self._opened_at: Dict[Hashable, float] = {}
+        self._lock = threading.Lock()
+
+    def allow(self, key: Hashable) -> bool:
+        with self._lock:
+            opened_at = self._opened_at.get(key)
+            if opened_at is None:
+                return True
+            if time.monotonic() - opened_at >= self.cooldown_seconds:
+                # Half-open: let this call through, re-open right away if it fails
+                del self._opened_at[key]
+                self._failures[key] = self.threshold - 1
+                return True
+            return False
+
+    def record_success(self, key: Hashable):
+        with self._lock:
+            self._failures.pop(key, None)
+            self._opened_at.pop(key, None)
+
+    def record_failure(self, key: Hashable):
+        with self._lock:
+            self._failures[key] = self._failures.get(key, 0) + 1
+            if self._failures[key] >= self.threshold:
+                self._opened_at[key] = time.monotonic()
+
+    def is_open(self, key: Hashable) -> bool:
+        with self._lock:
+            opened_at = self._opened_at.get(key)
+            return opened_at is not None and time.monotonic() - opened_at < self.cooldown_seconds
+
+
+class FetchExecutor:
+    def __init__(
+        self,
+        max_in_flight: int = 4,
+        rate_per_second: float = 5.0,
+        max_retries: int = 3,
+        backoff_base_seconds: float = 0.5,
+        breaker_threshold: int = 3,
+        breaker_cooldown_seconds: float = 300.0,
+        non_retryable: Tuple[Type[BaseException], ...] = (ValueError,)
+    ):
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.backoff_base_seconds = backoff_base_seconds
+        self.non_retryable = non_retryable
+        self.bucket = TokenBucket(rate_per_second, capacity=max(1.0, rate_per_second))
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_cooldown_seconds)
+        self._pool = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="fetch")
+
+    def run(self, key: Hashable, fn: Callable, breaker: bool = True):
+        """
+        Calls fn() under the rate limit, retrying failures with jittered backoff.
+        Raises CircuitOpenError without calling fn if key's breaker is open,
+        otherwise the last exception once retries are exhausted.
+        breaker=False skips the circuit breaker, for calls whose key doesn't
+        stand for one symbol (e.g. a bulk download of a changing ticker set).
+        """
+        if breaker and not self.breaker.allow(key):
+            raise CircuitOpenError(f"circuit open for {key}")
+
+        attempt = 0
+        while True:
+            self.bucket.acquire()
+            try:
+                result = fn()
+            except self.non_retryable:
+                # Retrying won't change a definitive answer such as "no data",
+                # but it still counts towards opening the circuit
+                if breaker:
+                    self.breaker.record_failure(key)
+                raise
+            except Exception:
+                attempt += 1
+                if attempt > self.max_retries:
+                    if breaker:
+                        self.breaker.record_failure(key)
+                    raise
+                # Full jitter: sleep somewhere in [0, base * 2^attempt)
+                time.sleep(random.uniform(0, self.backoff_base_seconds * (2 ** attempt)))
+                continue
+            if breaker:
+                self.breaker.record_success(key)
+            return result
+
+    def map(self, calls: Dict[Hashable, Callable], breaker: bool = True) -> Dict[Hashable, object]:
+        """
+        Runs {key: fn} concurrently through run(). Returns {key: result}, where a
+        failed call's result is the exception it raised.
+        """
+        # Each call runs in a copy of the caller's context so tracing spans land in the caller's rerun
+        futures = {
+            key: self._pool.submit(contextvars.copy_context().run, self.run, key, fn, breaker)
+            for key, fn in calls.items()
+        }
+        results = {}
+        for key, future in futures.items():
+            try:
+                results[key] = future.result()
+            except Exception as e:
+                results[key] = e
+        return results
@@ -1,17 +1,11 @@
-from google.cloud import firestore
 import datetime
-from typing import Dict, Optional
-import time
-import os
-from dotenv import load_dotenv
+from collections import defaultdict
+from typing import Dict, Optional, Tuple
 
-load_dotenv()
-project_id = os.getenv("PROJECT_ID")
-
-db = firestore.Client(
-    project = project_id,
-    database = project_id
-)
+# Reads and writes go through the configured storage backend
+# (Firestore by default; see storage/__init__.py for STORAGE_BACKEND).
+from storage import get_backend
+from storage.summary import rebuild_summary, with_derived_fields
 
 #######################################################
 # CORE FIRESTORE DATA STRUCTURES
@@ -22,18 +16,16 @@ def create_user_if_not_exists(user_id: str, email: str) -> Dict:
     Ensures a user document with userId=user_id in 'users' collection.
     Returns the doc data.
     """
-    doc_ref = db.collection("users").document(user_id)
-    doc = doc_ref.get()
-    if doc.exists:
-        return doc.to_dict()
+    backend = get_backend()
+    existing = backend.get_user(user_id)
+    if existing is not None:
+        return existing
     else:
         new_data = {
             "userId": user_id,
-            "email": email,
-            "createdAt": firestore.SERVER_TIMESTAMP
+            "email": email
         }
-        doc_ref.set(new_data)
-        return new_data
+        return backend.create_user(user_id, new_data)
 
 def create_trade_record(
     user_id: str,
@@ -67,11 +59,9 @@ def create_trade_record(
         "closeDate": None,
         "closePrice": None,
         "pnl_usd": None,
-        "return_pct": None,
-        "createdAt": firestore.SERVER_TIMESTAMP
+        "return_pct": None
     }
-    doc_ref = db.collection("trades").add(trade_doc)
-    return doc_ref[1].id if len(doc_ref) > 1 else doc_ref[0].id
+    return get_backend().add_trade(trade_doc)
 
 def schedule_trade_record(
     user_id: str,
@@ -100,127 +90,191 @@ def schedule_trade_record(
         "closeDate": None,
         "closePrice": None,
         "pnl_usd": None,
-        "return_pct": None,
-        "createdAt": firestore.SERVER_TIMESTAMP
+        "return_pct": None
     }
-    doc_ref = db.collection("trades").add(trade_doc)
-    return doc_ref[1].id if len(doc_ref) > 1 else doc_ref[0].id
+    return get_backend().add_trade(trade_doc)
 
-def auto_open_scheduled_trades():
+def auto_open_scheduled_trades(user_id: Optional[str] = None):
     """
-    Queries all trades with pending_open=True and status='scheduled'.
-    If the scheduled_date <= today, finalize them by fetching a historical close price
-    (or using today's close) and setting status='open', entry_price, entry_date, etc.
+    Finalizes scheduled trades (pending_open=True, status='scheduled') whose
+    pending_open_date is today or earlier: sets status='open' with the close of
+    the scheduled date (or the nearest earlier session) as entry price and date.
+    Only due trades are read; each distinct (ticker, date) is priced once, and a
+    trade opened concurrently by another worker is skipped, not opened twice.
+    Pass user_id to only finalize that user's trades.
+    Returns the set of user IDs whose trades were opened (empty if none).
     """
+    from market_data import get_closes_as_of
     today = datetime.date.today()
-    trades_ref = db.collection("trades").where("pending_open", "==", True).where("status", "==", "scheduled")
-    docs = trades_ref.stream()
-
-    changed = False
-    for doc in docs:
-        data = doc.to_dict()
-        sched_date_str = data.get("pending_open_date")
-        if not sched_date_str:
+    backend = get_backend()
+    docs = backend.query_trades(user_id=user_id, status="scheduled", pending_open=True, due_by=today.isoformat())
+
+    # Trades sharing a (ticker, scheduled date) share one price resolution
+    groups = defaultdict(list)
+    for data in docs:
+        groups[(data["ticker"], datetime.date.fromisoformat(data["pending_open_date"]))].append(data["trade_id"])
+    closes, _ = get_closes_as_of(groups)
+
+    updates = {}
+    for pair, trade_ids in groups.items():
+        if pair not in closes:
+            # No data found => leave scheduled for the next run
             continue
-        sched_date = datetime.date.fromisoformat(sched_date_str)
-
-        if sched_date <= today:
-            # We can finalize. Let's do a get_historical_close_on_or_before if you want historical logic
-            # For simplicity, we do a "today's close" approach. Adapt as needed.
-            from market_data import get_historical_close_on_or_before
-            try:
-                close_price, actual_date_used = get_historical_close_on_or_before(data["ticker"], sched_date)
-            except ValueError:
-                # No data found => skip
-                continue
-
-            # If found a price, finalize
-            trade_id = doc.id
-            update_data = {
-                "pending_open": False,
-                "pending_open_date": None,
-                "entryPrice": close_price,
-                "entryDate": actual_date_used.strftime("%Y-%m-%d"),
-                "status": "open"
-            }
-            db.collection("trades").document(trade_id).update(update_data)
-            changed = True
-
-    return changed
+        close_price, actual_date_used = closes[pair]
+        fields = {
+            "pending_open": False,
+            "pending_open_date": None,
+            "entryPrice": close_price,
+            "entryDate": actual_date_used.strftime("%Y-%m-%d"),
+            "status": "open"
+        }
+        for trade_id in trade_ids:
+            updates[trade_id] = fields
+
+    opened = backend.transition_trades(updates, expected_status="scheduled") if updates else []
+    return {trade.get("userId") for trade in opened}
 
 def close_trade_in_firestore(trade_id: str, close_price: float, close_date: str):
     """
     Closes the specified trade doc in Firestore. Computes PnL, return_pct, etc.
+    The check, the write and the user's summary update happen in one transaction.
     """
-    doc_ref = db.collection("trades").document(trade_id)
-    snap = doc_ref.get()
-    if not snap.exists:
-        raise ValueError("Trade not found in Firestore.")
+    from trade_frame import TradeFrame, close_updates
 
-    data = snap.to_dict()
-    if data["status"] == "closed":
-        raise ValueError("Trade is already closed.")
+    def _close(data):
+        if data["status"] == "closed":
+            raise ValueError("Trade is already closed.")
+        return close_updates(TradeFrame.from_records([(trade_id, data)]), close_price, close_date)[trade_id]
 
-    entry_p = data["entryPrice"]
-    shares = data["numShares"]
-    pos_type = data["positionType"]
+    get_backend().transition_trade(trade_id, _close)
 
-    if pos_type == "long":
-        pnl_usd = (close_price - entry_p) * shares
-    else:
-        # short
-        pnl_usd = (entry_p - close_price) * shares
+# Where close_trades_in_firestore takes its close prices from; a {ticker: price}
+# dict (e.g. user-entered prices) is accepted as well
+PRICE_SOURCE_LATEST = "latest"  # latest close, like "Use Today's Close"
+PRICE_SOURCE_AS_OF = "as_of"    # close on close_date, or the nearest earlier session
 
-    if entry_p > 0 and shares > 0:
-        return_pct = (pnl_usd / (entry_p * shares)) * 100
-    else:
-        return_pct = 0
-
-    update_data = {
-        "closeDate": close_date,
-        "closePrice": round(close_price, 2),
-        "pnl_usd": round(pnl_usd, 2),
-        "return_pct": round(return_pct, 2),
-        "status": "closed"
-    }
-    doc_ref.update(update_data)
+def _resolve_close_prices(tickers, price_source, close_date: str) -> Tuple[Dict[str, float], Dict[str, str]]:
+    """
+    ({ticker: price}, {ticker: reason}) with one lookup per distinct ticker.
+    """
+    if isinstance(price_source, dict):
+        prices = {t: float(price_source[t]) for t in tickers if price_source.get(t) is not None}
+        return prices, {t: "No close price entered." for t in tickers if t not in prices}
+    if price_source == PRICE_SOURCE_LATEST:
+        from market_data import get_latest_quotes, QUOTE_FRESH
+        quotes = get_latest_quotes(tickers)
+        # Same rule as get_latest_price: never close on a stale fallback quote
+        prices = {t: q.price for t, q in quotes.items() if q.status == QUOTE_FRESH}
+        return prices, {t: f"Failed to fetch price: {q.error}" for t, q in quotes.items() if t not in prices}
+    if price_source == PRICE_SOURCE_AS_OF:
+        from market_data import get_closes_as_of
+        target = datetime.date.fromisoformat(close_date)
+        closes, errors = get_closes_as_of((t, target) for t in tickers)
+        prices = {t: closes[(t, target)][0] for t in tickers if (t, target) in closes}
+        return prices, {t: errors.get((t, target), "No close found.") for t in tickers if t not in prices}
+    raise ValueError(f"Unknown price source: {price_source}")
 
-def update_unrealized_pnl():
+def close_trades_in_firestore(user_id: str, trade_ids, price_source, close_date: str) -> Tuple[list, Dict[str, str]]:
     """
-    On every rerun, fetch the latest close for open trades, recalc unrealized PnL.
+    Closes many of the user's open trades at once: one query for the trades, one
+    price lookup per distinct ticker, PnL for all of them in one array pass, and
+    conditional transactional commits (a trade closed meanwhile is skipped).
+    Rounding matches close_trade_in_firestore.
+    Returns (closed trades, {trade_id: reason} for those left open).
     """
-    from market_data import get_latest_price
-    open_query = db.collection("trades").where("status", "==", "open")
-    docs = open_query.stream()
+    import numpy as np
+    from trade_frame import close_updates
+    wanted = set(trade_ids)
+    frame = get_backend().query_trade_frame(user_id=user_id, status="open")
+    frame = frame.filter(np.fromiter((t in wanted for t in frame.trade_id), bool, len(frame)))
+    errors = {trade_id: "Not an open position." for trade_id in wanted - set(frame.trade_id.tolist())}
 
-    for doc in docs:
-        data = doc.to_dict()
-        trade_id = doc.id
-        ticker = data["ticker"]
-        pos_type = data["positionType"]
-        entry_p = data["entryPrice"]
-        shares = data["numShares"]
+    prices, price_errors = _resolve_close_prices(set(frame.ticker.tolist()), price_source, close_date)
+    for trade_id, ticker in zip(frame.trade_id.tolist(), frame.ticker.tolist()):
+        if ticker in price_errors:
+            errors[trade_id] = price_errors[ticker]
+    close_prices = frame.by_ticker(prices)
+    priced = ~np.isnan(close_prices)
+    if not priced.any():
+        return [], errors
 
-        # if we can't fetch, default to entry
-        try:
-            current_price = get_latest_price(ticker)
-        except:
-            current_price = entry_p
+    updates = close_updates(frame.filter(priced), close_prices[priced], close_date)
+    closed = get_backend().transition_trades(updates, expected_status="open")
+    for trade_id in updates.keys() - {t["trade_id"] for t in closed}:
+        errors[trade_id] = "Trade is already closed."
+    return closed, errors
 
-        if pos_type == "long":
-            unrealized_usd = (current_price - entry_p) * shares
-        else:
-            unrealized_usd = (entry_p - current_price) * shares
+def update_unrealized_pnl(user_id: Optional[str] = None):
+    """
+    Fetch the latest close for open trades, recalc unrealized PnL.
+    Pass user_id to only refresh that user's trades.
+    Prices are fetched once per distinct ticker in bulk, PnL is computed for all
+    trades in one array pass, and only trades whose rounded values changed are
+    written back (in batches).
+    Each trade records whether its mark is 'fresh', 'stale' (last good price) or
+    'failed' (no price; previous PnL left untouched).
+    Returns the number of trades updated.
+    """
+    import numpy as np
+    from market_data import get_latest_quotes, QUOTE_FAILED
+    from trade_frame import rounded
+    backend = get_backend()
+    frame = backend.query_trade_frame(user_id=user_id, status="open")
+    if not len(frame):
+        return 0
+
+    quotes = get_latest_quotes(set(frame.ticker.tolist()))
+    for ticker, quote in quotes.items():
+        if quote.status == QUOTE_FAILED:
+            print(f"[DEBUG update_unrealized_pnl] {ticker}: {quote.error}")
+
+    mark_price = frame.by_ticker({t: q.price for t, q in quotes.items() if q.status != QUOTE_FAILED})
+    mark_status = frame.by_ticker({t: q.status for t, q in quotes.items()}, numeric=False)
+    mark_as_of = frame.by_ticker(
+        {t: q.as_of.isoformat() if q.as_of else None for t, q in quotes.items()}, numeric=False
+    )
+    unrealized_usd, unrealized_pct = frame.pnl_at(mark_price)
+    new_values = {
+        "unrealized_pnl_usd": np.array(rounded(unrealized_usd)),
+        "unrealized_return_pct": np.array(rounded(unrealized_pct)),
+        "mark_price": np.array(rounded(mark_price)),
+        "mark_status": mark_status,                      # "fresh", "stale" or "failed"
+        "mark_as_of": mark_as_of,
+    }
+
+    # No price at all => keep the previous PnL and only flag the mark
+    failed = mark_status == QUOTE_FAILED
+    # Skip the write entirely if nothing moved since the last refresh
+    unchanged = frame.mark_status == mark_status
+    for field in ("unrealized_pnl_usd", "unrealized_return_pct", "mark_price", "mark_as_of"):
+        unchanged &= failed | (frame.columns[field] == new_values[field])
 
-        if entry_p > 0 and shares > 0:
-            unrealized_pct = (unrealized_usd / (entry_p * shares)) * 100
+    written = {field: column.tolist() for field, column in new_values.items()}
+    updates = {}
+    for i in np.flatnonzero(~unchanged).tolist():
+        if failed[i]:
+            updates[frame.trade_id[i]] = {"mark_status": QUOTE_FAILED}
         else:
-            unrealized_pct = 0
+            updates[frame.trade_id[i]] = {field: values[i] for field, values in written.items()}
 
-        db.collection("trades").document(trade_id).update({
-            "unrealized_pnl_usd": round(unrealized_usd, 2),
-            "unrealized_return_pct": round(unrealized_pct, 2)
-        })
+    return backend.commit_trade_updates(updates)
+
+
+#######################################################
+# Background worker lock
+#######################################################
+def acquire_worker_lock(name: str, owner: str, ttl_seconds: int) -> bool:
+    """
+    Takes (or renews) a lease on worker lock `name` for `owner`.
+    Returns False if another owner holds a lease that hasn't expired yet.
+    """
+    return get_backend().acquire_lock(name, owner, ttl_seconds)
+
+def release_worker_lock(name: str, owner: str):
+    """
+    Drops the lease on worker lock `name` if `owner` still holds it.
+    """
+    get_backend().release_lock(name, owner)
 
 
 #######################################################
@@ -230,24 +284,80 @@ def get_user_open_positions(user_id: str) -> list:
     """
     Return open trades for the user.
     """
-    q = db.collection("trades").where("userId", "==", user_id).where("status", "==", "open")
-    docs = q.stream()
-    results = []
-    for d in docs:
-        item = d.to_dict()
-        item["trade_id"] = d.id
-        results.append(item)
-    return results
+    return get_backend().query_trades(user_id=user_id, status="open")
 
 def get_user_closed_positions(user_id: str) -> list:
     """
     Return closed trades for the user.
     """
-    q = db.collection("trades").where("userId", "==", user_id).where("status", "==", "closed")
-    docs = q.stream()
-    results = []
-    for d in docs:
-        item = d.to_dict()
-        item["trade_id"] = d.id
-        results.append(item)
-    return results
+    return get_backend().query_trades(user_id=user_id, status="closed")
+
+def get_user_closed_positions_page(
+    user_id: str,
+    page_size: int = 25,
+    cursor: Optional[Tuple] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    ticker: Optional[str] = None
+) -> Tuple[list, Optional[Tuple]]:
+    """
+    One page of closed trades, most recently closed first, optionally limited to a
+    closeDate range (ISO dates, inclusive) and a ticker. Returns (trades, cursor
+    for the next page or None).
+    """
+    return get_backend().query_trades_page(
+        user_id, "closed", "closeDate", page_size, start_after=cursor,
+        start_date=start_date, end_date=end_date, ticker=ticker or None
+    )
+
+def get_user_closed_totals(
+    user_id: str,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    ticker: Optional[str] = None
+) -> Dict:
+    """
+    Trade count, total PnL and average return of the closed trades matching the
+    same filters, aggregated by the backend rather than from fetched pages.
+    """
+    totals = get_backend().aggregate_trades(
+        user_id, "closed", "closeDate", start_date=start_date, end_date=end_date, ticker=ticker or None
+    )
+    totals["pnl_usd"] = round(totals["pnl_usd"], 2)
+    if totals["avg_return_pct"] is not None:
+        totals["avg_return_pct"] = round(totals["avg_return_pct"], 2)
+    return totals
+
+#######################################################
+# USER SUMMARIES
+#######################################################
+
+def get_user_summary(user_id: str) -> Dict:
+    """
+    The user's portfolio summary (counts, realized PnL, win rate, open exposure)
+    in one document read. Users without one yet get it built from their trades.
+    """
+    backend = get_backend()
+    summary = backend.get_summary(user_id)
+    if summary is None:
+        summary = backend.ensure_summary(user_id)
+    return with_derived_fields(summary)
+
+def rebuild_user_summaries(user_id: Optional[str] = None) -> Dict[str, Dict]:
+    """
+    Recomputes summaries from the trades (one user, or everyone who has trades)
+    and overwrites the stored ones. Writes racing the rebuild can be lost, so run
+    it while the app is quiet. Returns {user_id: summary}.
+    """
+    backend = get_backend()
+    trades_by_user = {user_id: []} if user_id is not None else {}
+    for trade in backend.query_trades(user_id=user_id):
+        trades_by_user.setdefault(trade.get("userId"), []).append(trade)
+
+    summaries = {}
+    for uid, trades in trades_by_user.items():
+        if uid is None:
+            continue
+        summaries[uid] = rebuild_summary(trades)
+        backend.put_summary(uid, summaries[uid])
+    return summaries
@@ -1,13 +1,30 @@
-from openai import OpenAI
+from openai import AsyncOpenAI, APIConnectionError, APIStatusError, APITimeoutError
+import asyncio
 import os
+import random
+from typing import Callable, List, Optional
 from dotenv import load_dotenv
 
+from clients import get_openai_client
+from tracing import span
+from critique_cache import CritiqueCache, DEFAULT_CACHE_PATH, make_cache_key
+
 load_dotenv()  # This is the default and can be omitted
-client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+# The OpenAI client itself is created on first use (see clients.py)
+
+MODEL_NAME = "gpt-4o-mini"  # Example name; replace with an actual available model
+# Bump whenever the prompt below changes so cached critiques from the old prompt are ignored
+PROMPT_VERSION = "1"
+
+critique_cache = CritiqueCache(
+    path=os.getenv("CRITIQUE_CACHE_PATH", DEFAULT_CACHE_PATH),
+    ttl_seconds=int(os.getenv("CRITIQUE_CACHE_TTL_SECONDS", str(6 * 60 * 60))),
+    max_entries=int(os.getenv("CRITIQUE_CACHE_MAX_ENTRIES", "1000"))
+)
 
 # Implement a get_critique function using specific prompt engineering (subject to change depending on the quality of
 # the responses
-def get_critique_and_decision(trade_idea: str) -> dict:
+def get_critique_and_decision(trade_idea: str, force_refresh: bool = False) -> dict:
     """
     Takes a trade idea and returns both a critique and a final decision:
     either 'FOLLOW' or 'REJECT'.
@@ -17,8 +34,23 @@ def get_critique_and_decision(trade_idea: str) -> dict:
         "critique": "...",
         "decision": "FOLLOW" or "REJECT"
       }
+
+    Answers are cached per (normalized idea, model, prompt version) for
+    CRITIQUE_CACHE_TTL_SECONDS; force_refresh=True skips the cache lookup.
     """
-    prompt = f"""
+    cache_key = make_cache_key(trade_idea, MODEL_NAME, PROMPT_VERSION)
+    if not force_refresh:
+        cached = critique_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    result = _request_critique(trade_idea)
+    if result["decision"] != "ERROR":
+        critique_cache.set(cache_key, result)
+    return result
+
+def _build_prompt(trade_idea: str) -> str:
+    return f"""
     You are an expert hedge fund proprietary trader who manages your client's money. In fact, you are the 
     top-of-the-world type of trader who is highly responsible for your client's money and understands all aspects of 
     the financial market in-and-out. You are also excellent at managing all kinds of risks so that your client's 
@@ -60,38 +92,171 @@ def get_critique_and_decision(trade_idea: str) -> dict:
     section.
     """
 
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",  # Example name; replace with an actual available model
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=500,
-            temperature=0.7
-        )
-
-        content = response.choices[0].message.content.strip()
-
-        # We'll do a simple parse: everything before "DECISION:" is critique,
-        # everything after is the final decision
-        # (Assumes the model follows the requested format!)
-        lines = content.split("DECISION:")
-
-        # If the LLM doesn't follow the format perfectly, handle gracefully:
-        if len(lines) < 2:
-            return {
-                "critique": content,
-                "decision": "UNKNOWN"
-            }
-
-        critique_part = lines[0].replace("CRITIQUE:", "").strip()
-        decision_part = lines[1].strip().upper()  # e.g. "FOLLOW" or "REJECT"
+def _parse_critique(content: str) -> dict:
+    """
+    Splits the model's full answer into {"critique", "decision"}.
+    """
+    content = content.strip()
+
+    # We'll do a simple parse: everything before "DECISION:" is critique,
+    # everything after is the final decision
+    # (Assumes the model follows the requested format!)
+    lines = content.split("DECISION:")
 
+    # If the LLM doesn't follow the format perfectly, handle gracefully:
+    if len(lines) < 2:
         return {
-            "critique": critique_part,
-            "decision": decision_part
+            "critique": content,
+            "decision": "UNKNOWN"
         }
 
+    critique_part = lines[0].replace("CRITIQUE:", "").strip()
+    decision_part = lines[1].strip().upper()  # e.g. "FOLLOW" or "REJECT"
+
+    return {
+        "critique": critique_part,
+        "decision": decision_part
+    }
+
+def _request_critique(trade_idea: str) -> dict:
+    """
+    Makes the actual OpenAI call for get_critique_and_decision.
+    """
+    try:
+        with span("openai", "chat_completion"):
+            response = get_openai_client().chat.completions.create(
+                model=MODEL_NAME,
+                messages=[{"role": "user", "content": _build_prompt(trade_idea)}],
+                max_tokens=500,
+                temperature=0.7
+            )
+        return _parse_critique(response.choices[0].message.content)
+
     except Exception as e:
         return {
             "critique": f"Error: {e}",
             "decision": "ERROR"
-        }
\ No newline at end of file
+        }
+
+
+class CritiqueStream:
+    """
+    Iterate to receive the critique text as it is generated (e.g. pass it to
+    st.write_stream). Once exhausted, `result` holds the parsed
+    {"critique", "decision"} dict, which is also cached.
+    """
+    def __init__(self, trade_idea: str, force_refresh: bool = False):
+        self.trade_idea = trade_idea
+        self.cache_key = make_cache_key(trade_idea, MODEL_NAME, PROMPT_VERSION)
+        self.result = None if force_refresh else critique_cache.get(self.cache_key)
+        self.from_cache = self.result is not None
+
+    def __iter__(self):
+        if self.from_cache:
+            yield self.result["critique"]
+            return
+
+        chunks = []
+        try:
+            # The span covers the whole generation, not just time to first token
+            with span("openai", "chat_completion_stream"):
+                stream = get_openai_client().chat.completions.create(
+                    model=MODEL_NAME,
+                    messages=[{"role": "user", "content": _build_prompt(self.trade_idea)}],
+                    max_tokens=500,
+                    temperature=0.7,
+                    stream=True
+                )
+                for event in stream:
+                    if not event.choices:
+                        continue
+                    delta = event.choices[0].delta.content
+                    if delta:
+                        chunks.append(delta)
+                        yield delta
+        except Exception as e:
+            error_text = f"Error: {e}"
+            yield error_text
+            self.result = {"critique": error_text, "decision": "ERROR"}
+            return
+
+        # Decision parsing only makes sense on the completed text
+        self.result = _parse_critique("".join(chunks))
+        critique_cache.set(self.cache_key, self.result)
+
+def stream_critique_and_decision(trade_idea: str, force_refresh: bool = False) -> CritiqueStream:
+    """
+    Streaming variant of get_critique_and_decision; see CritiqueStream.
+    """
+    return CritiqueStream(trade_idea, force_refresh=force_refresh)
+
+
+#######################################################
+# Batch critiques
+#######################################################
+def _is_retryable(error: Exception) -> bool:
+    # 429 (rate limit) and 5xx are worth retrying; other 4xx are not
+    if isinstance(error, (APITimeoutError, APIConnectionError)):
+        return True
+    return isinstance(error, APIStatusError) and (error.status_code == 429 or error.status_code >= 500)
+
+def critique_many(
+    ideas: List[str],
+    max_concurrency: int = 5,
+    timeout_seconds: float = 60.0,
+    max_retries: int = 3,
+    force_refresh: bool = False,
+    on_result: Optional[Callable[[int, dict], None]] = None
+) -> List[dict]:
+    """
+    Critiques many ideas concurrently and returns their results in input order.
+    - At most max_concurrency requests are in flight at once.
+    - Each request is cut off after timeout_seconds.
+    - 429 / 5xx / timeouts are retried up to max_retries times with jittered backoff.
+    - Cached critiques are reused unless force_refresh=True.
+    on_result(index, result) is called as each idea completes, e.g. to fill a table.
+    """
+    return asyncio.run(_critique_many_async(
+        ideas, max_concurrency, timeout_seconds, max_retries, force_refresh, on_result
+    ))
+
+async def _critique_many_async(ideas, max_concurrency, timeout_seconds, max_retries, force_refresh, on_result):
+    results: List[Optional[dict]] = [None] * len(ideas)
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    # The async client's connection pool is tied to this event loop, so it lives
+    # only for the duration of the batch. Retries are handled below, not by the SDK.
+    async with AsyncOpenAI(api_key=os.environ.get("OPENAI_API_KEY"), max_retries=0) as aclient:
+
+        async def _one(index: int, idea: str):
+            cache_key = make_cache_key(idea, MODEL_NAME, PROMPT_VERSION)
+            result = None if force_refresh else critique_cache.get(cache_key)
+            attempt = 0
+            while result is None:
+                try:
+                    async with semaphore:
+                        with span("openai", "chat_completion_async"):
+                            response = await aclient.chat.completions.create(
+                                model=MODEL_NAME,
+                                messages=[{"role": "user", "content": _build_prompt(idea)}],
+                                max_tokens=500,
+                                temperature=0.7,
+                                timeout=timeout_seconds
+                            )
+                    result = _parse_critique(response.choices[0].message.content)
+                    critique_cache.set(cache_key, result)
+                except Exception as e:
+                    attempt += 1
+                    if not _is_retryable(e) or attempt > max_retries:
+                        result = {"critique": f"Error: {e}", "decision": "ERROR"}
+                        break
+                    # Back off outside the semaphore so other ideas keep flowing
+                    await asyncio.sleep(random.uniform(0, 2 ** attempt))
+
+            results[index] = result
+            if on_result is not None:
+                on_result(index, result)
+
+        await asyncio.gather(*(_one(i, idea) for i, idea in enumerate(ideas)))
+
+    return results
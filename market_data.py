@@ -1,43 +1,405 @@
 import yfinance as yf
+import numpy as np
+import pandas as pd
 import datetime
+import os
+import threading
+from collections import OrderedDict
+from functools import partial
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+from zoneinfo import ZoneInfo
 
-def get_latest_price(ticker_symbol: str) -> float:
-    try:
-        ticker_data = yf.Ticker(ticker_symbol)
-        last_day_data = ticker_data.history(period="1d")
+from bar_store import BarStore, DEFAULT_BAR_STORE_DIR
+from fetch_executor import FetchExecutor
+from tracing import span, traced
+
+#######################################################
+# Process-wide price cache
+#######################################################
+MARKET_TZ = ZoneInfo("America/New_York")
+MARKET_OPEN = datetime.time(9, 30)
+MARKET_CLOSE = datetime.time(16, 0)
+
+PRICE_CACHE_MAX_ENTRIES = int(os.getenv("PRICE_CACHE_MAX_ENTRIES", "2048"))
+# How long a latest quote is reused while the market is open
+QUOTE_TTL_SECONDS = int(os.getenv("PRICE_CACHE_QUOTE_TTL_SECONDS", "60"))
+
+
+class PriceCache:
+    """
+    Thread-safe LRU cache where each entry carries its own expiry time
+    (a UTC datetime, or None to keep it until it is evicted).
+    """
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """
+        Returns the cached value, or None if it is missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > _utcnow():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value, expires_at: Optional[datetime.datetime]):
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+
+_price_cache = PriceCache(PRICE_CACHE_MAX_ENTRIES)
+
+
+def get_price_cache_stats() -> Dict[str, int]:
+    """
+    Hit / miss / eviction counters of the process-wide price cache.
+    """
+    return _price_cache.stats()
+
+def clear_price_cache():
+    _price_cache.clear()
+
+def _utcnow() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+def _is_market_open(now_et: datetime.datetime) -> bool:
+    # Regular NYSE session; exchange holidays are treated as normal weekdays
+    return now_et.weekday() < 5 and MARKET_OPEN <= now_et.time() < MARKET_CLOSE
+
+def _next_market_open(now_et: datetime.datetime) -> datetime.datetime:
+    day = now_et.date()
+    if now_et.time() >= MARKET_OPEN:
+        day += datetime.timedelta(days=1)
+    while day.weekday() >= 5:
+        day += datetime.timedelta(days=1)
+    return datetime.datetime.combine(day, MARKET_OPEN, tzinfo=MARKET_TZ)
+
+def _quote_expiry() -> datetime.datetime:
+    """
+    A latest quote is fresh for QUOTE_TTL_SECONDS during the session.
+    Once the market has closed it cannot change until the next open.
+    """
+    now_et = datetime.datetime.now(MARKET_TZ)
+    if _is_market_open(now_et):
+        return _utcnow() + datetime.timedelta(seconds=QUOTE_TTL_SECONDS)
+    return _next_market_open(now_et).astimezone(datetime.timezone.utc)
+
+def _is_settled(target_date: datetime.date) -> bool:
+    """
+    True once target_date's close is final, i.e. the day is over in New York.
+    """
+    now_et = datetime.datetime.now(MARKET_TZ)
+    today_et = now_et.date()
+    if target_date < today_et:
+        return True
+    return target_date == today_et and not _is_market_open(now_et) and now_et.time() >= MARKET_OPEN
+
+
+def _last_settled_date() -> datetime.date:
+    """
+    The most recent day whose close can no longer change.
+    """
+    today_et = datetime.datetime.now(MARKET_TZ).date()
+    return today_et if _is_settled(today_et) else today_et - datetime.timedelta(days=1)
+
+
+#######################################################
+# Outbound request executor
+#######################################################
+# Every yfinance call goes through here: bounded concurrency, a shared rate
+# limit, retries with jittered backoff and a per-symbol circuit breaker.
+_fetcher = FetchExecutor(
+    max_in_flight=int(os.getenv("MARKET_DATA_MAX_IN_FLIGHT", "4")),
+    rate_per_second=float(os.getenv("MARKET_DATA_RATE_PER_SECOND", "5")),
+    max_retries=int(os.getenv("MARKET_DATA_MAX_RETRIES", "3")),
+    breaker_threshold=int(os.getenv("MARKET_DATA_BREAKER_THRESHOLD", "3")),
+    breaker_cooldown_seconds=float(os.getenv("MARKET_DATA_BREAKER_COOLDOWN_SECONDS", "300"))
+)
+# Tickers per yf.download call when refreshing many quotes
+BULK_CHUNK_SIZE = 50
+
+
+#######################################################
+# Local daily bar store
+#######################################################
+BAR_STORE_DIR = os.getenv("BAR_STORE_DIR", DEFAULT_BAR_STORE_DIR)
 
-        if last_day_data.empty:
-            raise ValueError(f"Invalid or no data for ticker: {ticker_symbol}")
+def _fetch_daily_bars(ticker: str, start_date: datetime.date, end_date: datetime.date) -> pd.DataFrame:
+    def _history():
+        with span("yfinance", "history_range"):
+            # yfinance end is exclusive
+            return yf.Ticker(ticker).history(start=start_date, end=end_date + datetime.timedelta(days=1))
+    return _fetcher.run(("bars", ticker), _history)
 
-        return last_day_data["Close"].iloc[-1]
+_bar_store = BarStore(BAR_STORE_DIR, _fetch_daily_bars)
 
-    except Exception as e:
-        # e.g., Network error, etc.
-        raise RuntimeError(f"Failed to fetch price for {ticker_symbol}. Reason: {e}")
+
+#######################################################
+# Price lookups
+#######################################################
+QUOTE_FRESH = "fresh"    # fetched now, or still within its cache lifetime
+QUOTE_STALE = "stale"    # fetch failed; last known good price is returned instead
+QUOTE_FAILED = "failed"  # fetch failed and there is nothing to fall back to
+
+class Quote(NamedTuple):
+    price: Optional[float]
+    status: str
+    as_of: Optional[datetime.date]  # trading day the price is the close of
+    error: Optional[str] = None
+
+# Last good quote per ticker, kept past its cache lifetime to serve stale marks
+_last_good_quotes = PriceCache(PRICE_CACHE_MAX_ENTRIES)
+
+
+def _last_close(df: pd.DataFrame) -> Tuple[float, datetime.date]:
+    closes = df["Close"].dropna() if df is not None and not df.empty else None
+    if closes is None or closes.empty:
+        raise ValueError("no close price in response")
+    return float(closes.iloc[-1]), closes.index[-1].date()
+
+@traced("yfinance", "download")
+def _download_chunk(tickers) -> pd.DataFrame:
+    # A few days of bars so tickers on different exchange calendars all have a last close
+    return yf.download(
+        tickers,
+        period="5d",
+        group_by="ticker",
+        auto_adjust=True,
+        progress=False,
+        threads=True
+    )
+
+def _quote_from_chunk(df: pd.DataFrame, ticker: str) -> Tuple[float, datetime.date]:
+    if df is None or df.empty:
+        raise ValueError("no data returned")
+    if isinstance(df.columns, pd.MultiIndex):
+        if ticker not in df.columns.get_level_values(0):
+            raise ValueError("ticker missing from bulk response")
+        return _last_close(df[ticker])
+    return _last_close(df)
+
+def _fetch_one(ticker: str) -> Tuple[float, datetime.date]:
+    with span("yfinance", "history"):
+        df = yf.Ticker(ticker).history(period="5d")
+    return _last_close(df)
+
+def _fallback_quote(ticker: str, reason: str) -> Quote:
+    last_good = _last_good_quotes.get(ticker)
+    if last_good is not None:
+        return last_good._replace(status=QUOTE_STALE, error=reason)
+    return Quote(None, QUOTE_FAILED, None, reason)
+
+def get_latest_quotes(tickers: Iterable[str]) -> Dict[str, Quote]:
+    """
+    Fetches the latest close for many tickers and returns {ticker: Quote}.
+    - Duplicate tickers are only requested once; cached quotes are not requested at all.
+    - Tickers are fetched in bulk yf.download calls (BULK_CHUNK_SIZE per call),
+      and any ticker missing from its bulk response is retried on its own.
+    - A ticker that can't be fetched falls back to its last good quote marked
+      'stale', or is marked 'failed' if there is none.
+    """
+    quotes = {}
+    missing = []
+    for t in sorted({t for t in tickers if t}):
+        cached = _price_cache.get(("latest", t))
+        if cached is not None:
+            quotes[t] = cached
+        elif _fetcher.breaker.is_open(("quote", t)):
+            quotes[t] = _fallback_quote(t, "circuit open after repeated failures")
+        else:
+            missing.append(t)
+    if not missing:
+        return quotes
+
+    fetched = {}
+    errors = {}
+    chunks = [missing[i:i + BULK_CHUNK_SIZE] for i in range(0, len(missing), BULK_CHUNK_SIZE)]
+    # A chunk's key covers a different ticker set on every call, so bulk downloads
+    # skip the breaker; per-ticker failures are counted by the single fetches below
+    bulk_results = _fetcher.map({
+        ("bulk", i): partial(_download_chunk, chunk) for i, chunk in enumerate(chunks)
+    }, breaker=False)
+    for i, chunk in enumerate(chunks):
+        df = bulk_results[("bulk", i)]
+        for t in chunk:
+            if isinstance(df, Exception):
+                errors[t] = f"Bulk download failed: {df}"
+                continue
+            try:
+                fetched[t] = _quote_from_chunk(df, t)
+                _fetcher.breaker.record_success(("quote", t))
+            except ValueError as e:
+                errors[t] = str(e)
+
+    # Second chance, one request per ticker, with the executor's retries
+    if errors:
+        single_results = _fetcher.map({("quote", t): partial(_fetch_one, t) for t in errors})
+        for (_, t), result in single_results.items():
+            if isinstance(result, Exception):
+                errors[t] = f"Invalid or no data for ticker: {t} ({result})"
+            else:
+                fetched[t] = result
+                del errors[t]
+
+    expires_at = _quote_expiry()
+    for t, (price, as_of) in fetched.items():
+        quote = Quote(price, QUOTE_FRESH, as_of)
+        quotes[t] = quote
+        _price_cache.set(("latest", t), quote, expires_at)
+        _last_good_quotes.set(t, quote, None)
+    for t, reason in errors.items():
+        quotes[t] = _fallback_quote(t, reason)
+
+    return quotes
+
+def get_latest_price(ticker_symbol: str) -> float:
+    """
+    Latest close for one ticker. Raises RuntimeError unless a fresh quote is available.
+    """
+    quote = get_latest_quotes([ticker_symbol])[ticker_symbol]
+    if quote.status != QUOTE_FRESH:
+        raise RuntimeError(f"Failed to fetch price for {ticker_symbol}. Reason: {quote.error}")
+    return quote.price
+
+def get_latest_prices(tickers: Iterable[str]) -> Tuple[Dict[str, float], Dict[str, str]]:
+    """
+    Price-only view of get_latest_quotes. Returns (prices, errors):
+    - prices maps each ticker that resolved (fresh or stale) to its latest close.
+    - errors maps each ticker that could not be priced at all to a reason string.
+    """
+    prices = {}
+    errors = {}
+    for t, quote in get_latest_quotes(tickers).items():
+        if quote.status == QUOTE_FAILED:
+            errors[t] = quote.error
+        else:
+            prices[t] = quote.price
+    return prices, errors
+
+# How far back an as-of lookup may go to find the previous trading day's close
+AS_OF_LOOKBACK_DAYS = 60
 
 def get_historical_close_on_or_before(ticker: str, target_date: datetime.date) -> (float, datetime.date):
     """
     Returns (close_price, actual_date_used).
     - If target_date's close price is available, return it.
-    - Otherwise, go backward day by day until you find a valid close.
+    - Otherwise, use the closest earlier close within AS_OF_LOOKBACK_DAYS.
     - Raises ValueError if no data is found in the lookback window.
+    Results for settled days are cached for the life of the process.
+    """
+    closes, errors = get_closes_as_of([(ticker, target_date)])
+    if (ticker, target_date) in errors:
+        raise ValueError(errors[(ticker, target_date)])
+    return closes[(ticker, target_date)]
+
+def get_closes_as_of(
+    pairs: Iterable[Tuple[str, datetime.date]]
+) -> Tuple[Dict[Tuple[str, datetime.date], Tuple[float, datetime.date]], Dict[Tuple[str, datetime.date], str]]:
+    """
+    Resolves many (ticker, target_date) pairs to their close on or before target_date.
+    Returns (closes, errors):
+    - closes maps each resolved pair to (close_price, actual_date_used).
+    - errors maps each unresolved pair to a reason string.
+    Each ticker is read from the bar store once, covering all of its dates, and
+    its dates are resolved together with a sorted-index search.
+    """
+    closes = {}
+    errors = {}
+    dates_by_ticker = {}
+    for ticker, target_date in set(pairs):
+        cached = _price_cache.get(("close_on_or_before", ticker, target_date))
+        if cached is not None:
+            closes[(ticker, target_date)] = cached
+        else:
+            dates_by_ticker.setdefault(ticker, []).append(target_date)
+
+    settled_through = _last_settled_date()
+    for ticker, target_dates in dates_by_ticker.items():
+        target_dates.sort()
+        start_date = target_dates[0] - datetime.timedelta(days=AS_OF_LOOKBACK_DAYS)
+
+        df = _bar_store.get_bars(ticker, start_date, target_dates[-1], settled_through=settled_through)
+        if df.empty:
+            for target_date in target_dates:
+                errors[(ticker, target_date)] = (
+                    f"No historical data for {ticker} in range "
+                    f"{target_date - datetime.timedelta(days=AS_OF_LOOKBACK_DAYS)} to {target_date}."
+                )
+            continue
+
+        bar_days = df.index.values.astype("datetime64[D]")
+        targets = np.array(target_dates, dtype="datetime64[D]")
+        # Position of the last bar on or before each target
+        positions = np.searchsorted(bar_days, targets, side="right") - 1
+        found_days = bar_days[np.maximum(positions, 0)]
+        valid = (positions >= 0) & (targets - found_days <= np.timedelta64(AS_OF_LOOKBACK_DAYS, "D"))
+        close_values = df["Close"].to_numpy()[np.maximum(positions, 0)]
+
+        for i, target_date in enumerate(target_dates):
+            key = (ticker, target_date)
+            if not valid[i]:
+                errors[key] = f"No available close data on or before {target_date} for {ticker}."
+                continue
+            result = (float(close_values[i]), found_days[i].astype(datetime.date))
+            closes[key] = result
+            # A close that is still forming is only reused like a latest quote
+            _price_cache.set(("close_on_or_before",) + key, result,
+                             None if _is_settled(target_date) else _quote_expiry())
+
+    return closes, errors
+
+def get_close_matrix(
+    tickers: Iterable[str],
+    start_date: datetime.date,
+    end_date: Optional[datetime.date] = None
+) -> Tuple[pd.DataFrame, Dict[str, str]]:
+    """
+    Daily closes for start_date..end_date as a date x ticker DataFrame, read from
+    the bar store.  Rows are the union of the tickers' trading days; a ticker
+    without a bar on some day has NaN there.  end_date defaults to the last
+    settled session, so repeated calls are served from disk.
+    Returns (matrix, errors) where errors maps tickers without any data to a reason.
     """
-    # We'll search ~60 days prior to target_date just to be safe
-    start_date = target_date - datetime.timedelta(days=60)
-    end_date = target_date + datetime.timedelta(days=1)  # yfinance end is exclusive
-
-    df = yf.Ticker(ticker).history(start=start_date, end=end_date)
-    if df.empty:
-        raise ValueError(f"No historical data for {ticker} in range {start_date} to {target_date}.")
-
-    curr_date = target_date
-    while curr_date >= start_date:
-        date_str = curr_date.strftime("%Y-%m-%d")
-        # Compare with df's DatetimeIndex
-        if date_str in df.index.strftime("%Y-%m-%d"):
-            row = df.loc[df.index.strftime("%Y-%m-%d") == date_str]
-            close_price = row["Close"].iloc[0]
-            return (float(close_price), curr_date)
-        curr_date -= datetime.timedelta(days=1)
-
-    raise ValueError(f"No available close data on or before {target_date} for {ticker}.")
\ No newline at end of file
+    end_date = end_date or _last_settled_date()
+    settled_through = _last_settled_date()
+    columns = {}
+    errors = {}
+    for ticker in sorted(set(tickers)):
+        df = _bar_store.get_bars(ticker, start_date, end_date, settled_through=settled_through)
+        if df.empty:
+            errors[ticker] = f"No historical data for {ticker} in range {start_date} to {end_date}."
+            continue
+        columns[ticker] = df["Close"]
+    if not columns:
+        return pd.DataFrame(index=pd.DatetimeIndex([], dtype="datetime64[ns]")), errors
+    return pd.DataFrame(columns).sort_index(), errors
@@ -0,0 +1,173 @@
+"""
+Vectorized portfolio analytics over a user's trades and a date x ticker close matrix.
+
+Every trade is turned into a few scatter-adds on (day, ticker) grids - shares and
+cost basis change on its entry day and reverse on its close day - and running
+positions are their cumulative sums.  Everything else is whole-array math, so the
+cost is O(trades + days x tickers) with no Python loop over days.
+
+Conventions:
+  - a trade is held from its entry day (inclusive) to its close day (exclusive);
+    realized PnL is booked on the close day
+  - trades are placed on the first matrix day on or after their entry / close date;
+    a close after the last matrix day is booked on the last day
+  - missing closes are forward-filled (back-filled before a ticker's first bar)
+  - scheduled trades (no entry price yet) are ignored
+"""
+import datetime
+from typing import Dict, Iterable, NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+
+TRADING_DAYS_PER_YEAR = 252
+
+
+class PortfolioReport(NamedTuple):
+    equity: pd.Series               # capital + realized + unrealized PnL, per day
+    realized_pnl: pd.Series         # cumulative realized PnL, per day
+    unrealized_pnl: pd.Series       # mark-to-market PnL of held positions, per day
+    gross_exposure: pd.Series       # long + short market value over tickers, per day
+    net_exposure: pd.Series         # sum of signed shares x price over tickers, per day
+    exposure_by_ticker: pd.DataFrame  # last day: net and gross exposure per ticker
+    capital: float
+    total_pnl: float
+    max_drawdown_pct: float         # most negative peak-to-trough equity move, e.g. -12.5
+    volatility_pct: float           # annualized stdev of daily equity returns
+    sharpe: float                   # annualized, against risk_free_rate
+
+
+def _trade_arrays(trades: Iterable[Dict], days: np.ndarray, tickers: pd.Index):
+    """
+    Per-trade numpy columns, dropping trades that can't be placed on the matrix.
+    """
+    rows = [
+        t for t in trades
+        if t.get("status") in ("open", "closed") and t.get("entryDate") and t.get("entryPrice")
+        and t.get("ticker") in tickers
+    ]
+    n = len(rows)
+    ticker_idx = tickers.get_indexer([t["ticker"] for t in rows]).astype(np.int64)
+    sign = np.fromiter((-1.0 if t.get("positionType") == "short" else 1.0 for t in rows), float, n)
+    shares = np.fromiter((float(t["numShares"]) for t in rows), float, n)
+    entry_price = np.fromiter((float(t["entryPrice"]) for t in rows), float, n)
+    entry_day = np.array([t["entryDate"] for t in rows], dtype="datetime64[D]")
+    is_closed = np.fromiter((t["status"] == "closed" and t.get("closePrice") is not None for t in rows), bool, n)
+    close_price = np.fromiter(
+        (float(t["closePrice"]) if closed else np.nan for t, closed in zip(rows, is_closed)), float, n
+    )
+    close_day = np.array([t["closeDate"] if closed else "NaT" for t, closed in zip(rows, is_closed)],
+                         dtype="datetime64[D]")
+
+    entry_idx = np.searchsorted(days, entry_day, side="left")
+    n_days = len(days)
+    # Open trades never leave; closes past the last day are booked on it
+    exit_idx = np.where(is_closed, np.minimum(np.searchsorted(days, close_day, side="left"), n_days - 1), n_days)
+    exit_idx = np.maximum(exit_idx, entry_idx)
+    # Trades entered after the last day don't touch the matrix at all
+    keep = entry_idx < n_days
+    return {
+        "ticker": ticker_idx[keep], "sign": sign[keep], "shares": shares[keep],
+        "entry_price": entry_price[keep], "close_price": close_price[keep],
+        "is_closed": is_closed[keep], "entry_idx": entry_idx[keep], "exit_idx": exit_idx[keep],
+    }
+
+
+def running_total(n_days: int, n_tickers: int, entry_idx, exit_idx, ticker, amount) -> np.ndarray:
+    """
+    (days x tickers) running total of `amount`, added on entry and removed on exit.
+    """
+    delta = np.zeros((n_days + 1, n_tickers))
+    np.add.at(delta, (entry_idx, ticker), amount)
+    np.add.at(delta, (exit_idx, ticker), -amount)
+    return np.cumsum(delta[:-1], axis=0)
+
+
+def compute_portfolio(
+    trades: Iterable[Dict],
+    closes: pd.DataFrame,
+    capital: Optional[float] = None,
+    risk_free_rate: float = 0.0
+) -> PortfolioReport:
+    """
+    trades: trade dicts as stored (ticker, positionType, numShares, entryDate,
+    entryPrice, status, closeDate, closePrice).
+    closes: daily closes indexed by date with one column per ticker
+    (market_data.get_close_matrix).
+    capital: equity base for returns and drawdown; defaults to the peak gross
+    cost basis deployed, i.e. the capital the trades actually needed.
+    """
+    closes = closes.sort_index().ffill().bfill()
+    days = closes.index.values.astype("datetime64[D]")
+    tickers = closes.columns
+    n_days, n_tickers = len(days), len(tickers)
+    if n_days == 0:
+        raise ValueError("No price data to compute the portfolio on.")
+
+    t = _trade_arrays(trades, days, tickers)
+    prices = closes.to_numpy(dtype="float64")
+
+    signed_shares = t["sign"] * t["shares"]
+    is_long = t["sign"] > 0
+    # Long and short legs are tracked separately so gross exposure doesn't net them off
+    long_position = running_total(n_days, n_tickers, t["entry_idx"], t["exit_idx"], t["ticker"],
+                                  np.where(is_long, t["shares"], 0.0))
+    short_position = running_total(n_days, n_tickers, t["entry_idx"], t["exit_idx"], t["ticker"],
+                                   np.where(is_long, 0.0, t["shares"]))
+    position = long_position - short_position
+    cost_basis = running_total(n_days, n_tickers, t["entry_idx"], t["exit_idx"], t["ticker"],
+                               signed_shares * t["entry_price"])
+    gross_cost = running_total(n_days, n_tickers, t["entry_idx"], t["exit_idx"], t["ticker"],
+                               t["shares"] * t["entry_price"])
+
+    market_value = position * prices
+    gross_value = (long_position + short_position) * prices
+    unrealized = (market_value - cost_basis).sum(axis=1)
+
+    realized_daily = np.zeros(n_days)
+    closed = t["is_closed"]
+    np.add.at(realized_daily, t["exit_idx"][closed],
+              signed_shares[closed] * (t["close_price"][closed] - t["entry_price"][closed]))
+    realized = np.cumsum(realized_daily)
+
+    if capital is None:
+        capital = float(gross_cost.sum(axis=1).max()) or 1.0
+    equity = capital + realized + unrealized
+
+    returns = np.diff(equity) / equity[:-1] if n_days > 1 else np.array([])
+    if len(returns) > 1 and returns.std(ddof=1) > 0:
+        daily_vol = returns.std(ddof=1)
+        volatility_pct = daily_vol * np.sqrt(TRADING_DAYS_PER_YEAR) * 100
+        excess = returns.mean() - risk_free_rate / TRADING_DAYS_PER_YEAR
+        sharpe = excess / daily_vol * np.sqrt(TRADING_DAYS_PER_YEAR)
+    else:
+        volatility_pct, sharpe = 0.0, 0.0
+    drawdown = equity / np.maximum.accumulate(equity) - 1
+
+    index = closes.index
+    exposure_by_ticker = pd.DataFrame(
+        {"net": market_value[-1], "gross": gross_value[-1]}, index=tickers
+    )
+    exposure_by_ticker = exposure_by_ticker[exposure_by_ticker["gross"] > 0].sort_values("gross", ascending=False)
+
+    return PortfolioReport(
+        equity=pd.Series(equity, index=index, name="equity"),
+        realized_pnl=pd.Series(realized, index=index, name="realized_pnl"),
+        unrealized_pnl=pd.Series(unrealized, index=index, name="unrealized_pnl"),
+        gross_exposure=pd.Series(gross_value.sum(axis=1), index=index, name="gross_exposure"),
+        net_exposure=pd.Series(market_value.sum(axis=1), index=index, name="net_exposure"),
+        exposure_by_ticker=exposure_by_ticker,
+        capital=capital,
+        total_pnl=float(realized[-1] + unrealized[-1]),
+        max_drawdown_pct=float(drawdown.min() * 100),
+        volatility_pct=float(volatility_pct),
+        sharpe=float(sharpe),
+    )
+
+
+def portfolio_start_date(trades: Iterable[Dict]) -> Optional[datetime.date]:
+    """
+    Earliest entry date among opened trades, i.e. where the close matrix should start.
+    """
+    entry_dates = [t["entryDate"] for t in trades if t.get("status") in ("open", "closed") and t.get("entryDate")]
+    return datetime.date.fromisoformat(min(entry_dates)) if entry_dates else None
@@ -0,0 +1,166 @@
+"""
+Optional real-time portfolio view backed by Firestore on_snapshot listeners.
+
+With PORTFOLIO_LISTENER=1 (Firestore backend only), each signed-in user gets one
+listener on their trades, shared by all of that user's sessions in this process.
+The listener keeps an in-memory index of the user's open, scheduled and closed
+trades up to date, so renders read positions without any network I/O, and
+changes made by the worker or by other sessions show up on the next rerun.
+
+Listeners are reference-counted per user: every session holds a Subscription,
+and the listener is torn down once the last one is released - explicitly, or
+when Streamlit discards the session state that held it.
+
+A listener that never delivers its initial snapshot, or whose stream stops, is
+marked failed: sessions drop it and read through normal (cached) queries for
+PORTFOLIO_LISTENER_RETRY_SECONDS before subscribing to a fresh one.
+"""
+import os
+import threading
+import time
+import weakref
+from typing import Dict, List, Optional
+
+from storage import get_backend
+
+# How long a first render waits for the initial snapshot before falling back to a query
+READY_TIMEOUT_SECONDS = float(os.getenv("PORTFOLIO_LISTENER_READY_TIMEOUT_SECONDS", "10"))
+# How long a session queries instead after its listener failed
+RETRY_SECONDS = float(os.getenv("PORTFOLIO_LISTENER_RETRY_SECONDS", "60"))
+
+
+def listener_enabled() -> bool:
+    if os.getenv("PORTFOLIO_LISTENER", "").lower() not in ("1", "true", "yes"):
+        return False
+    return get_backend().name == "firestore"
+
+
+class PortfolioIndex:
+    """
+    One user's trades by trade_id, kept current by snapshot callbacks.
+    """
+    def __init__(self):
+        self._trades: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self.ready = threading.Event()
+        self.failed = False
+        self.watch = None
+
+    def apply(self, changes):
+        with self._lock:
+            for change in changes:
+                doc = change.document
+                if change.type.name == "REMOVED":
+                    self._trades.pop(doc.id, None)
+                else:
+                    item = doc.to_dict()
+                    item["trade_id"] = doc.id
+                    self._trades[doc.id] = item
+        # The first callback carries the full initial result set
+        self.ready.set()
+
+    def mark_failed(self):
+        self.failed = True
+        self.ready.clear()
+
+    def live(self) -> bool:
+        """
+        True while the index has its initial snapshot and the stream is still running.
+        """
+        if self.failed or not self.ready.is_set():
+            return False
+        return self.watch is None or getattr(self.watch, "is_active", True)
+
+    def positions(self, status: str) -> List[Dict]:
+        """
+        Copies of the trades with the given status, in trade_id order like a query.
+        """
+        with self._lock:
+            return [dict(t) for _, t in sorted(self._trades.items()) if t.get("status") == status]
+
+
+#######################################################
+# Reference-counted listeners
+#######################################################
+_listeners: Dict[str, Dict] = {}
+_listeners_lock = threading.Lock()
+
+def _acquire(user_id: str) -> Dict:
+    with _listeners_lock:
+        listener = _listeners.get(user_id)
+        if listener is None or listener["index"].failed:
+            # A failed listener is replaced; sessions still holding it release it on their own
+            index = PortfolioIndex()
+
+            def _on_snapshot(docs, changes, read_time):
+                index.apply(changes)
+
+            watch = get_backend().db.collection("trades").where("userId", "==", user_id).on_snapshot(_on_snapshot)
+            index.watch = watch
+            listener = _listeners[user_id] = {"index": index, "watch": watch, "refs": 0}
+            print(f"[DEBUG portfolio_listener] listening for user={user_id}")
+        listener["refs"] += 1
+        return listener
+
+def _release(user_id: str, listener: Dict):
+    with _listeners_lock:
+        listener["refs"] -= 1
+        if listener["refs"] > 0:
+            return
+        if _listeners.get(user_id) is listener:
+            del _listeners[user_id]
+    listener["watch"].unsubscribe()
+    print(f"[DEBUG portfolio_listener] stopped listening for user={user_id}")
+
+def active_listeners() -> Dict[str, int]:
+    """
+    {user_id: number of sessions holding that user's listener}
+    """
+    with _listeners_lock:
+        return {user_id: listener["refs"] for user_id, listener in _listeners.items()}
+
+
+class Subscription:
+    """
+    A session's hold on a user's listener. Released by release() or, as a
+    fallback, when the object is garbage collected with its session state.
+    """
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        listener = _acquire(user_id)
+        self.index = listener["index"]
+        # Must not reference self, or the subscription could never be collected
+        self._finalizer = weakref.finalize(self, _release, user_id, listener)
+
+    def release(self):
+        self._finalizer()  # runs _release at most once
+
+
+def session_index(session_state, user_id: str) -> Optional[PortfolioIndex]:
+    """
+    The user's live index for this session, subscribing on first use (the only
+    time it waits for the initial snapshot). Returns None, so callers fall back to
+    a query, while there is no live index: the snapshot didn't arrive within
+    READY_TIMEOUT_SECONDS or the stream stopped. The session then stays on
+    queries for RETRY_SECONDS before subscribing again.
+    """
+    subscription = session_state.get("portfolio_subscription")
+    if subscription is not None and subscription.user_id != user_id:
+        subscription.release()
+        subscription = None
+    if subscription is None:
+        if time.monotonic() < session_state.get("portfolio_listener_retry_at", 0):
+            return None
+        subscription = Subscription(user_id)
+        session_state["portfolio_subscription"] = subscription
+        subscription.index.ready.wait(READY_TIMEOUT_SECONDS)
+
+    index = subscription.index
+    if not index.live():
+        print(f"[DEBUG portfolio_listener] listener for user={user_id} not live, querying instead")
+        index.mark_failed()
+        subscription.release()
+        del session_state["portfolio_subscription"]
+        session_state["portfolio_listener_retry_at"] = time.monotonic() + RETRY_SECONDS
+        return None
+    return index
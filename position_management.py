@@ -1,13 +1,113 @@
+import os
+import threading
+import time
 import streamlit as st
 from firestore_database import (
     create_trade_record,
     schedule_trade_record,
     auto_open_scheduled_trades as fs_auto_open_scheduled_trades,  # renamed here
     close_trade_in_firestore,
+    close_trades_in_firestore,
+    PRICE_SOURCE_LATEST,
+    PRICE_SOURCE_AS_OF,
     update_unrealized_pnl as fs_update_unrealized_pnl,
     get_user_open_positions,
-    get_user_closed_positions
+    get_user_closed_positions,
+    get_user_closed_positions_page,
+    get_user_closed_totals,
+    get_user_summary
 )
+from portfolio_listener import listener_enabled, session_index
+
+#######################################################
+# Position cache
+#######################################################
+# Position lists and the summary are cached per session and tagged with a per-user version.
+# Every write made through this module bumps the user's version, so the next
+# rerun re-queries; reruns that change nothing are served from memory.
+# Versions are process-local (a Streamlit session stays on one process); writes
+# made elsewhere, e.g. by worker.py, show up once the TTL expires.
+# Only the latest entry of each kind is kept (e.g. the closed-history page on
+# screen), so paging and filtering don't grow the session.
+POSITIONS_CACHE_TTL_SECONDS = int(os.getenv("POSITIONS_CACHE_TTL_SECONDS", "60"))
+
+_position_versions = {}
+_position_versions_lock = threading.Lock()
+
+def get_positions_version(user_id):
+    with _position_versions_lock:
+        return _position_versions.get(user_id, 0)
+
+def bump_positions_version(user_id):
+    """
+    Invalidates every session's cached positions for user_id.
+    """
+    with _position_versions_lock:
+        _position_versions[user_id] = _position_versions.get(user_id, 0) + 1
+
+def _kind_name(kind):
+    # Parameterized kinds are tuples such as ("closed_page", page_size, cursor, ...)
+    return kind[0] if isinstance(kind, tuple) else kind
+
+def _cached_positions(kind, user_id, query_fn):
+    cache = st.session_state.setdefault("positions_cache", {})
+    # Read the version before querying: a write racing the query forces a refetch next time
+    version = get_positions_version(user_id)
+    now = time.monotonic()
+    entry = cache.get((kind, user_id))
+    if entry and entry["version"] == version and now - entry["fetched_at"] < POSITIONS_CACHE_TTL_SECONDS:
+        return entry["positions"]
+    positions = query_fn(user_id)
+    for key in [k for k in cache if k[1] == user_id and _kind_name(k[0]) == _kind_name(kind)]:
+        del cache[key]
+    cache[(kind, user_id)] = {"version": version, "fetched_at": now, "positions": positions}
+    return positions
+
+def _listener_index(user_id):
+    # In listener mode (PORTFOLIO_LISTENER=1) positions come from the live index instead
+    if not listener_enabled():
+        return None
+    return session_index(st.session_state, user_id)
+
+def get_cached_open_positions(user_id):
+    index = _listener_index(user_id)
+    if index is not None:
+        return index.positions("open")
+    return _cached_positions("open", user_id, get_user_open_positions)
+
+def get_all_closed_positions(user_id):
+    """
+    The user's entire closed history, uncached: only for explicit actions such as
+    computing portfolio analytics, never for every render.
+    """
+    index = _listener_index(user_id)
+    if index is not None:
+        return index.positions("closed")
+    return get_user_closed_positions(user_id)
+
+def get_cached_summary(user_id):
+    return _cached_positions("summary", user_id, get_user_summary)
+
+def get_cached_closed_page(user_id, page_size, cursor=None, start_date=None, end_date=None, ticker=None):
+    """
+    (trades, next_cursor) for one page of closed-trade history; only the page
+    last shown is cached.
+    """
+    kind = ("closed_page", page_size, cursor, start_date, end_date, ticker)
+    return _cached_positions(kind, user_id, lambda uid: get_user_closed_positions_page(
+        uid, page_size, cursor, start_date=start_date, end_date=end_date, ticker=ticker
+    ))
+
+def get_cached_closed_totals(user_id, start_date=None, end_date=None, ticker=None):
+    kind = ("closed_totals", start_date, end_date, ticker)
+    return _cached_positions(kind, user_id, lambda uid: get_user_closed_totals(
+        uid, start_date=start_date, end_date=end_date, ticker=ticker
+    ))
+
+
+#######################################################
+# Trade actions
+#######################################################
 
 def open_new_trade(ticker, position_type, num_shares, entry_date, entry_price,
                    opened_by_user, opened_by_model):
@@ -16,12 +116,14 @@ def open_new_trade(ticker, position_type, num_shares, entry_date, entry_price,
     Now implemented via Firestore.
     """
     user_id = st.session_state["user_id"]
-    return create_trade_record(
+    trade_id = create_trade_record(
         user_id, ticker, position_type, num_shares,
         entry_date, entry_price,
         opened_by_user, opened_by_model,
         status="open", pending_open=False
     )
+    bump_positions_version(user_id)
+    return trade_id
 
 def schedule_open_trade(ticker, position_type, num_shares, scheduled_date,
                         opened_by_user, opened_by_model):
@@ -29,29 +131,53 @@ def schedule_open_trade(ticker, position_type, num_shares, scheduled_date,
     Creates a trade record not yet opened, marking it scheduled in Firestore.
     """
     user_id = st.session_state["user_id"]
-    return schedule_trade_record(
+    trade_id = schedule_trade_record(
         user_id, ticker, position_type, num_shares,
         scheduled_date, opened_by_user, opened_by_model
     )
+    bump_positions_version(user_id)
+    return trade_id
 
-def auto_open_scheduled_trades():
+def auto_open_scheduled_trades(user_id=None):
     """
-    Each rerun, finalize any scheduled trades that are now in the past or today in Firestore.
+    Finalize any scheduled trades that are now in the past or today in Firestore.
     Calls the real Firestore function 'fs_auto_open_scheduled_trades'.
+    The background worker runs this for everyone; the UI passes the signed-in user_id.
     """
-    return fs_auto_open_scheduled_trades()
+    opened_users = fs_auto_open_scheduled_trades(user_id)
+    for opened_user_id in opened_users:
+        bump_positions_version(opened_user_id)
+    return opened_users
 
 def close_trade(trade_id, close_price, close_date):
     """
     Closes a trade in Firestore, computing PnL.
     """
     close_trade_in_firestore(trade_id, close_price, close_date)
+    bump_positions_version(st.session_state["user_id"])
+
+def close_trades(trade_ids, price_source, close_date):
+    """
+    Closes several of the signed-in user's positions in one go.
+    price_source: PRICE_SOURCE_LATEST, PRICE_SOURCE_AS_OF or a {ticker: price} dict.
+    Returns (closed trades, {trade_id: reason} for those that stayed open).
+    """
+    user_id = st.session_state["user_id"]
+    closed, errors = close_trades_in_firestore(user_id, trade_ids, price_source, close_date)
+    if closed:
+        bump_positions_version(user_id)
+    return closed, errors
 
-def update_unrealized_pnl():
+def update_unrealized_pnl(user_id=None):
     """
-    On every rerun, fetch latest price, recalc unrealized PnL in Firestore.
+    Fetch latest price, recalc unrealized PnL in Firestore.
+    The background worker runs this for everyone; the UI passes the signed-in user_id.
     """
-    fs_update_unrealized_pnl()
+    updates = fs_update_unrealized_pnl(user_id)
+    if user_id is not None:
+        # "Refresh now" should also pick up what the worker wrote since the last query
+        bump_positions_version(user_id)
+    return updates
 
 def find_trade_by_id(trade_id, trades_list):
     """
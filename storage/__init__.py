@@ -0,0 +1,52 @@
+"""
+Pluggable storage for users, trades, OAuth state and worker locks.
+
+The backend is picked with the STORAGE_BACKEND environment variable:
+  - "firestore" (default): Google Cloud Firestore, configured by PROJECT_ID
+  - "sqlite": an embedded SQLite file at SQLITE_PATH (default data/lmtrading.sqlite3)
+  - "memory": process-local dicts, for local experiments and benchmarks
+"""
+import os
+import threading
+from dotenv import load_dotenv
+
+from storage.base import StorageBackend
+
+load_dotenv()
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def _create_backend(name: str) -> StorageBackend:
+    if name == "firestore":
+        from storage.firestore_backend import FirestoreBackend
+        return FirestoreBackend()
+    if name == "sqlite":
+        from storage.sqlite_backend import SQLiteBackend, DEFAULT_SQLITE_PATH
+        return SQLiteBackend(os.getenv("SQLITE_PATH", DEFAULT_SQLITE_PATH))
+    if name == "memory":
+        from storage.memory_backend import MemoryBackend
+        return MemoryBackend()
+    raise ValueError(f"Unknown STORAGE_BACKEND: {name}")
+
+
+def get_backend() -> StorageBackend:
+    """
+    Returns the process-wide backend, creating it on first use.
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = _create_backend(os.getenv("STORAGE_BACKEND", "firestore").lower())
+    return _backend
+
+
+def set_backend(backend: StorageBackend):
+    """
+    Replaces the process-wide backend (e.g. with a MemoryBackend in a benchmark).
+    """
+    global _backend
+    with _backend_lock:
+        _backend = backend
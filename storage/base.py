@@ -0,0 +1,192 @@
+"""
+Interface every storage backend implements.
+
+Trades are plain dicts using the Firestore field names (userId, ticker,
+positionType, numShares, ...).  Anything returned from a query also carries
+its document ID under "trade_id".
+
+Each user also has a summary document (see storage/summary.py) that every
+status-changing trade write keeps up to date atomically with the trade.
+"""
+import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+class StorageBackend:
+    name = "base"
+
+    #######################################################
+    # Users
+    #######################################################
+    def get_user(self, user_id: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    def create_user(self, user_id: str, user_doc: Dict) -> Dict:
+        """
+        Stores user_doc under user_id, stamping createdAt. Returns the stored doc.
+        """
+        raise NotImplementedError
+
+    #######################################################
+    # Trades
+    #######################################################
+    def add_trade(self, trade_doc: Dict) -> str:
+        """
+        Inserts a new trade, stamping createdAt, and adds it to its user's summary
+        in the same write. Returns the new trade ID.
+        """
+        raise NotImplementedError
+
+    def get_trade(self, trade_id: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    def update_trade(self, trade_id: str, fields: Dict):
+        """
+        Merges fields into an existing trade. Raises ValueError if it doesn't exist.
+        Does not touch the summary; use transition_trade for status changes.
+        """
+        raise NotImplementedError
+
+    def transition_trade(self, trade_id: str, fn: Callable[[Dict], Optional[Dict]]) -> Optional[Dict]:
+        """
+        Atomically reads the trade, calls fn(trade) for the fields to write (None
+        to write nothing), writes them and applies the resulting summary delta.
+        fn may run more than once if the transaction is retried, so it must not
+        have side effects; exceptions it raises abort the write. Returns the
+        updated trade, or None if fn returned None. ValueError if not found.
+        """
+        raise NotImplementedError
+
+    def commit_trade_updates(
+        self,
+        updates: Dict[str, Dict],
+        summary_deltas: Optional[Dict[str, Dict]] = None
+    ) -> int:
+        """
+        Applies {trade_id: fields} in as few round trips as the backend allows,
+        plus {user_id: summary delta} increments alongside them.
+        Returns the number of trades updated.
+        """
+        raise NotImplementedError
+
+    def transition_trades(self, updates: Dict[str, Dict], expected_status: str) -> List[Dict]:
+        """
+        Conditional bulk form of transition_trade: applies {trade_id: fields} only
+        to trades whose stored status is still expected_status, re-checked inside
+        the transaction that writes them, along with the summary deltas. Running
+        it twice, or from two racing processes, applies each update once.
+        Returns the updated trades; missing or already-moved trades are skipped.
+        """
+        raise NotImplementedError
+
+    def query_trades(
+        self,
+        user_id: Optional[str] = None,
+        status: Optional[str] = None,
+        pending_open: Optional[bool] = None,
+        due_by: Optional[str] = None
+    ) -> List[Dict]:
+        """
+        Returns trades matching every given equality filter and, with due_by
+        (an ISO date), only those with pending_open_date <= due_by.
+        """
+        raise NotImplementedError
+
+    def query_trade_frame(
+        self,
+        user_id: Optional[str] = None,
+        status: Optional[str] = None,
+        pending_open: Optional[bool] = None
+    ) -> "TradeFrame":
+        """
+        query_trades as a columnar TradeFrame (trade_frame.py). Backends that can
+        decode results straight into the columns override this.
+        """
+        from trade_frame import TradeFrame
+        return TradeFrame.from_docs(self.query_trades(user_id=user_id, status=status, pending_open=pending_open))
+
+    def query_trades_page(
+        self,
+        user_id: str,
+        status: str,
+        date_field: str,
+        page_size: int,
+        start_after: Optional[Tuple] = None,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        ticker: Optional[str] = None
+    ) -> Tuple[List[Dict], Optional[Tuple]]:
+        """
+        One page of the user's trades with `status`, newest date_field first (ties
+        broken by trade ID), optionally limited to date_field in [start_date,
+        end_date] (ISO dates) and one ticker. Pass the cursor returned with the
+        previous page as start_after; the returned cursor is None on the last page.
+        """
+        raise NotImplementedError
+
+    def aggregate_trades(
+        self,
+        user_id: str,
+        status: str,
+        date_field: str,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        ticker: Optional[str] = None
+    ) -> Dict:
+        """
+        {"count", "pnl_usd", "avg_return_pct"} over the same filters as
+        query_trades_page, computed without fetching the trades where possible.
+        """
+        raise NotImplementedError
+
+    #######################################################
+    # User summaries
+    #######################################################
+    def get_summary(self, user_id: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    def put_summary(self, user_id: str, summary: Dict):
+        """
+        Overwrites the user's summary (used when rebuilding it from the trades).
+        """
+        raise NotImplementedError
+
+    def ensure_summary(self, user_id: str) -> Dict:
+        """
+        Returns the user's summary, first building it from their trades if there
+        is none yet. Trade writes do the same for users without a summary (e.g.
+        trades stored before summaries existed) instead of incrementing from zero,
+        in the same transaction as the write.
+        """
+        raise NotImplementedError
+
+    #######################################################
+    # OAuth state
+    #######################################################
+    def put_oauth_state(self, state: str, state_doc: Dict):
+        raise NotImplementedError
+
+    def pop_oauth_state(self, state: str) -> Optional[Dict]:
+        """
+        Deletes and returns the state doc, or returns None if it doesn't exist.
+        """
+        raise NotImplementedError
+
+    def purge_oauth_states(self, created_before: datetime.datetime) -> int:
+        """
+        Deletes state docs created before the given (UTC) time, i.e. logins that
+        were started and never finished. Returns the number deleted.
+        """
+        raise NotImplementedError
+
+    #######################################################
+    # Worker locks
+    #######################################################
+    def acquire_lock(self, name: str, owner: str, ttl_seconds: int) -> bool:
+        """
+        Takes (or renews) a lease for owner. False if someone else holds a live lease.
+        """
+        raise NotImplementedError
+
+    def release_lock(self, name: str, owner: str):
+        raise NotImplementedError
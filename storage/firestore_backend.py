@@ -0,0 +1,390 @@
+"""
+Google Cloud Firestore backend (the production default).
+"""
+import datetime
+import time
+from typing import Dict, List, Optional, Tuple
+from google.cloud import firestore
+
+from clients import get_firestore_client
+from storage.base import StorageBackend
+from storage.summary import add_deltas, rebuild_summary, summary_delta
+from trade_frame import TradeFrame
+from tracing import traced
+
+# Firestore rejects write batches with more than 500 operations
+FIRESTORE_BATCH_LIMIT = 500
+
+
+class FirestoreBackend(StorageBackend):
+    name = "firestore"
+
+    def __init__(self, client: Optional[firestore.Client] = None):
+        # Without an explicit client, the shared one from clients.py is created on first use
+        self._client = client
+
+    @property
+    def db(self) -> firestore.Client:
+        return self._client or get_firestore_client()
+
+    #######################################################
+    # Users
+    #######################################################
+    @traced("firestore")
+    def get_user(self, user_id: str) -> Optional[Dict]:
+        doc = self.db.collection("users").document(user_id).get()
+        return doc.to_dict() if doc.exists else None
+
+    @traced("firestore")
+    def create_user(self, user_id: str, user_doc: Dict) -> Dict:
+        new_data = dict(user_doc, createdAt=firestore.SERVER_TIMESTAMP)
+        self.db.collection("users").document(user_id).set(new_data)
+        return new_data
+
+    #######################################################
+    # Trades
+    #######################################################
+    def _summary_ref(self, user_id: str):
+        return self.db.collection("users").document(user_id).collection("summary").document("current")
+
+    def _missing_summaries(self, transaction, user_ids) -> Dict[str, Dict]:
+        """
+        {user_id: summary rebuilt from their trades} for the users that have no
+        summary document yet. Must run before the transaction's writes, so the
+        rebuilt summaries reflect the trades before them.
+        """
+        refs = {self._summary_ref(user_id).path: user_id for user_id in user_ids if user_id}
+        if not refs:
+            return {}
+        # One read for all the summaries; results may come back in any order
+        missing = {}
+        for snap in transaction.get_all([self._summary_ref(user_id) for user_id in refs.values()]):
+            if not snap.exists:
+                user_id = refs[snap.reference.path]
+                trades = self.db.collection("trades").where("userId", "==", user_id)
+                missing[user_id] = rebuild_summary(t.to_dict() for t in transaction.get(trades))
+        return missing
+
+    def _increment_summary(self, writer, user_id: str, delta: Dict, base: Optional[Dict] = None):
+        """
+        Queues the summary increments on a batch or transaction. With base (the
+        summary of a user who has none stored yet), writes base + delta instead.
+        """
+        if not user_id or (not delta and base is None):
+            return
+        if base is not None:
+            summary = add_deltas(dict(base), delta)
+            writer.set(self._summary_ref(user_id), dict(summary, updatedAt=firestore.SERVER_TIMESTAMP))
+            return
+        fields = {field: firestore.Increment(change) for field, change in delta.items()}
+        fields["updatedAt"] = firestore.SERVER_TIMESTAMP
+        writer.set(self._summary_ref(user_id), fields, merge=True)
+
+    @traced("firestore")
+    def add_trade(self, trade_doc: Dict) -> str:
+        trade_ref = self.db.collection("trades").document()
+        user_id = trade_doc.get("userId")
+
+        @firestore.transactional
+        def _add(transaction):
+            missing = self._missing_summaries(transaction, [user_id])
+            transaction.set(trade_ref, dict(trade_doc, createdAt=firestore.SERVER_TIMESTAMP))
+            self._increment_summary(transaction, user_id, summary_delta(None, trade_doc), missing.get(user_id))
+
+        _add(self.db.transaction())
+        return trade_ref.id
+
+    @traced("firestore")
+    def get_trade(self, trade_id: str) -> Optional[Dict]:
+        snap = self.db.collection("trades").document(trade_id).get()
+        if not snap.exists:
+            return None
+        item = snap.to_dict()
+        item["trade_id"] = snap.id
+        return item
+
+    @traced("firestore")
+    def update_trade(self, trade_id: str, fields: Dict):
+        self.db.collection("trades").document(trade_id).update(fields)
+
+    @traced("firestore")
+    def transition_trade(self, trade_id: str, fn) -> Optional[Dict]:
+        trade_ref = self.db.collection("trades").document(trade_id)
+
+        @firestore.transactional
+        def _transition(transaction):
+            snap = trade_ref.get(transaction=transaction)
+            if not snap.exists:
+                raise ValueError("Trade not found in Firestore.")
+            before = snap.to_dict()
+            fields = fn(dict(before))
+            if not fields:
+                return None
+            after = dict(before, **fields)
+            user_id = before.get("userId")
+            delta = summary_delta(before, after)
+            missing = self._missing_summaries(transaction, [user_id] if delta else [])
+            transaction.update(trade_ref, fields)
+            self._increment_summary(transaction, user_id, delta, missing.get(user_id))
+            return dict(after, trade_id=trade_id)
+
+        return _transition(self.db.transaction())
+
+    @traced("firestore")
+    def transition_trades(self, updates: Dict[str, Dict], expected_status: str) -> List[Dict]:
+        trades = self.db.collection("trades")
+        trade_ids = list(updates)
+        # Each trade may bring its own user's summary write
+        chunk_size = FIRESTORE_BATCH_LIMIT // 2
+
+        @firestore.transactional
+        def _transition(transaction, chunk):
+            applied = []
+            deltas = {}
+            for snap in transaction.get_all([trades.document(trade_id) for trade_id in chunk]):
+                before = snap.to_dict() if snap.exists else None
+                if not before or before.get("status") != expected_status:
+                    continue
+                after = dict(before, **updates[snap.id])
+                add_deltas(deltas.setdefault(before.get("userId"), {}), summary_delta(before, after))
+                applied.append((snap.reference, dict(after, trade_id=snap.id)))
+            missing = self._missing_summaries(transaction, [user_id for user_id, delta in deltas.items() if delta])
+            for ref, trade in applied:
+                transaction.update(ref, updates[ref.id])
+            for user_id, delta in deltas.items():
+                self._increment_summary(transaction, user_id, delta, missing.get(user_id))
+            return [trade for _, trade in applied]
+
+        results = []
+        for i in range(0, len(trade_ids), chunk_size):
+            results += _transition(self.db.transaction(), trade_ids[i:i + chunk_size])
+        return results
+
+    @traced("firestore")
+    def commit_trade_updates(
+        self,
+        updates: Dict[str, Dict],
+        summary_deltas: Optional[Dict[str, Dict]] = None
+    ) -> int:
+        """
+        Writes through batches, committing every FIRESTORE_BATCH_LIMIT operations.
+        Summary increments follow in one transaction per user.
+        """
+        batch = self.db.batch()
+        pending = 0
+        for trade_id, fields in updates.items():
+            batch.update(self.db.collection("trades").document(trade_id), fields)
+            pending += 1
+            if pending == FIRESTORE_BATCH_LIMIT:
+                batch.commit()
+                batch = self.db.batch()
+                pending = 0
+        if pending:
+            batch.commit()
+
+        @firestore.transactional
+        def _increment(transaction, user_id, delta):
+            missing = self._missing_summaries(transaction, [user_id])
+            if user_id in missing:
+                # Rebuilt from trades that already include the updates above
+                self._increment_summary(transaction, user_id, {}, missing[user_id])
+            else:
+                self._increment_summary(transaction, user_id, delta)
+
+        for user_id, delta in (summary_deltas or {}).items():
+            if delta and user_id:
+                _increment(self.db.transaction(), user_id, delta)
+        return len(updates)
+
+    @traced("firestore")
+    def query_trades(
+        self,
+        user_id: Optional[str] = None,
+        status: Optional[str] = None,
+        pending_open: Optional[bool] = None,
+        due_by: Optional[str] = None
+    ) -> List[Dict]:
+        q = self.db.collection("trades")
+        if pending_open is not None:
+            q = q.where("pending_open", "==", pending_open)
+        if status is not None:
+            q = q.where("status", "==", status)
+        if user_id is not None:
+            q = q.where("userId", "==", user_id)
+        if due_by is not None:
+            # Range on pending_open_date: needs the composite indexes in firestore.indexes.json
+            q = q.where("pending_open_date", "<=", due_by)
+        results = []
+        for d in q.stream():
+            item = d.to_dict()
+            item["trade_id"] = d.id
+            results.append(item)
+        return results
+
+    @traced("firestore")
+    def query_trade_frame(
+        self,
+        user_id: Optional[str] = None,
+        status: Optional[str] = None,
+        pending_open: Optional[bool] = None
+    ) -> TradeFrame:
+        q = self.db.collection("trades")
+        if pending_open is not None:
+            q = q.where("pending_open", "==", pending_open)
+        if status is not None:
+            q = q.where("status", "==", status)
+        if user_id is not None:
+            q = q.where("userId", "==", user_id)
+        # Snapshots decode straight into columns; no per-trade dict is kept around
+        return TradeFrame.from_records((d.id, d.to_dict()) for d in q.stream())
+
+    def _filtered_trades(self, user_id, status, date_field, start_date, end_date, ticker):
+        q = self.db.collection("trades").where("userId", "==", user_id).where("status", "==", status)
+        if ticker:
+            q = q.where("ticker", "==", ticker)
+        if start_date:
+            q = q.where(date_field, ">=", start_date)
+        if end_date:
+            q = q.where(date_field, "<=", end_date)
+        return q
+
+    @traced("firestore")
+    def query_trades_page(
+        self,
+        user_id: str,
+        status: str,
+        date_field: str,
+        page_size: int,
+        start_after: Optional[Tuple] = None,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        ticker: Optional[str] = None
+    ) -> Tuple[List[Dict], Optional[Tuple]]:
+        # Needs the composite indexes in firestore.indexes.json
+        q = (
+            self._filtered_trades(user_id, status, date_field, start_date, end_date, ticker)
+            .order_by(date_field, direction=firestore.Query.DESCENDING)
+            .order_by("__name__", direction=firestore.Query.DESCENDING)
+        )
+        if start_after is not None:
+            last_date, last_id = start_after
+            q = q.start_after([last_date, self.db.collection("trades").document(last_id)])
+        # One extra document tells whether another page exists
+        snaps = list(q.limit(page_size + 1).stream())
+        results = []
+        for d in snaps[:page_size]:
+            item = d.to_dict()
+            item["trade_id"] = d.id
+            results.append(item)
+        next_cursor = None
+        if len(snaps) > page_size:
+            next_cursor = (results[-1].get(date_field), results[-1]["trade_id"])
+        return results, next_cursor
+
+    @traced("firestore")
+    def aggregate_trades(
+        self,
+        user_id: str,
+        status: str,
+        date_field: str,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        ticker: Optional[str] = None
+    ) -> Dict:
+        # Server-side aggregation: billed per 1000 index entries, no documents are sent
+        q = self._filtered_trades(user_id, status, date_field, start_date, end_date, ticker)
+        aggregation_query = q.count(alias="count").sum("pnl_usd", alias="pnl_usd").avg("return_pct", alias="avg_return_pct")
+        results = {r.alias: r.value for row in aggregation_query.get() for r in row}
+        return {
+            "count": int(results.get("count") or 0),
+            "pnl_usd": float(results.get("pnl_usd") or 0.0),
+            "avg_return_pct": results.get("avg_return_pct"),
+        }
+
+    #######################################################
+    # User summaries
+    #######################################################
+    @traced("firestore")
+    def get_summary(self, user_id: str) -> Optional[Dict]:
+        snap = self._summary_ref(user_id).get()
+        return snap.to_dict() if snap.exists else None
+
+    @traced("firestore")
+    def put_summary(self, user_id: str, summary: Dict):
+        self._summary_ref(user_id).set(dict(summary, updatedAt=firestore.SERVER_TIMESTAMP))
+
+    @traced("firestore")
+    def ensure_summary(self, user_id: str) -> Dict:
+        @firestore.transactional
+        def _ensure(transaction):
+            missing = self._missing_summaries(transaction, [user_id])
+            if user_id not in missing:
+                return None
+            self._increment_summary(transaction, user_id, {}, missing[user_id])
+            return missing[user_id]
+
+        # Re-read if another writer created it first
+        return _ensure(self.db.transaction()) or self.get_summary(user_id)
+
+    #######################################################
+    # OAuth state
+    #######################################################
+    @traced("firestore")
+    def put_oauth_state(self, state: str, state_doc: Dict):
+        doc_data = dict(state_doc, createdAt=firestore.SERVER_TIMESTAMP)
+        self.db.collection("oauth_states").document(state).set(doc_data)
+
+    @traced("firestore")
+    def pop_oauth_state(self, state: str) -> Optional[Dict]:
+        doc_ref = self.db.collection("oauth_states").document(state)
+        snap = doc_ref.get()
+        if not snap.exists:
+            return None
+        doc_ref.delete()
+        return snap.to_dict()
+
+    @traced("firestore")
+    def purge_oauth_states(self, created_before: datetime.datetime) -> int:
+        query = self.db.collection("oauth_states").where("createdAt", "<", created_before).limit(FIRESTORE_BATCH_LIMIT)
+        deleted = 0
+        while True:
+            snaps = list(query.stream())
+            if not snaps:
+                return deleted
+            batch = self.db.batch()
+            for snap in snaps:
+                batch.delete(snap.reference)
+            batch.commit()
+            deleted += len(snaps)
+
+    #######################################################
+    # Worker locks
+    #######################################################
+    @traced("firestore")
+    def acquire_lock(self, name: str, owner: str, ttl_seconds: int) -> bool:
+        lock_ref = self.db.collection("worker_locks").document(name)
+
+        @firestore.transactional
+        def _acquire(transaction):
+            now = time.time()
+            snap = lock_ref.get(transaction=transaction)
+            if snap.exists:
+                data = snap.to_dict()
+                if data.get("owner") != owner and data.get("expiresAt", 0) > now:
+                    return False
+            transaction.set(lock_ref, {"owner": owner, "expiresAt": now + ttl_seconds})
+            return True
+
+        return _acquire(self.db.transaction())
+
+    @traced("firestore")
+    def release_lock(self, name: str, owner: str):
+        lock_ref = self.db.collection("worker_locks").document(name)
+
+        @firestore.transactional
+        def _release(transaction):
+            snap = lock_ref.get(transaction=transaction)
+            if snap.exists and snap.to_dict().get("owner") == owner:
+                transaction.delete(lock_ref)
+
+        _release(self.db.transaction())
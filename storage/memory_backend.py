@@ -0,0 +1,238 @@
+"""
+In-memory backend: everything lives in process-local dicts and is lost on exit.
+"""
+import datetime
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from storage.base import StorageBackend
+from storage.summary import add_deltas, rebuild_summary, summary_delta
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+class MemoryBackend(StorageBackend):
+    name = "memory"
+
+    def __init__(self):
+        self._users: Dict[str, Dict] = {}
+        self._trades: Dict[str, Dict] = {}
+        self._summaries: Dict[str, Dict] = {}
+        self._oauth_states: Dict[str, Dict] = {}
+        self._locks: Dict[str, Dict] = {}
+        self._lock = threading.RLock()
+
+    #######################################################
+    # Users
+    #######################################################
+    def get_user(self, user_id: str) -> Optional[Dict]:
+        with self._lock:
+            user = self._users.get(user_id)
+            return dict(user) if user is not None else None
+
+    def create_user(self, user_id: str, user_doc: Dict) -> Dict:
+        new_data = dict(user_doc, createdAt=_now())
+        with self._lock:
+            self._users[user_id] = new_data
+        return dict(new_data)
+
+    #######################################################
+    # Trades
+    #######################################################
+    def _increment_summary(self, user_id: str, delta: Dict):
+        # Called after the trade write; a user without a summary yet gets one built
+        # from their trades, which already include that write
+        if delta and user_id:
+            if user_id not in self._summaries:
+                self._build_summary(user_id)
+                return
+            summary = add_deltas(self._summaries[user_id], delta)
+            summary["updatedAt"] = _now()
+
+    def _build_summary(self, user_id: str) -> Dict:
+        trades = [t for t in self._trades.values() if t.get("userId") == user_id]
+        self._summaries[user_id] = dict(rebuild_summary(trades), updatedAt=_now())
+        return self._summaries[user_id]
+
+    def add_trade(self, trade_doc: Dict) -> str:
+        trade_id = uuid.uuid4().hex
+        with self._lock:
+            self._trades[trade_id] = dict(trade_doc, createdAt=_now())
+            self._increment_summary(trade_doc.get("userId"), summary_delta(None, trade_doc))
+        return trade_id
+
+    def get_trade(self, trade_id: str) -> Optional[Dict]:
+        with self._lock:
+            trade = self._trades.get(trade_id)
+            return dict(trade, trade_id=trade_id) if trade is not None else None
+
+    def update_trade(self, trade_id: str, fields: Dict):
+        with self._lock:
+            if trade_id not in self._trades:
+                raise ValueError("Trade not found.")
+            self._trades[trade_id].update(fields)
+
+    def transition_trade(self, trade_id: str, fn) -> Optional[Dict]:
+        with self._lock:
+            if trade_id not in self._trades:
+                raise ValueError("Trade not found.")
+            before = dict(self._trades[trade_id])
+            fields = fn(dict(before))
+            if not fields:
+                return None
+            self._trades[trade_id].update(fields)
+            after = dict(self._trades[trade_id])
+            self._increment_summary(before.get("userId"), summary_delta(before, after))
+        return dict(after, trade_id=trade_id)
+
+    def transition_trades(self, updates: Dict[str, Dict], expected_status: str) -> List[Dict]:
+        applied = []
+        with self._lock:
+            for trade_id, fields in updates.items():
+                trade = self._trades.get(trade_id)
+                if trade is None or trade.get("status") != expected_status:
+                    continue
+                before = dict(trade)
+                trade.update(fields)
+                self._increment_summary(before.get("userId"), summary_delta(before, trade))
+                applied.append(dict(trade, trade_id=trade_id))
+        return applied
+
+    def commit_trade_updates(
+        self,
+        updates: Dict[str, Dict],
+        summary_deltas: Optional[Dict[str, Dict]] = None
+    ) -> int:
+        with self._lock:
+            for trade_id, fields in updates.items():
+                self.update_trade(trade_id, fields)
+            for user_id, delta in (summary_deltas or {}).items():
+                self._increment_summary(user_id, delta)
+        return len(updates)
+
+    def query_trades(
+        self,
+        user_id: Optional[str] = None,
+        status: Optional[str] = None,
+        pending_open: Optional[bool] = None,
+        due_by: Optional[str] = None
+    ) -> List[Dict]:
+        with self._lock:
+            return [
+                dict(trade, trade_id=trade_id)
+                for trade_id, trade in self._trades.items()
+                if (user_id is None or trade.get("userId") == user_id)
+                and (status is None or trade.get("status") == status)
+                and (pending_open is None or trade.get("pending_open") == pending_open)
+                and (due_by is None or (trade.get("pending_open_date") is not None
+                                        and trade["pending_open_date"] <= due_by))
+            ]
+
+    def _filtered_trades(self, user_id, status, date_field, start_date, end_date, ticker):
+        with self._lock:
+            return [
+                dict(trade, trade_id=trade_id)
+                for trade_id, trade in self._trades.items()
+                if trade.get("userId") == user_id and trade.get("status") == status
+                and (not ticker or trade.get("ticker") == ticker)
+                and (not start_date or (trade.get(date_field) or "") >= start_date)
+                and (not end_date or (trade.get(date_field) is not None and trade[date_field] <= end_date))
+            ]
+
+    def query_trades_page(
+        self,
+        user_id: str,
+        status: str,
+        date_field: str,
+        page_size: int,
+        start_after: Optional[Tuple] = None,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        ticker: Optional[str] = None
+    ) -> Tuple[List[Dict], Optional[Tuple]]:
+        def key(trade):
+            return (trade.get(date_field) or "", trade["trade_id"])
+
+        trades = self._filtered_trades(user_id, status, date_field, start_date, end_date, ticker)
+        trades.sort(key=key, reverse=True)
+        if start_after is not None:
+            last = (start_after[0] or "", start_after[1])
+            trades = [t for t in trades if key(t) < last]
+        page = trades[:page_size]
+        next_cursor = None
+        if len(trades) > page_size:
+            next_cursor = (page[-1].get(date_field), page[-1]["trade_id"])
+        return page, next_cursor
+
+    def aggregate_trades(
+        self,
+        user_id: str,
+        status: str,
+        date_field: str,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        ticker: Optional[str] = None
+    ) -> Dict:
+        trades = self._filtered_trades(user_id, status, date_field, start_date, end_date, ticker)
+        returns = [t["return_pct"] for t in trades if isinstance(t.get("return_pct"), (int, float))]
+        return {
+            "count": len(trades),
+            "pnl_usd": float(sum(t.get("pnl_usd") or 0 for t in trades)),
+            "avg_return_pct": sum(returns) / len(returns) if returns else None,
+        }
+
+    #######################################################
+    # User summaries
+    #######################################################
+    def get_summary(self, user_id: str) -> Optional[Dict]:
+        with self._lock:
+            summary = self._summaries.get(user_id)
+            return dict(summary) if summary is not None else None
+
+    def put_summary(self, user_id: str, summary: Dict):
+        with self._lock:
+            self._summaries[user_id] = dict(summary, updatedAt=_now())
+
+    def ensure_summary(self, user_id: str) -> Dict:
+        with self._lock:
+            summary = self._summaries.get(user_id) or self._build_summary(user_id)
+            return dict(summary)
+
+    #######################################################
+    # OAuth state
+    #######################################################
+    def put_oauth_state(self, state: str, state_doc: Dict):
+        with self._lock:
+            self._oauth_states[state] = dict(state_doc, createdAt=_now())
+
+    def pop_oauth_state(self, state: str) -> Optional[Dict]:
+        with self._lock:
+            return self._oauth_states.pop(state, None)
+
+    def purge_oauth_states(self, created_before: datetime.datetime) -> int:
+        with self._lock:
+            expired = [s for s, doc in self._oauth_states.items() if doc["createdAt"] < created_before]
+            for state in expired:
+                del self._oauth_states[state]
+        return len(expired)
+
+    #######################################################
+    # Worker locks
+    #######################################################
+    def acquire_lock(self, name: str, owner: str, ttl_seconds: int) -> bool:
+        now = time.time()
+        with self._lock:
+            current = self._locks.get(name)
+            if current and current["owner"] != owner and current["expiresAt"] > now:
+                return False
+            self._locks[name] = {"owner": owner, "expiresAt": now + ttl_seconds}
+            return True
+
+    def release_lock(self, name: str, owner: str):
+        with self._lock:
+            if self._locks.get(name, {}).get("owner") == owner:
+                del self._locks[name]
@@ -0,0 +1,406 @@
+"""
+Embedded SQLite backend.
+
+Each trade is stored as a JSON document, with the fields we filter on copied
+into indexed columns: (user_id, status) for per-user position lists and
+(status, pending_open_date) for the scheduled-trade opener.  Every change is a
+single-row write, unlike the old whole-file JSON persistence.
+"""
+import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from storage.base import StorageBackend
+from storage.summary import add_deltas, rebuild_summary, summary_delta
+from tracing import traced
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SQLITE_PATH = os.path.join(BASE_DIR, "data", "lmtrading.sqlite3")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS trades (
+    trade_id TEXT PRIMARY KEY,
+    user_id TEXT,
+    status TEXT,
+    pending_open INTEGER,
+    pending_open_date TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_trades_user_status ON trades (user_id, status);
+CREATE INDEX IF NOT EXISTS idx_trades_status_pending_date ON trades (status, pending_open_date);
+CREATE INDEX IF NOT EXISTS idx_trades_user_status_close_date
+    ON trades (user_id, status, json_extract(data, '$.closeDate'));
+CREATE INDEX IF NOT EXISTS idx_trades_user_status_entry_date
+    ON trades (user_id, status, json_extract(data, '$.entryDate'));
+CREATE TABLE IF NOT EXISTS user_summaries (
+    user_id TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS oauth_states (
+    state TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS worker_locks (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+# Fields query_trades_page / aggregate_trades may order and filter by; each has an index above
+_DATE_FIELDS = ("closeDate", "entryDate")
+
+
+def _now_iso() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+def _dumps(doc: Dict) -> str:
+    # default=str covers datetimes and other values JSON can't represent
+    return json.dumps(doc, default=str)
+
+
+class SQLiteBackend(StorageBackend):
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # One shared connection, serialized by a lock, works across Streamlit threads
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.RLock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+
+    #######################################################
+    # Users
+    #######################################################
+    @traced("sqlite")
+    def get_user(self, user_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        return json.loads(row["data"]) if row else None
+
+    @traced("sqlite")
+    def create_user(self, user_id: str, user_doc: Dict) -> Dict:
+        new_data = dict(user_doc, createdAt=_now_iso())
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO users (user_id, data) VALUES (?, ?)", (user_id, _dumps(new_data))
+            )
+        return new_data
+
+    #######################################################
+    # Trades
+    #######################################################
+    @staticmethod
+    def _trade_row(trade_id: str, doc: Dict) -> tuple:
+        return (
+            trade_id,
+            doc.get("userId"),
+            doc.get("status"),
+            None if doc.get("pending_open") is None else int(bool(doc.get("pending_open"))),
+            doc.get("pending_open_date"),
+            _dumps(doc)
+        )
+
+    def _increment_summary(self, user_id: str, delta: Dict):
+        # Runs inside the caller's transaction, after its trade writes
+        if not delta or not user_id:
+            return
+        row = self._conn.execute("SELECT data FROM user_summaries WHERE user_id = ?", (user_id,)).fetchone()
+        if row is None:
+            # No summary yet: build it from the trades, which already include this write
+            self._build_summary(user_id)
+            return
+        summary = add_deltas(json.loads(row["data"]), delta)
+        summary["updatedAt"] = _now_iso()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO user_summaries (user_id, data) VALUES (?, ?)", (user_id, _dumps(summary))
+        )
+
+    def _build_summary(self, user_id: str) -> Dict:
+        rows = self._conn.execute("SELECT data FROM trades WHERE user_id = ?", (user_id,)).fetchall()
+        summary = dict(rebuild_summary(json.loads(r["data"]) for r in rows), updatedAt=_now_iso())
+        self._conn.execute(
+            "INSERT OR REPLACE INTO user_summaries (user_id, data) VALUES (?, ?)", (user_id, _dumps(summary))
+        )
+        return summary
+
+    @traced("sqlite")
+    def add_trade(self, trade_doc: Dict) -> str:
+        trade_id = uuid.uuid4().hex
+        doc = dict(trade_doc, createdAt=_now_iso())
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO trades (trade_id, user_id, status, pending_open, pending_open_date, data) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                self._trade_row(trade_id, doc)
+            )
+            self._increment_summary(doc.get("userId"), summary_delta(None, doc))
+        return trade_id
+
+    @traced("sqlite")
+    def get_trade(self, trade_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM trades WHERE trade_id = ?", (trade_id,)).fetchone()
+        if row is None:
+            return None
+        return dict(json.loads(row["data"]), trade_id=trade_id)
+
+    def _apply_update(self, trade_id: str, fields: Dict) -> Dict:
+        row = self._conn.execute("SELECT data FROM trades WHERE trade_id = ?", (trade_id,)).fetchone()
+        if row is None:
+            raise ValueError("Trade not found.")
+        doc = json.loads(row["data"])
+        doc.update(fields)
+        self._conn.execute(
+            "UPDATE trades SET user_id = ?, status = ?, pending_open = ?, pending_open_date = ?, data = ? "
+            "WHERE trade_id = ?",
+            self._trade_row(trade_id, doc)[1:] + (trade_id,)
+        )
+        return doc
+
+    @traced("sqlite")
+    def update_trade(self, trade_id: str, fields: Dict):
+        with self._lock, self._conn:
+            self._apply_update(trade_id, fields)
+
+    @traced("sqlite")
+    def transition_trade(self, trade_id: str, fn) -> Optional[Dict]:
+        with self._lock, self._conn:
+            # BEGIN IMMEDIATE so another process can't change the trade between read and write
+            self._conn.execute("BEGIN IMMEDIATE")
+            row = self._conn.execute("SELECT data FROM trades WHERE trade_id = ?", (trade_id,)).fetchone()
+            if row is None:
+                raise ValueError("Trade not found.")
+            before = json.loads(row["data"])
+            fields = fn(dict(before))
+            if not fields:
+                return None
+            after = self._apply_update(trade_id, fields)
+            self._increment_summary(before.get("userId"), summary_delta(before, after))
+        return dict(after, trade_id=trade_id)
+
+    @traced("sqlite")
+    def transition_trades(self, updates: Dict[str, Dict], expected_status: str) -> List[Dict]:
+        applied = []
+        deltas = {}
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            for trade_id, fields in updates.items():
+                row = self._conn.execute(
+                    "SELECT data FROM trades WHERE trade_id = ? AND status = ?", (trade_id, expected_status)
+                ).fetchone()
+                if row is None:
+                    continue
+                before = json.loads(row["data"])
+                after = self._apply_update(trade_id, fields)
+                add_deltas(deltas.setdefault(before.get("userId"), {}), summary_delta(before, after))
+                applied.append(dict(after, trade_id=trade_id))
+            for user_id, delta in deltas.items():
+                self._increment_summary(user_id, delta)
+        return applied
+
+    @traced("sqlite")
+    def commit_trade_updates(
+        self,
+        updates: Dict[str, Dict],
+        summary_deltas: Optional[Dict[str, Dict]] = None
+    ) -> int:
+        # One transaction for the whole set
+        with self._lock, self._conn:
+            for trade_id, fields in updates.items():
+                self._apply_update(trade_id, fields)
+            for user_id, delta in (summary_deltas or {}).items():
+                self._increment_summary(user_id, delta)
+        return len(updates)
+
+    @traced("sqlite")
+    def query_trades(
+        self,
+        user_id: Optional[str] = None,
+        status: Optional[str] = None,
+        pending_open: Optional[bool] = None,
+        due_by: Optional[str] = None
+    ) -> List[Dict]:
+        clauses = []
+        params = []
+        if user_id is not None:
+            clauses.append("user_id = ?")
+            params.append(user_id)
+        if status is not None:
+            clauses.append("status = ?")
+            params.append(status)
+        if pending_open is not None:
+            clauses.append("pending_open = ?")
+            params.append(int(pending_open))
+        if due_by is not None:
+            clauses.append("pending_open_date <= ?")
+            params.append(due_by)
+        sql = "SELECT trade_id, data FROM trades"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [dict(json.loads(row["data"]), trade_id=row["trade_id"]) for row in rows]
+
+    @staticmethod
+    def _filter_sql(user_id, status, date_field, start_date, end_date, ticker):
+        if date_field not in _DATE_FIELDS:
+            raise ValueError(f"Unsupported date field: {date_field}")
+        # Spelled exactly as in the index so SQLite can use it
+        date_expr = f"json_extract(data, '$.{date_field}')"
+        clauses = ["user_id = ?", "status = ?"]
+        params = [user_id, status]
+        if ticker:
+            clauses.append("json_extract(data, '$.ticker') = ?")
+            params.append(ticker)
+        if start_date:
+            clauses.append(f"{date_expr} >= ?")
+            params.append(start_date)
+        if end_date:
+            clauses.append(f"{date_expr} <= ?")
+            params.append(end_date)
+        return date_expr, clauses, params
+
+    @traced("sqlite")
+    def query_trades_page(
+        self,
+        user_id: str,
+        status: str,
+        date_field: str,
+        page_size: int,
+        start_after: Optional[Tuple] = None,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        ticker: Optional[str] = None
+    ) -> Tuple[List[Dict], Optional[Tuple]]:
+        date_expr, clauses, params = self._filter_sql(user_id, status, date_field, start_date, end_date, ticker)
+        if start_after is not None:
+            last_date, last_id = start_after
+            clauses.append(f"({date_expr}, trade_id) < (?, ?)")
+            params.extend([last_date, last_id])
+        sql = (
+            f"SELECT trade_id, data FROM trades WHERE {' AND '.join(clauses)} "
+            f"ORDER BY {date_expr} DESC, trade_id DESC LIMIT ?"
+        )
+        params.append(page_size + 1)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        results = [dict(json.loads(row["data"]), trade_id=row["trade_id"]) for row in rows[:page_size]]
+        next_cursor = None
+        if len(rows) > page_size:
+            next_cursor = (results[-1].get(date_field), results[-1]["trade_id"])
+        return results, next_cursor
+
+    @traced("sqlite")
+    def aggregate_trades(
+        self,
+        user_id: str,
+        status: str,
+        date_field: str,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        ticker: Optional[str] = None
+    ) -> Dict:
+        _, clauses, params = self._filter_sql(user_id, status, date_field, start_date, end_date, ticker)
+        sql = (
+            "SELECT COUNT(*) AS count, "
+            "TOTAL(json_extract(data, '$.pnl_usd')) AS pnl_usd, "
+            "AVG(json_extract(data, '$.return_pct')) AS avg_return_pct "
+            f"FROM trades WHERE {' AND '.join(clauses)}"
+        )
+        with self._lock:
+            row = self._conn.execute(sql, params).fetchone()
+        return {"count": row["count"], "pnl_usd": row["pnl_usd"], "avg_return_pct": row["avg_return_pct"]}
+
+    #######################################################
+    # User summaries
+    #######################################################
+    @traced("sqlite")
+    def get_summary(self, user_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM user_summaries WHERE user_id = ?", (user_id,)).fetchone()
+        return json.loads(row["data"]) if row else None
+
+    @traced("sqlite")
+    def put_summary(self, user_id: str, summary: Dict):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO user_summaries (user_id, data) VALUES (?, ?)",
+                (user_id, _dumps(dict(summary, updatedAt=_now_iso())))
+            )
+
+    @traced("sqlite")
+    def ensure_summary(self, user_id: str) -> Dict:
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            row = self._conn.execute("SELECT data FROM user_summaries WHERE user_id = ?", (user_id,)).fetchone()
+            return json.loads(row["data"]) if row else self._build_summary(user_id)
+
+    #######################################################
+    # OAuth state
+    #######################################################
+    @traced("sqlite")
+    def put_oauth_state(self, state: str, state_doc: Dict):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO oauth_states (state, data) VALUES (?, ?)",
+                (state, _dumps(dict(state_doc, createdAt=_now_iso())))
+            )
+
+    @traced("sqlite")
+    def pop_oauth_state(self, state: str) -> Optional[Dict]:
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT data FROM oauth_states WHERE state = ?", (state,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("DELETE FROM oauth_states WHERE state = ?", (state,))
+        return json.loads(row["data"])
+
+    @traced("sqlite")
+    def purge_oauth_states(self, created_before: datetime.datetime) -> int:
+        # createdAt is stored as _now_iso(), so ISO strings compare in time order
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "DELETE FROM oauth_states WHERE json_extract(data, '$.createdAt') < ?",
+                (created_before.astimezone(datetime.timezone.utc).isoformat(),)
+            )
+        return cursor.rowcount
+
+    #######################################################
+    # Worker locks
+    #######################################################
+    @traced("sqlite")
+    def acquire_lock(self, name: str, owner: str, ttl_seconds: int) -> bool:
+        now = time.time()
+        with self._lock, self._conn:
+            # BEGIN IMMEDIATE so two processes sharing the file can't both win
+            self._conn.execute("BEGIN IMMEDIATE")
+            row = self._conn.execute(
+                "SELECT owner, expires_at FROM worker_locks WHERE name = ?", (name,)
+            ).fetchone()
+            if row and row["owner"] != owner and row["expires_at"] > now:
+                return False
+            self._conn.execute(
+                "INSERT OR REPLACE INTO worker_locks (name, owner, expires_at) VALUES (?, ?, ?)",
+                (name, owner, now + ttl_seconds)
+            )
+            return True
+
+    @traced("sqlite")
+    def release_lock(self, name: str, owner: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM worker_locks WHERE name = ? AND owner = ?", (name, owner))
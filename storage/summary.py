@@ -0,0 +1,86 @@
+"""
+Per-user portfolio summary, maintained incrementally next to the trades.
+
+Every trade contributes a few numbers (counts by status, realized PnL, wins and
+losses, open cost basis).  Writes apply contribution(after) - contribution(before)
+to the user's summary in the same transaction or batch as the trade itself, so
+the dashboard header is one document read no matter how long the history is.
+rebuild_summary() recomputes it from scratch for repair.
+"""
+from typing import Dict, Iterable, Optional
+
+SUMMARY_FIELDS = (
+    "open_count",
+    "scheduled_count",
+    "closed_count",
+    "realized_pnl_usd",
+    "win_count",
+    "loss_count",
+    "open_long_cost_usd",   # entry price x shares of open long positions
+    "open_short_cost_usd",  # same for open shorts
+)
+
+
+def trade_contribution(trade: Optional[Dict]) -> Dict[str, float]:
+    if not trade:
+        return {}
+    status = trade.get("status")
+    out = {}
+    if status in ("open", "scheduled", "closed"):
+        out[f"{status}_count"] = 1
+    if status == "open":
+        cost = (trade.get("entryPrice") or 0) * (trade.get("numShares") or 0)
+        out["open_short_cost_usd" if trade.get("positionType") == "short" else "open_long_cost_usd"] = cost
+    elif status == "closed":
+        pnl = trade.get("pnl_usd") or 0
+        out["realized_pnl_usd"] = pnl
+        if pnl > 0:
+            out["win_count"] = 1
+        elif pnl < 0:
+            out["loss_count"] = 1
+    return out
+
+
+def summary_delta(before: Optional[Dict], after: Optional[Dict]) -> Dict[str, float]:
+    """
+    The change a write from `before` to `after` makes to its user's summary;
+    only non-zero fields are returned.
+    """
+    old = trade_contribution(before)
+    new = trade_contribution(after)
+    delta = {}
+    for field in SUMMARY_FIELDS:
+        change = new.get(field, 0) - old.get(field, 0)
+        if change:
+            delta[field] = change
+    return delta
+
+
+def add_deltas(total: Dict[str, float], delta: Dict[str, float]) -> Dict[str, float]:
+    for field, change in delta.items():
+        total[field] = total.get(field, 0) + change
+    return total
+
+
+def rebuild_summary(trades: Iterable[Dict]) -> Dict[str, float]:
+    summary = {field: 0 for field in SUMMARY_FIELDS}
+    for trade in trades:
+        add_deltas(summary, trade_contribution(trade))
+    return summary
+
+
+def with_derived_fields(summary: Dict) -> Dict:
+    """
+    Adds the fields computed on read (win rate, open exposure), rounding sums
+    accumulated by floating-point increments.
+    """
+    out = {field: summary.get(field, 0) for field in SUMMARY_FIELDS}
+    for field in ("realized_pnl_usd", "open_long_cost_usd", "open_short_cost_usd"):
+        out[field] = round(out[field], 2)
+    decided = out["win_count"] + out["loss_count"]
+    out["win_rate_pct"] = round(out["win_count"] / decided * 100, 2) if decided else None
+    out["open_gross_cost_usd"] = round(out["open_long_cost_usd"] + out["open_short_cost_usd"], 2)
+    out["open_net_cost_usd"] = round(out["open_long_cost_usd"] - out["open_short_cost_usd"], 2)
+    if "updatedAt" in summary:
+        out["updatedAt"] = summary["updatedAt"]
+    return out
@@ -0,0 +1,194 @@
+"""
+Lightweight tracing for external calls (Firestore, yfinance, OpenAI, Google OAuth).
+
+Every call wrapped in `span(system, operation)` is recorded twice:
+  - in the current rerun's span list, for the developer panel in the app
+  - in process-wide counters / latency histograms, exported in Prometheus text
+    format on METRICS_PORT (http://127.0.0.1:<port>/metrics) and/or to METRICS_FILE
+"""
+import contextvars
+import functools
+import http.server
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Spans of the current rerun (or worker cycle); None when nobody is collecting
+_rerun_spans: contextvars.ContextVar[Optional[List[Dict]]] = contextvars.ContextVar("rerun_spans", default=None)
+
+
+class _Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls: Dict[tuple, int] = {}          # (system, operation, outcome) -> count
+        self.buckets: Dict[tuple, List[int]] = {}  # (system, operation) -> cumulative bucket counts
+        self.sums: Dict[tuple, float] = {}
+        self.counts: Dict[tuple, int] = {}
+
+    def observe(self, system: str, operation: str, outcome: str, seconds: float):
+        key = (system, operation)
+        with self._lock:
+            self.calls[key + (outcome,)] = self.calls.get(key + (outcome,), 0) + 1
+            bucket_counts = self.buckets.setdefault(key, [0] * len(LATENCY_BUCKETS))
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    bucket_counts[i] += 1
+            self.sums[key] = self.sums.get(key, 0.0) + seconds
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def render(self) -> str:
+        lines = [
+            "# HELP lmtrading_external_calls_total External calls by system, operation and outcome.",
+            "# TYPE lmtrading_external_calls_total counter",
+        ]
+        with self._lock:
+            for (system, operation, outcome), count in sorted(self.calls.items()):
+                lines.append(
+                    f'lmtrading_external_calls_total{{system="{system}",operation="{operation}",'
+                    f'outcome="{outcome}"}} {count}'
+                )
+            lines += [
+                "# HELP lmtrading_external_call_seconds Latency of external calls.",
+                "# TYPE lmtrading_external_call_seconds histogram",
+            ]
+            for (system, operation), bucket_counts in sorted(self.buckets.items()):
+                labels = f'system="{system}",operation="{operation}"'
+                for bound, count in zip(LATENCY_BUCKETS, bucket_counts):
+                    lines.append(f'lmtrading_external_call_seconds_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(
+                    f'lmtrading_external_call_seconds_bucket{{{labels},le="+Inf"}} {self.counts[(system, operation)]}'
+                )
+                lines.append(f"lmtrading_external_call_seconds_sum{{{labels}}} {self.sums[(system, operation)]:.6f}")
+                lines.append(f"lmtrading_external_call_seconds_count{{{labels}}} {self.counts[(system, operation)]}")
+        return "\n".join(lines) + "\n"
+
+
+_metrics = _Metrics()
+
+
+#######################################################
+# Recording
+#######################################################
+@contextmanager
+def span(system: str, operation: str):
+    """
+    Times the enclosed block as one external call.
+    """
+    started = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        _metrics.observe(system, operation, outcome, seconds)
+        spans = _rerun_spans.get()
+        if spans is not None:
+            spans.append({"system": system, "operation": operation, "outcome": outcome, "seconds": seconds})
+
+def traced(system: str, operation: Optional[str] = None):
+    """
+    Decorator form of span(); the operation defaults to the function name.
+    """
+    def decorator(fn):
+        op_name = operation or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(system, op_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def start_rerun() -> List[Dict]:
+    """
+    Starts collecting spans for the current rerun (or worker cycle) in this context.
+    Threads started with contextvars.copy_context() report into the same list.
+    """
+    spans: List[Dict] = []
+    _rerun_spans.set(spans)
+    return spans
+
+def rerun_summary() -> List[Dict]:
+    """
+    The current rerun's spans grouped per (system, operation), slowest first.
+    """
+    grouped: Dict[tuple, Dict] = {}
+    for s in list(_rerun_spans.get() or []):
+        row = grouped.setdefault((s["system"], s["operation"]), {
+            "system": s["system"], "operation": s["operation"], "calls": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0
+        })
+        row["calls"] += 1
+        row["errors"] += s["outcome"] == "error"
+        row["total_ms"] += s["seconds"] * 1000
+        row["max_ms"] = max(row["max_ms"], s["seconds"] * 1000)
+    return sorted(grouped.values(), key=lambda r: r["total_ms"], reverse=True)
+
+
+#######################################################
+# Export
+#######################################################
+def render_metrics() -> str:
+    """
+    Process-wide counters and histograms in Prometheus text exposition format.
+    """
+    return _metrics.render()
+
+def write_metrics_file(path: Optional[str] = None):
+    """
+    Atomically rewrites METRICS_FILE (or `path`), e.g. for a node-exporter textfile collector.
+    """
+    path = path or os.getenv("METRICS_FILE")
+    if not path:
+        return
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(render_metrics())
+    os.replace(tmp_path, path)
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_metrics().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server_lock = threading.Lock()
+_server = None
+
+def start_metrics_server(port: Optional[int] = None) -> bool:
+    """
+    Serves /metrics on 127.0.0.1:METRICS_PORT from a daemon thread. Safe to call on
+    every rerun; only the first call starts the server. Returns True if serving.
+    """
+    global _server
+    port = port or int(os.getenv("METRICS_PORT", "0") or 0)
+    if not port:
+        return False
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = http.server.ThreadingHTTPServer(("127.0.0.1", port), _MetricsHandler)
+            except OSError as e:
+                # e.g. another process on the same box already serves this port; don't retry
+                print(f"[DEBUG tracing] metrics server not started: {e}")
+                _server = False
+                return False
+            threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
+    return bool(_server)
@@ -0,0 +1,207 @@
+"""
+Columnar trades and the PnL kernel shared by closes, mark-to-market and the UI.
+
+A TradeFrame holds one NumPy array per field instead of one dict per trade:
+numbers are float64 (NaN where the stored value is missing), everything else
+is an object array.  Documents are decoded straight into the columns, PnL is
+computed for all rows by pnl_kernel(), and tables are built column-wise.
+Trade is a __slots__ record for code that wants a single row.
+
+Values written back are rounded with Python's round(), exactly like the
+scalar code this replaced, so stored numbers don't change.
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# (column, stored field, numeric); trade_id is the document ID, not a field
+COLUMNS = (
+    ("trade_id", None, False),
+    ("user_id", "userId", False),
+    ("ticker", "ticker", False),
+    ("position_type", "positionType", False),
+    ("num_shares", "numShares", True),
+    ("entry_date", "entryDate", False),
+    ("entry_price", "entryPrice", True),
+    ("status", "status", False),
+    ("pending_open_date", "pending_open_date", False),
+    ("close_date", "closeDate", False),
+    ("close_price", "closePrice", True),
+    ("pnl_usd", "pnl_usd", True),
+    ("return_pct", "return_pct", True),
+    ("unrealized_pnl_usd", "unrealized_pnl_usd", True),
+    ("unrealized_return_pct", "unrealized_return_pct", True),
+    ("mark_price", "mark_price", True),
+    ("mark_status", "mark_status", False),
+    ("mark_as_of", "mark_as_of", False),
+    ("opened_by_user", "opened_by_user", False),
+    ("opened_by_model", "opened_by_model", False),
+)
+COLUMN_NAMES = tuple(name for name, _, _ in COLUMNS)
+# Numeric columns that hold counts; shown as integers when every value is whole
+INTEGER_COLUMNS = ("num_shares",)
+
+
+def pnl_kernel(sign, shares, entry_price, price) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (PnL in USD, return %) of positions valued at `price` - the close price for
+    realized PnL, the mark for unrealized. sign is +1 long / -1 short. Return is
+    0 where the cost basis isn't positive. Works elementwise on arrays or scalars.
+    """
+    sign, shares, entry_price, price = (np.asarray(a, dtype="float64") for a in (sign, shares, entry_price, price))
+    pnl = sign * (price - entry_price) * shares
+    valid = (entry_price > 0) & (shares > 0)
+    return_pct = np.where(valid, pnl / np.where(valid, entry_price * shares, 1.0) * 100, 0.0)
+    return pnl, return_pct
+
+
+def rounded(values, digits: int = 2) -> List[float]:
+    return [round(v, digits) for v in np.asarray(values, dtype="float64").tolist()]
+
+
+def _number(value) -> float:
+    return np.nan if value is None else float(value)
+
+
+class Trade:
+    """
+    One trade, with the TradeFrame column names as attributes.
+    """
+    __slots__ = COLUMN_NAMES
+
+    def __init__(self, **values):
+        for name in COLUMN_NAMES:
+            setattr(self, name, values.get(name))
+
+    @property
+    def sign(self) -> float:
+        return 1.0 if self.position_type == "long" else -1.0
+
+    def __repr__(self):
+        return f"Trade({self.trade_id!r}, {self.ticker!r}, {self.position_type!r}, {self.status!r})"
+
+
+class TradeFrame:
+    """
+    Trades as aligned column arrays, e.g. frame.entry_price[i] belongs to frame.trade_id[i].
+    """
+    def __init__(self, columns: Dict[str, np.ndarray]):
+        self.columns = columns
+
+    @classmethod
+    def from_records(cls, records: Iterable[Tuple[str, Dict]]) -> "TradeFrame":
+        """
+        Builds the columns from (trade_id, stored document) pairs in one pass.
+        """
+        values = {name: [] for name in COLUMN_NAMES}
+        fields = [(values[name], field, numeric) for name, field, numeric in COLUMNS if field]
+        trade_ids = values["trade_id"]
+        for trade_id, doc in records:
+            trade_ids.append(trade_id)
+            for column, field, numeric in fields:
+                value = doc.get(field)
+                column.append(_number(value) if numeric else value)
+        columns = {}
+        for name, _, numeric in COLUMNS:
+            if numeric:
+                columns[name] = np.array(values[name], dtype="float64")
+            else:
+                column = np.empty(len(values[name]), dtype=object)
+                column[:] = values[name]
+                columns[name] = column
+        return cls(columns)
+
+    @classmethod
+    def from_docs(cls, docs: Iterable[Dict]) -> "TradeFrame":
+        """
+        From trade dicts as returned by the storage backends (with "trade_id").
+        """
+        return cls.from_records((doc["trade_id"], doc) for doc in docs)
+
+    def __len__(self):
+        return len(self.columns["trade_id"])
+
+    def __getattr__(self, name):
+        columns = self.__dict__.get("columns")
+        if columns is not None and name in columns:
+            return columns[name]
+        raise AttributeError(name)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.row(i)
+
+    def row(self, i: int) -> Trade:
+        values = {}
+        for name, _, numeric in COLUMNS:
+            value = self.columns[name][i]
+            values[name] = None if numeric and np.isnan(value) else value
+        return Trade(**values)
+
+    def index_of(self, trade_id: str) -> Optional[int]:
+        matches = np.flatnonzero(self.columns["trade_id"] == trade_id)
+        return int(matches[0]) if len(matches) else None
+
+    def filter(self, mask) -> "TradeFrame":
+        return TradeFrame({name: column[mask] for name, column in self.columns.items()})
+
+    @property
+    def sign(self) -> np.ndarray:
+        return np.where(self.columns["position_type"] == "long", 1.0, -1.0)
+
+    def by_ticker(self, values: Dict[str, object], numeric: bool = True) -> np.ndarray:
+        """
+        Each row's entry of a {ticker: value} mapping (e.g. prices), looked up once
+        per distinct ticker; NaN (or None if not numeric) where a ticker has none.
+        """
+        tickers, inverse = np.unique(self.columns["ticker"].astype(str), return_inverse=True)
+        if numeric:
+            per_ticker = np.array([_number(values.get(t)) for t in tickers.tolist()], dtype="float64")
+        else:
+            per_ticker = np.empty(len(tickers), dtype=object)
+            per_ticker[:] = [values.get(t) for t in tickers.tolist()]
+        return per_ticker[inverse.reshape(-1)]
+
+    def pnl_at(self, price) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        pnl_kernel for every row at `price` (one value per row, or a scalar).
+        """
+        return pnl_kernel(self.sign, self.columns["num_shares"], self.columns["entry_price"], price)
+
+    def to_pandas(self, labels: Dict[str, str]):
+        """
+        DataFrame of the given {column: label} columns, numbered from 1 like the app's tables.
+        Numeric columns stay float64 (missing values are NaN and show blank), except
+        INTEGER_COLUMNS, which are int64 when every value is whole.
+        """
+        import pandas as pd
+        data = {}
+        for name, label in labels.items():
+            column = self.columns[name]
+            if name in INTEGER_COLUMNS and len(column) and np.all(np.mod(column, 1) == 0):
+                column = column.astype("int64")
+            data[label] = column
+        df = pd.DataFrame(data)
+        df.index += 1
+        df.index.name = "Index"
+        return df
+
+
+def close_updates(frame: TradeFrame, close_prices, close_date: str) -> Dict[str, Dict]:
+    """
+    {trade_id: fields} closing every row of frame at close_prices (per row or scalar).
+    """
+    close_prices = np.broadcast_to(np.asarray(close_prices, dtype="float64"), (len(frame),))
+    pnl, return_pct = frame.pnl_at(close_prices)
+    return {
+        trade_id: {
+            "closeDate": close_date,
+            "closePrice": close_p,
+            "pnl_usd": pnl_usd,
+            "return_pct": ret,
+            "status": "closed"
+        }
+        for trade_id, close_p, pnl_usd, ret in zip(
+            frame.trade_id.tolist(), rounded(close_prices), rounded(pnl), rounded(return_pct)
+        )
+    }
@@ -0,0 +1,106 @@
+"""
+Background worker that keeps trade data fresh outside of the Streamlit request path.
+
+Each cycle it:
+  1) opens any scheduled trades whose date has arrived
+  2) recomputes unrealized PnL for all open trades
+  3) deletes OAuth states from logins that were never completed
+
+A Firestore lease ('worker_locks/mark_to_market') makes sure only one worker
+instance runs the jobs at a time; other instances just wait for the lease.
+
+Set METRICS_PORT and/or METRICS_FILE to export call counts and latencies
+(see tracing.py).
+
+Usage:
+    python -m worker                 # loop forever, every WORKER_INTERVAL_SECONDS
+    python -m worker --interval 30   # override the interval
+    python -m worker --once          # run a single cycle and exit
+    python -m worker --rebuild-summaries [--user-id ID]   # repair per-user summaries and exit
+"""
+import argparse
+import os
+import socket
+import time
+import uuid
+from dotenv import load_dotenv
+
+from tracing import start_rerun, rerun_summary, start_metrics_server, write_metrics_file
+
+from firestore_database import (
+    auto_open_scheduled_trades,
+    update_unrealized_pnl,
+    rebuild_user_summaries,
+    acquire_worker_lock,
+    release_worker_lock
+)
+from auth_state_db import purge_expired_oauth_states
+
+load_dotenv()
+DEFAULT_INTERVAL_SECONDS = int(os.getenv("WORKER_INTERVAL_SECONDS", "60"))
+LOCK_NAME = "mark_to_market"
+
+
+def run_cycle():
+    """
+    Runs every job once and returns
+    (users with newly opened trades, pnl_updates, purged OAuth states).
+    """
+    opened_users = auto_open_scheduled_trades()
+    pnl_updates = update_unrealized_pnl()
+    purged_states = purge_expired_oauth_states()
+    return opened_users, pnl_updates, purged_states
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LMTrading background worker")
+    parser.add_argument("--interval", type=int, default=DEFAULT_INTERVAL_SECONDS,
+                        help="seconds between cycles")
+    parser.add_argument("--once", action="store_true", help="run a single cycle and exit")
+    parser.add_argument("--rebuild-summaries", action="store_true",
+                        help="recompute users' portfolio summaries from their trades and exit")
+    parser.add_argument("--user-id", help="with --rebuild-summaries: only this user")
+    args = parser.parse_args()
+
+    if args.rebuild_summaries:
+        summaries = rebuild_user_summaries(args.user_id)
+        print(f"[worker] rebuilt {len(summaries)} user summaries")
+        return
+
+    owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    # The lease outlives one interval so a slow cycle doesn't let a second worker in,
+    # but a crashed worker's lease still expires quickly.
+    lock_ttl = max(args.interval * 3, 60)
+    start_metrics_server()
+
+    try:
+        while True:
+            started = time.time()
+            start_rerun()
+            if acquire_worker_lock(LOCK_NAME, owner, lock_ttl):
+                try:
+                    opened_users, pnl_updates, purged_states = run_cycle()
+                    print(f"[worker] cycle done in {time.time() - started:.2f}s "
+                          f"(opened scheduled trades for {len(opened_users)} users, PnL updates: {pnl_updates}, "
+                          f"expired OAuth states purged: {purged_states})")
+                except Exception as e:
+                    # Keep the loop alive; the next cycle will retry
+                    print(f"[worker] cycle failed: {e}")
+            else:
+                print("[worker] another instance holds the lock, skipping cycle")
+            for row in rerun_summary():
+                print(f"[worker]   {row['system']}.{row['operation']}: {row['calls']} calls, "
+                      f"{row['errors']} errors, {row['total_ms']:.0f} ms")
+            write_metrics_file()
+
+            if args.once:
+                break
+            time.sleep(max(0.0, args.interval - (time.time() - started)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        release_worker_lock(LOCK_NAME, owner)
+
+
+if __name__ == "__main__":
+    main()